@@ -0,0 +1,302 @@
+// Tests and benchmarks the lib's untyped and slot allocator against the simulated kernel in mock_syscalls.c, which checks
+// every retype the way the kernel would: the destination slots have to be empty and the untyped has to have room left.
+// Each part is checked against a simple model of what the allocator should do, and the time spent in the allocator is
+// printed:
+// - bin selection: objects of random sizes and counts are retyped out of untypeds of random sizes. Each retype has to come
+//   out of an untyped in the smallest bin that is guaranteed to fit it, and fail only if there is no such untyped
+// - batch retype: the same number of frames is retyped one at a time and then in batches of the retype fan out limit
+// - slot allocation: slots and runs of slots are allocated and freed at random. Each has to be the lowest free one
+// The exit code is nonzero if any check failed. The mock is much cheaper than real syscalls, so the times mostly show the
+// allocator's own bookkeeping.
+// Usage: alloc_bench [iterations]
+
+#include <stdarg.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#include <tailspring_alloc.h>
+
+#include "mock_syscalls.h"
+
+#define VSPACE_SLOT 1
+#define CNODE_SLOT 2
+#define GP_UNTYPEDS_START 16
+#define FREE_SLOTS_START 1024
+#define CSPACE_SIZE_BITS 16
+
+#define NUM_BIN_UNTYPEDS 64
+#define NUM_BATCH_FRAMES (1UL << 16)
+// Only the first few failed checks are printed
+#define MAX_PRINTED_FAILURES 10
+
+static TailspringMemoryInfo gp_memory_info;
+static TailspringAllocator alloc;
+static seL4_Word num_failed_checks = 0;
+
+static seL4_Word random_state = 0x2545f4914f6cdd1dUL;
+
+static seL4_Word next_random(void) {
+    random_state ^= random_state << 13;
+    random_state ^= random_state >> 7;
+    random_state ^= random_state << 17;
+    return random_state;
+}
+
+static double now_ms(void) {
+    struct timespec time;
+    clock_gettime(CLOCK_MONOTONIC, &time);
+    return time.tv_sec * 1e3 + time.tv_nsec / 1e6;
+}
+
+static seL4_Word floor_log2(seL4_Word value) {
+    seL4_Word result = 0;
+    while (value >>= 1) result++;
+    return result;
+}
+
+static seL4_Word ceil_log2(seL4_Word value) {
+    return (value <= 1) ? 0 : floor_log2(value - 1) + 1;
+}
+
+static void check(bool condition, const char* format, ...) {
+    if (condition) return;
+    if (num_failed_checks++ >= MAX_PRINTED_FAILURES) return;
+    va_list args;
+    va_start(args, format);
+    fprintf(stderr, "bench: check failed: ");
+    vfprintf(stderr, format, args);
+    fprintf(stderr, "\n");
+    va_end(args);
+}
+
+// Gives the allocator untypeds of the given sizes and the slots [FREE_SLOTS_START, FREE_SLOTS_START + TAILSPRING_ALLOC_MAX_SLOTS)
+static void set_up(const seL4_Word* size_bits, seL4_Word num_untypeds) {
+    mock_reset(CNODE_SLOT, VSPACE_SLOT);
+    gp_memory_info.num_entries = num_untypeds;
+    for (seL4_Word i = 0; i < num_untypeds; i++) {
+        gp_memory_info.entries[i].size_bits = size_bits[i];
+        gp_memory_info.entries[i].paddr = 0;
+        mock_add_untyped(GP_UNTYPEDS_START + i, size_bits[i]);
+    }
+
+    TailspringHandoff handoff = {0};
+    handoff.magic = TAILSPRING_HANDOFF_MAGIC;
+    handoff.version = TAILSPRING_HANDOFF_VERSION;
+    handoff.size = sizeof(handoff);
+    handoff.gp_memory_info = (seL4_Word)&gp_memory_info;
+    handoff.cspace_size_bits = CSPACE_SIZE_BITS;
+    handoff.cspace_guard_bits = seL4_WordBits - CSPACE_SIZE_BITS;
+    handoff.gp_untypeds_start = GP_UNTYPEDS_START;
+    handoff.gp_untypeds_end = GP_UNTYPEDS_START + num_untypeds;
+    handoff.cspace_slot = CNODE_SLOT;
+    handoff.vspace_slot = VSPACE_SLOT;
+    handoff.free_slots_start = FREE_SLOTS_START;
+    handoff.free_slots_end = FREE_SLOTS_START + TAILSPRING_ALLOC_MAX_SLOTS;
+
+    if (!tailspring_alloc_init_from_handoff(&alloc, &handoff)) {
+        fprintf(stderr, "bench: couldn't set up the allocator\n");
+        exit(EXIT_FAILURE);
+    }
+}
+
+// Deletes the caps in the slots, so the mock lets them be retyped into again, and gives the slots back
+static void free_slots(seL4_CPtr first_slot, seL4_Word count) {
+    for (seL4_Word i = 0; i < count; i++) {
+        seL4_CNode_Delete(CNODE_SLOT, first_slot + i, seL4_WordBits);
+        tailspring_free_slot(&alloc, first_slot + i);
+    }
+}
+
+static seL4_Word bytes_free(seL4_Word index) {
+    return (1UL << alloc.untypeds[index].size_bits) - alloc.untypeds[index].watermark;
+}
+
+static void set_up_random_untypeds(void) {
+    seL4_Word size_bits[NUM_BIN_UNTYPEDS];
+    for (seL4_Word i = 0; i < NUM_BIN_UNTYPEDS; i++) {
+        size_bits[i] = seL4_PageBits + next_random() % 15;
+    }
+    set_up(size_bits, NUM_BIN_UNTYPEDS);
+}
+
+static void test_bin_selection(seL4_Word iterations) {
+    set_up_random_untypeds();
+
+    double elapsed_ms = 0;
+    seL4_Word num_objects = 0;
+    seL4_Word num_refills = 0;
+    seL4_Word num_retype_failures = 0;
+    for (seL4_Word iteration = 0; iteration < iterations; iteration++) {
+        bool large = next_random() % 4 == 0;
+        seL4_Word type = large ? seL4_X86_LargePageObject : seL4_X86_4K;
+        seL4_Word object_size_bits = large ? seL4_LargePageBits : seL4_PageBits;
+        seL4_Word count = 1 + next_random() % 16;
+        seL4_Word needed_bits = object_size_bits + ceil_log2(count);
+
+        // The model: the objects go in an untyped from the smallest bin at or above needed_bits that isn't empty
+        seL4_Word watermarks[NUM_BIN_UNTYPEDS];
+        seL4_Word expected_bin = seL4_WordBits;
+        for (seL4_Word i = 0; i < NUM_BIN_UNTYPEDS; i++) {
+            watermarks[i] = alloc.untypeds[i].watermark;
+            if (bytes_free(i) == 0) continue;
+            seL4_Word bin = floor_log2(bytes_free(i));
+            if (bin >= needed_bits && bin < expected_bin) expected_bin = bin;
+        }
+
+        seL4_CPtr first_slot;
+        double start_ms = now_ms();
+        seL4_Error error = tailspring_alloc_objects(&alloc, type, 0, object_size_bits, count, &first_slot);
+        elapsed_ms += now_ms() - start_ms;
+
+        if (expected_bin == seL4_WordBits) {
+            check(error == seL4_NotEnoughMemory, "retype of %lu 2^%lu byte objects returned %d with no untyped to fit them",
+                  count, object_size_bits, error);
+            // Start over once the untypeds are too full to fit this, so that most retypes have somewhere to go
+            num_retype_failures += mock_counts.failures[MOCK_UNTYPED_RETYPE];
+            num_refills++;
+            set_up_random_untypeds();
+            continue;
+        }
+        check(error == seL4_NoError, "retype of %lu 2^%lu byte objects failed with %d", count, object_size_bits, error);
+        if (error != seL4_NoError) continue;
+        num_objects += count;
+
+        seL4_Word num_changed = 0;
+        seL4_Word bin = 0;
+        for (seL4_Word i = 0; i < NUM_BIN_UNTYPEDS; i++) {
+            if (alloc.untypeds[i].watermark == watermarks[i]) continue;
+            num_changed++;
+            bin = floor_log2((1UL << alloc.untypeds[i].size_bits) - watermarks[i]);
+        }
+        check(num_changed == 1 && bin == expected_bin, "retype of %lu 2^%lu byte objects went to bin %lu instead of %lu",
+              count, object_size_bits, bin, expected_bin);
+        free_slots(first_slot, count);
+    }
+    num_retype_failures += mock_counts.failures[MOCK_UNTYPED_RETYPE];
+    check(num_retype_failures == 0, "%lu retypes failed in the mock", num_retype_failures);
+
+    printf("bench: bin selection: %.3f ms for %lu retypes, %lu objects, %lu sets of untypeds used up\n", elapsed_ms,
+           iterations, num_objects, num_refills);
+}
+
+static void test_batch_retype(void) {
+    seL4_Word batch_sizes[] = {1, CONFIG_RETYPE_FAN_OUT_LIMIT};
+    for (seL4_Word i = 0; i < sizeof(batch_sizes) / sizeof(batch_sizes[0]); i++) {
+        seL4_Word batch_size = batch_sizes[i];
+        // One untyped with room for every frame
+        seL4_Word size_bits = ceil_log2(NUM_BATCH_FRAMES) + seL4_PageBits;
+        set_up(&size_bits, 1);
+
+        double elapsed_ms = 0;
+        for (seL4_Word done = 0; done < NUM_BATCH_FRAMES; done += batch_size) {
+            seL4_Word count = (NUM_BATCH_FRAMES - done < batch_size) ? NUM_BATCH_FRAMES - done : batch_size;
+            seL4_CPtr first_slot;
+            double start_ms = now_ms();
+            seL4_Error error = tailspring_alloc_objects(&alloc, seL4_X86_4K, 0, seL4_PageBits, count, &first_slot);
+            elapsed_ms += now_ms() - start_ms;
+            check(error == seL4_NoError, "batch of %lu frames failed with %d", count, error);
+            if (error != seL4_NoError) break;
+            check(first_slot >= FREE_SLOTS_START && first_slot + count <= FREE_SLOTS_START + TAILSPRING_ALLOC_MAX_SLOTS,
+                  "batch of %lu frames went in slots %lu to %lu", count, first_slot, first_slot + count - 1);
+            free_slots(first_slot, count);
+        }
+
+        seL4_Word num_retypes = mock_counts.calls[MOCK_UNTYPED_RETYPE];
+        seL4_Word expected_retypes = (NUM_BATCH_FRAMES + batch_size - 1) / batch_size;
+        check(num_retypes == expected_retypes && mock_counts.failures[MOCK_UNTYPED_RETYPE] == 0,
+              "%lu frames in batches of %lu took %lu retypes (%lu failed) instead of %lu", NUM_BATCH_FRAMES, batch_size,
+              num_retypes, mock_counts.failures[MOCK_UNTYPED_RETYPE], expected_retypes);
+        check(alloc.untypeds[0].watermark == NUM_BATCH_FRAMES << seL4_PageBits, "the untyped's watermark is %lu after %lu frames",
+              alloc.untypeds[0].watermark, NUM_BATCH_FRAMES);
+        printf("bench: batch retype of %lu: %.3f ms for %lu frames, %lu retypes\n", batch_size, elapsed_ms, NUM_BATCH_FRAMES,
+               num_retypes);
+    }
+}
+
+// The model's lowest run of count free slots, or TAILSPRING_ALLOC_MAX_SLOTS if there is none
+static seL4_Word lowest_free_run(const bool* used, seL4_Word count) {
+    seL4_Word run_length = 0;
+    for (seL4_Word i = 0; i < TAILSPRING_ALLOC_MAX_SLOTS; i++) {
+        run_length = used[i] ? 0 : run_length + 1;
+        if (run_length == count) return i + 1 - count;
+    }
+    return TAILSPRING_ALLOC_MAX_SLOTS;
+}
+
+static void test_slot_allocation(seL4_Word iterations) {
+    // Runs of slots are taken by retyping frames into them
+    seL4_Word size_bits = 36;
+    set_up(&size_bits, 1);
+
+    static bool used[TAILSPRING_ALLOC_MAX_SLOTS];
+    memset(used, 0, sizeof(used));
+    seL4_Word num_used = 0;
+    seL4_Word peak_used = 0;
+    seL4_Word num_allocs = 0;
+    seL4_Word num_frees = 0;
+    double elapsed_ms = 0;
+    for (seL4_Word iteration = 0; iteration < iterations; iteration++) {
+        // Slightly more allocations than frees, so the bitmap fills up and stays nearly full for a while
+        bool allocate = num_used == 0 || next_random() % 100 < 55;
+        if (allocate) {
+            bool run = next_random() % 4 == 0;
+            seL4_Word count = run ? 2 + next_random() % 7 : 1;
+            seL4_Word expected = lowest_free_run(used, count);
+
+            seL4_CPtr first_slot = 0;
+            bool allocated;
+            double start_ms = now_ms();
+            if (run) {
+                allocated = tailspring_alloc_objects(&alloc, seL4_X86_4K, 0, seL4_PageBits, count, &first_slot) == seL4_NoError;
+            } else {
+                allocated = tailspring_alloc_slot(&alloc, &first_slot);
+            }
+            elapsed_ms += now_ms() - start_ms;
+            num_allocs++;
+
+            if (expected == TAILSPRING_ALLOC_MAX_SLOTS) {
+                check(!allocated, "got %lu slots at %lu with no run of them free", count, first_slot);
+                continue;
+            }
+            check(allocated && first_slot == FREE_SLOTS_START + expected, "got %lu slots at %lu instead of %lu", count,
+                  allocated ? first_slot : 0, FREE_SLOTS_START + expected);
+            if (!allocated) continue;
+            for (seL4_Word i = 0; i < count; i++) {
+                used[first_slot - FREE_SLOTS_START + i] = true;
+            }
+            num_used += count;
+            if (num_used > peak_used) peak_used = num_used;
+        } else {
+            seL4_Word index = next_random() % TAILSPRING_ALLOC_MAX_SLOTS;
+            while (!used[index]) index = (index + 1) % TAILSPRING_ALLOC_MAX_SLOTS;
+            seL4_CNode_Delete(CNODE_SLOT, FREE_SLOTS_START + index, seL4_WordBits);
+            double start_ms = now_ms();
+            tailspring_free_slot(&alloc, FREE_SLOTS_START + index);
+            elapsed_ms += now_ms() - start_ms;
+            used[index] = false;
+            num_used--;
+            num_frees++;
+        }
+    }
+    check(mock_counts.failures[MOCK_UNTYPED_RETYPE] == 0, "%lu retypes failed in the mock", mock_counts.failures[MOCK_UNTYPED_RETYPE]);
+
+    printf("bench: slot allocation: %.3f ms for %lu allocations and %lu frees, at most %lu of %u slots in use\n", elapsed_ms,
+           num_allocs, num_frees, peak_used, TAILSPRING_ALLOC_MAX_SLOTS);
+}
+
+int main(int argc, char* argv[]) {
+    seL4_Word iterations = (argc > 1) ? strtoul(argv[1], NULL, 0) : 100000;
+
+    test_bin_selection(iterations);
+    test_batch_retype();
+    test_slot_allocation(iterations);
+
+    if (num_failed_checks != 0) {
+        printf("bench: %lu checks failed\n", num_failed_checks);
+        return EXIT_FAILURE;
+    }
+    printf("bench: every check passed\n");
+    return EXIT_SUCCESS;
+}
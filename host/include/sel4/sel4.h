@@ -0,0 +1,201 @@
+// Stand-in for libsel4 when the loader or the lib is built for the host. Only what they use is declared, with the
+// x86_64 layouts and values. The invocations are implemented in mock_sel4.cpp for the loader, which simulates the kernel
+// objects, and in morecore_bench/mock_syscalls.c for the lib's morecore benchmark
+
+#pragma once
+
+#include <stdint.h>
+#include <stdbool.h>
+#include <string.h>
+
+// Kernel config the loader is built against
+#define CONFIG_MAX_NUM_NODES 4
+#define CONFIG_MAX_NUM_BOOTINFO_UNTYPED_CAPS 230
+#define CONFIG_RETYPE_FAN_OUT_LIMIT 256
+
+typedef uint64_t seL4_Word;
+typedef seL4_Word seL4_CPtr;
+
+#define seL4_WordBits 64
+#define seL4_SlotBits 5
+#define seL4_PageBits 12
+#define seL4_LargePageBits 21
+#define seL4_PageTableBits 12
+#define seL4_PageDirBits 12
+#define seL4_PDPTBits 12
+#define seL4_PML4Bits 12
+#define seL4_TCBBits 11
+#define seL4_EndpointBits 4
+#define seL4_NotificationBits 5
+#define seL4_ASIDPoolBits 12
+#define seL4_ASIDPoolIndexBits 9
+#define seL4_NumASIDPoolsBits 3
+#define seL4_IPCBufferSizeBits 10
+#define seL4_MinUntypedBits 4
+#define seL4_MaxUntypedBits 47
+#define seL4_MaxPrio 255
+#define seL4_BootInfoFrameSize (1 << seL4_PageBits)
+
+#define SEL4_BOOTINFO_HEADER_X86_FRAMEBUFFER 4
+
+// Values of seL4_MappingFailedLookupLevel, the number of vaddr bits covered by the paging structure that was missing
+#define SEL4_MAPPING_LOOKUP_NO_PT 21
+#define SEL4_MAPPING_LOOKUP_NO_PD 30
+#define SEL4_MAPPING_LOOKUP_NO_PDPT 39
+
+typedef enum {
+    seL4_NoError = 0,
+    seL4_InvalidArgument,
+    seL4_InvalidCapability,
+    seL4_IllegalOperation,
+    seL4_RangeError,
+    seL4_AlignmentError,
+    seL4_FailedLookup,
+    seL4_TruncatedMessage,
+    seL4_DeleteFirst,
+    seL4_RevokeFirst,
+    seL4_NotEnoughMemory,
+} seL4_Error;
+
+enum {
+    seL4_CapNull = 0,
+    seL4_CapInitThreadTCB = 1,
+    seL4_CapInitThreadCNode = 2,
+    seL4_CapInitThreadVSpace = 3,
+    seL4_CapIRQControl = 4,
+    seL4_CapASIDControl = 5,
+    seL4_CapInitThreadASIDPool = 6,
+    seL4_CapIOPortControl = 7,
+    seL4_CapIOSpace = 8,
+    seL4_CapBootInfoFrame = 9,
+    seL4_CapInitThreadIPCBuffer = 10,
+    seL4_CapDomain = 11,
+    seL4_NumInitialCaps = 16,
+};
+
+typedef enum {
+    seL4_UntypedObject,
+    seL4_TCBObject,
+    seL4_EndpointObject,
+    seL4_NotificationObject,
+    seL4_CapTableObject,
+    seL4_X86_PDPTObject,
+    seL4_X64_PML4Object,
+    seL4_X86_4K,
+    seL4_X86_LargePageObject,
+    seL4_X86_PageTableObject,
+    seL4_X86_PageDirectoryObject,
+    seL4_ObjectTypeCount,
+} seL4_ObjectType;
+
+typedef enum {
+    seL4_X86_Default_VMAttributes = 0,
+    seL4_X86_WriteThrough = 1,
+    seL4_X86_CacheDisabled = 2,
+    seL4_X86_Uncacheable = 3,
+    seL4_X86_WriteCombining = 4,
+} seL4_X86_VMAttributes;
+
+typedef struct {
+    seL4_Word words[1];
+} seL4_CapRights_t;
+
+static inline seL4_CapRights_t seL4_CapRights_new(seL4_Word capAllowGrantReply, seL4_Word capAllowGrant,
+                                                  seL4_Word capAllowRead, seL4_Word capAllowWrite) {
+    seL4_CapRights_t rights = {{(capAllowGrantReply & 1) << 3 | (capAllowGrant & 1) << 2 | (capAllowRead & 1) << 1 | (capAllowWrite & 1)}};
+    return rights;
+}
+
+#define seL4_AllRights seL4_CapRights_new(1, 1, 1, 1)
+#define seL4_CanRead seL4_CapRights_new(0, 0, 1, 0)
+#define seL4_CanWrite seL4_CapRights_new(0, 0, 0, 1)
+#define seL4_ReadWrite seL4_CapRights_new(0, 0, 1, 1)
+#define seL4_NoRights seL4_CapRights_new(0, 0, 0, 0)
+
+typedef struct {
+    seL4_Word rip, rsp, rflags, rax, rbx, rcx, rdx, rsi, rdi, rbp,
+              r8, r9, r10, r11, r12, r13, r14, r15, fs_base, gs_base;
+} seL4_UserContext;
+
+typedef struct {
+    seL4_Word start;
+    seL4_Word end;
+} seL4_SlotRegion;
+
+typedef struct {
+    seL4_Word paddr;
+    uint8_t sizeBits;
+    uint8_t isDevice;
+    uint8_t padding[sizeof(seL4_Word) - 2 * sizeof(uint8_t)];
+} seL4_UntypedDesc;
+
+typedef struct {
+    seL4_Word extraLen;
+    seL4_Word nodeID;
+    seL4_Word numNodes;
+    seL4_Word numIOPTLevels;
+    void* ipcBuffer;
+    seL4_SlotRegion empty;
+    seL4_SlotRegion sharedFrames;
+    seL4_SlotRegion userImageFrames;
+    seL4_SlotRegion userImagePaging;
+    seL4_SlotRegion ioSpaceCaps;
+    seL4_SlotRegion extraBIPages;
+    seL4_Word initThreadCNodeSizeBits;
+    seL4_Word initThreadDomain;
+    seL4_SlotRegion untyped;
+    seL4_UntypedDesc untypedList[CONFIG_MAX_NUM_BOOTINFO_UNTYPED_CAPS];
+} seL4_BootInfo;
+
+typedef struct {
+    seL4_Word id;
+    seL4_Word len;
+} seL4_BootInfoHeader;
+
+typedef struct __attribute__((packed)) {
+    uint64_t addr;
+    uint32_t pitch;
+    uint32_t width;
+    uint32_t height;
+    uint8_t bpp;
+    uint8_t type;
+} seL4_X86_mb_fb_t;
+
+typedef struct __attribute__((packed)) {
+    seL4_BootInfoHeader header;
+    seL4_X86_mb_fb_t fb_info;
+} seL4_X86_BootInfo_fb_t;
+
+seL4_Error seL4_Untyped_Retype(seL4_CPtr service, seL4_Word type, seL4_Word size_bits, seL4_CPtr root,
+                               seL4_Word node_index, seL4_Word node_depth, seL4_Word node_offset, seL4_Word num_objects);
+
+seL4_Error seL4_CNode_Copy(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth, seL4_CapRights_t rights);
+seL4_Error seL4_CNode_Mint(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth, seL4_CapRights_t rights, seL4_Word badge);
+seL4_Error seL4_CNode_Move(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth);
+seL4_Error seL4_CNode_Mutate(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                             seL4_Word src_index, uint8_t src_depth, seL4_Word badge);
+seL4_Error seL4_CNode_Delete(seL4_CPtr service, seL4_Word index, uint8_t depth);
+
+seL4_Error seL4_TCB_Configure(seL4_CPtr service, seL4_Word fault_ep, seL4_CPtr cspace_root, seL4_Word cspace_root_data,
+                              seL4_CPtr vspace_root, seL4_Word vspace_root_data, seL4_Word buffer, seL4_CPtr bufferFrame);
+seL4_Error seL4_TCB_SetAffinity(seL4_CPtr service, seL4_Word affinity);
+seL4_Error seL4_TCB_SetSchedParams(seL4_CPtr service, seL4_CPtr authority, seL4_Word mcp, seL4_Word priority);
+seL4_Error seL4_TCB_WriteRegisters(seL4_CPtr service, bool resume_target, uint8_t arch_flags, seL4_Word count,
+                                   seL4_UserContext* regs);
+seL4_Error seL4_TCB_Suspend(seL4_CPtr service);
+
+seL4_Error seL4_X86_ASIDControl_MakePool(seL4_CPtr service, seL4_CPtr untyped, seL4_CPtr root, seL4_Word index, uint8_t depth);
+seL4_Error seL4_X86_ASIDPool_Assign(seL4_CPtr service, seL4_CPtr vspace);
+seL4_Error seL4_X86_PDPT_Map(seL4_CPtr service, seL4_CPtr pml4, seL4_Word vaddr, seL4_X86_VMAttributes attr);
+seL4_Error seL4_X86_PageDirectory_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr);
+seL4_Error seL4_X86_PageTable_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr);
+seL4_Error seL4_X86_Page_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_CapRights_t rights,
+                             seL4_X86_VMAttributes attr);
+seL4_Error seL4_X86_Page_Unmap(seL4_CPtr service);
+// Set by a map invocation that failed with seL4_FailedLookup
+seL4_Word seL4_MappingFailedLookupLevel(void);
+
+void seL4_DebugDumpScheduler(void);
@@ -0,0 +1,6 @@
+#pragma once
+
+#include <sel4/sel4.h>
+
+// Returns the synthetic boot info built by the mock kernel
+seL4_BootInfo* platsupport_get_bootinfo(void);
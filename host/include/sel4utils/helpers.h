@@ -0,0 +1,21 @@
+#pragma once
+
+#include <sel4/sel4.h>
+
+typedef void (*sel4utils_thread_entry_fn)(void* arg0, void* arg1, void* ipc_buf);
+
+// Same register assignment as the x86_64 sel4utils version: the first three arguments go in rdi, rsi and rdx,
+// and the stack pointer is lowered by a word as if the entry point had been called
+static inline int sel4utils_arch_init_local_context(sel4utils_thread_entry_fn entry_point, void* arg0, void* arg1, void* arg2,
+                                                    void* stack_top, seL4_UserContext* context) {
+    context->rip = (seL4_Word)entry_point;
+    context->rdi = (seL4_Word)arg0;
+    context->rsi = (seL4_Word)arg1;
+    context->rdx = (seL4_Word)arg2;
+    context->rsp = (seL4_Word)stack_top - sizeof(seL4_Word);
+    return 0;
+}
+
+static inline void sel4utils_set_stack_pointer(seL4_UserContext* context, seL4_Word value) {
+    context->rsp = value;
+}
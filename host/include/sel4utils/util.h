@@ -0,0 +1,3 @@
+#pragma once
+
+#define BIT(n) (1ul << (n))
@@ -0,0 +1,456 @@
+// Tests and benchmarks parts of the loader against the simulated kernel in ../mock_sel4.cpp, with untypeds and operation
+// tables made up by each test instead of a generated config. Each part is checked against a simple model of what the
+// loader should do, and the time spent in the loader is printed:
+// - best fit: getUntypedBestFitIndex on random untypeds has to pick the one with the least memory left that fits
+// - untyped reset: the mock has to retype from the start of an untyped again once nothing made from it is left, and
+//   not before, since the colored frames below rely on that
+// - colored frames: frames have to come out of the pages of the requested colors, in address order, with nothing of
+//   those colors skipped, also when the first frame is retyped out of an untyped that has no children yet
+// - retype leftover: doRetypeLeftoverGPUntypedsOp has to pass the biggest blocks of leftover memory, biggest first,
+//   and record exactly what it passed and discarded
+// - chunk load: doBinaryChunkLoadOp has to move every image frame of a chunk into the destination vspace
+// - execute operations: a table of creates and maps for a vspace of 64 MiB has to run without a failed invocation
+// The results go to stderr, since the loader prints to stdout. The exit code is nonzero if any check failed. The mock is
+// much cheaper than real syscalls, so the times mostly show the loader's own bookkeeping.
+// Usage: loader_bench [iterations]
+
+#include <algorithm>
+#include <cstdarg>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <ctime>
+#include <vector>
+
+#include "loader_bench.hpp"
+#include "mock_sel4.hpp"
+
+// Slots of the vspace and its paging structures, relative to the first empty slot like the operations' slots are
+#define VSPACE_SLOT 0
+#define PDPT_SLOT 1
+#define PD_SLOT 2
+#define FIRST_PT_SLOT 3
+#define CNODE_SLOT 1024
+#define FIRST_OBJECT_SLOT 2048
+
+#define CNODE_RADIX 8
+#define VSPACE_VADDR 0x400000UL
+
+#define NUM_BEST_FIT_UNTYPEDS TAILSPRING_MEM_NUM_ENTRIES
+#define NUM_CHUNK_PAGES 512
+#define NUM_EXECUTE_PTS 32
+#define NUM_EXECUTE_FRAMES (NUM_EXECUTE_PTS << (seL4_LargePageBits - seL4_PageBits))
+// Only the first few failed checks are printed
+#define MAX_PRINTED_FAILURES 10
+
+// Part of the loader's image, so that it has image frames that can be loaded like a chunk
+alignas(BIT(seL4_PageBits)) static unsigned char chunk_pages[NUM_CHUNK_PAGES << seL4_PageBits];
+
+static seL4_Word num_failed_checks = 0;
+
+static seL4_Word random_state = 0x2545f4914f6cdd1dUL;
+
+static seL4_Word next_random(void) {
+    random_state ^= random_state << 13;
+    random_state ^= random_state >> 7;
+    random_state ^= random_state << 17;
+    return random_state;
+}
+
+static double now_ms(void) {
+    struct timespec time;
+    clock_gettime(CLOCK_MONOTONIC, &time);
+    return time.tv_sec * 1e3 + time.tv_nsec / 1e6;
+}
+
+static void check(bool condition, const char* format, ...) {
+    if (condition) return;
+    if (num_failed_checks++ >= MAX_PRINTED_FAILURES) return;
+    va_list args;
+    va_start(args, format);
+    fprintf(stderr, "bench: check failed: ");
+    vfprintf(stderr, format, args);
+    fprintf(stderr, "\n");
+    va_end(args);
+}
+
+// Starts the loader over on a new boot info with the given untypeds, or the mock's default layout if there are none,
+// the way main does before it runs the operations
+static void set_up(const MockUntyped* untypeds, seL4_Word num_untypeds) {
+    num_gp_untypeds = 0;
+    num_device_untypeds = 0;
+    scratch_slots_used = 0;
+    num_color_skip_slots = 0;
+    color_skipped_bytes = 0;
+    gp_memory_info = {};
+    device_memory_info = {};
+    framebuffer_info = nullptr;
+    num_bench_operations = 0;
+
+    mockReset(untypeds, num_untypeds);
+    loadBootInfo();
+    if (wrapperPageUnmap(getFrameForAddr((seL4_Word)FREE_PAGE)) != seL4_NoError) {
+        fprintf(stderr, "bench: couldn't unmap the free page\n");
+        exit(EXIT_FAILURE);
+    }
+}
+
+static CapOperation* add_op(CapOperationType op_type) {
+    if (num_bench_operations == MAX_BENCH_OPERATIONS) {
+        fprintf(stderr, "bench: too many operations\n");
+        exit(EXIT_FAILURE);
+    }
+    CapOperation* op = &cap_operations[num_bench_operations++];
+    memset(op, 0, sizeof(*op));
+    op->op_type = op_type;
+    return op;
+}
+
+static void add_create(seL4_Word cap_type, seL4_Word size_bits, seL4_Word object_bits, uint32_t dest) {
+    CapOperation* op = add_op(CREATE_OP);
+    op->create_op.cap_type = cap_type;
+    op->create_op.bytes_required = BIT(object_bits);
+    op->create_op.size_bits = size_bits;
+    op->create_op.dest = dest;
+}
+
+static void add_map(MapFuncType map_func, uint32_t service, seL4_Word vaddr) {
+    CapOperation* op = add_op(MAP_OP);
+    op->map_op.map_func = map_func;
+    op->map_op.service = service;
+    op->map_op.vspace = VSPACE_SLOT;
+    op->map_op.vaddr = vaddr;
+}
+
+// A vspace with num_pts page tables, covering num_pts large pages from VSPACE_VADDR, which is in its first 1 GiB
+static void add_vspace(seL4_Word num_pts) {
+    add_create(seL4_X64_PML4Object, seL4_PML4Bits, seL4_PML4Bits, VSPACE_SLOT);
+    add_create(seL4_X86_PDPTObject, seL4_PDPTBits, seL4_PDPTBits, PDPT_SLOT);
+    add_create(seL4_X86_PageDirectoryObject, seL4_PageDirBits, seL4_PageDirBits, PD_SLOT);
+    for (seL4_Word i = 0; i < num_pts; i++) {
+        add_create(seL4_X86_PageTableObject, seL4_PageTableBits, seL4_PageTableBits, FIRST_PT_SLOT + i);
+    }
+
+    add_map(wrapper_X86_ASIDPool_Assign, VSPACE_SLOT, 0);
+    add_map(wrapper_X86_PDPT_Map, PDPT_SLOT, 0);
+    add_map(wrapper_X86_PageDirectory_Map, PD_SLOT, 0);
+    for (seL4_Word i = 0; i < num_pts; i++) {
+        add_map(wrapper_X86_PageTable_Map, FIRST_PT_SLOT + i, VSPACE_VADDR + (i << seL4_LargePageBits));
+    }
+}
+
+static bool get_root_object(seL4_Word slot, MockObjectInfo* info_out) {
+    return mockGetObject(seL4_CapInitThreadCNode, first_empty_slot + slot, seL4_WordBits, info_out);
+}
+
+static void test_best_fit(seL4_Word iterations) {
+    num_gp_untypeds = NUM_BEST_FIT_UNTYPEDS;
+
+    double elapsed_ms = 0;
+    seL4_Word num_misses = 0;
+    for (seL4_Word iteration = 0; iteration < iterations; iteration++) {
+        // Fresh untyped sizes every so often, with a random part of each used up
+        if (iteration % 64 == 0) {
+            for (seL4_Word i = 0; i < NUM_BEST_FIT_UNTYPEDS; i++) {
+                UntypedInfo* untyped = &gp_untyped_array[i];
+                untyped->original_size_bits = seL4_PageBits + next_random() % 13;
+                untyped->paddr = i << 32;
+                untyped->bytes_left = BIT(untyped->original_size_bits) - (next_random() % BIT(untyped->original_size_bits));
+            }
+        }
+        seL4_Word bytes_required = BIT(seL4_MinUntypedBits + next_random() % (seL4_PageBits + 12 - seL4_MinUntypedBits));
+
+        // The model: of the untypeds that the object fits into at its alignment, the first with the fewest bytes left
+        seL4_Word expected_index = ~0llu;
+        for (seL4_Word i = 0; i < NUM_BEST_FIT_UNTYPEDS; i++) {
+            const UntypedInfo* untyped = &gp_untyped_array[i];
+            seL4_Word watermark = BIT(untyped->original_size_bits) - untyped->bytes_left;
+            seL4_Word offset = (watermark + bytes_required - 1) / bytes_required * bytes_required;
+            if (offset + bytes_required > BIT(untyped->original_size_bits)) continue;
+            if (expected_index == ~0llu || untyped->bytes_left < gp_untyped_array[expected_index].bytes_left) expected_index = i;
+        }
+
+        double start_ms = now_ms();
+        seL4_Word index = getUntypedBestFitIndex(bytes_required);
+        elapsed_ms += now_ms() - start_ms;
+
+        check(index == expected_index, "best fit for %lu bytes was untyped %ld instead of %ld", bytes_required, (long)index,
+              (long)expected_index);
+        if (expected_index == ~0llu) num_misses++;
+    }
+
+    fprintf(stderr, "bench: best fit: %.3f ms for %lu lookups over %lu untypeds, %lu found nothing\n", elapsed_ms, iterations,
+           (seL4_Word)NUM_BEST_FIT_UNTYPEDS, num_misses);
+}
+
+// Retypes a frame out of the untyped in the root cnode into the empty slot, and returns its paddr
+static seL4_Word retype_frame(seL4_CPtr untyped, seL4_Word slot) {
+    seL4_Error error = seL4_Untyped_Retype(untyped, seL4_X86_4K, seL4_PageBits, seL4_CapInitThreadCNode, 0, 0,
+                                           first_empty_slot + slot, 1);
+    check(error == seL4_NoError, "retyping a frame into slot %lu failed with %d", slot, error);
+    MockObjectInfo info = {};
+    get_root_object(slot, &info);
+    return info.paddr;
+}
+
+static void delete_slot(seL4_Word slot) {
+    seL4_Error error = seL4_CNode_Delete(seL4_CapInitThreadCNode, first_empty_slot + slot, seL4_WordBits);
+    check(error == seL4_NoError, "deleting slot %lu failed with %d", slot, error);
+}
+
+static void test_untyped_reset(void) {
+    const MockUntyped untyped = {0x100000, 20, false};
+    set_up(&untyped, 1);
+    seL4_CPtr untyped_slot = gp_untyped_array[0].cptr;
+
+    // The only child is gone, so the next object goes at the start again
+    seL4_Word first = retype_frame(untyped_slot, 0);
+    delete_slot(0);
+    check(retype_frame(untyped_slot, 1) == first, "retyping out of an untyped without children didn't start over");
+
+    // A copy of the frame's cap is a child too
+    seL4_Error error = seL4_CNode_Copy(seL4_CapInitThreadCNode, first_empty_slot + 2, seL4_WordBits,
+                                       seL4_CapInitThreadCNode, first_empty_slot + 1, seL4_WordBits, seL4_AllRights);
+    check(error == seL4_NoError, "copying a frame failed with %d", error);
+    delete_slot(1);
+    check(retype_frame(untyped_slot, 3) != first, "retyping out of an untyped started over while a copy of a child was left");
+    delete_slot(2);
+    delete_slot(3);
+
+    // So is anything made from a child untyped, even once the child untyped's own cap is gone
+    error = seL4_Untyped_Retype(untyped_slot, seL4_UntypedObject, 16, seL4_CapInitThreadCNode, 0, 0, first_empty_slot + 4, 1);
+    check(error == seL4_NoError, "retyping a child untyped failed with %d", error);
+    retype_frame(first_empty_slot + 4, 5);
+    delete_slot(4);
+    check(retype_frame(untyped_slot, 6) == first + BIT(16), "retyping out of an untyped started over while a grandchild was left");
+
+    check(mockNumFailures() == 0, "%lu invocations failed in the mock", mockNumFailures());
+    fprintf(stderr, "bench: untyped reset: checked\n");
+}
+
+static void run_colored_frames(const MockUntyped* untyped, seL4_Word num_frames, seL4_Word num_colors, seL4_Word color_mask) {
+    set_up(untyped, 1);
+    CapOperation* op = add_op(COLORED_FRAMES_CREATE_OP);
+    op->colored_frames_create_op.frame_type = seL4_X86_4K;
+    op->colored_frames_create_op.color_mask = color_mask;
+    op->colored_frames_create_op.first_frame = FIRST_OBJECT_SLOT;
+    op->colored_frames_create_op.num_frames = num_frames;
+    op->colored_frames_create_op.num_colors = num_colors;
+
+    double start_ms = now_ms();
+    bool ok = executeOperations();
+    double elapsed_ms = now_ms() - start_ms;
+    check(ok, "creating %lu frames of color mask %lx failed", num_frames, color_mask);
+
+    // The model: the untyped's pages of the right colors, in address order, with the pages before the last frame that
+    // are of other colors skipped
+    seL4_Word paddr = untyped->paddr;
+    seL4_Word expected_skipped = 0;
+    seL4_Word num_wrong = 0;
+    for (seL4_Word i = 0; i < num_frames; i++) {
+        while (!(color_mask & BIT((paddr >> seL4_PageBits) & (num_colors - 1)))) {
+            paddr += BIT(seL4_PageBits);
+            expected_skipped += BIT(seL4_PageBits);
+        }
+        MockObjectInfo info = {};
+        if (!get_root_object(FIRST_OBJECT_SLOT + i, &info) || info.type != seL4_X86_4K || info.paddr != paddr) {
+            if (num_wrong++ == 0) check(false, "frame %lu of color mask %lx is at %lx instead of %lx", i, color_mask, info.paddr, paddr);
+        }
+        paddr += BIT(seL4_PageBits);
+    }
+    check(num_wrong == 0, "%lu of %lu frames of color mask %lx are in the wrong place", num_wrong, num_frames, color_mask);
+    check(color_skipped_bytes == expected_skipped, "%lu bytes of other colors were skipped instead of %lu", color_skipped_bytes,
+          expected_skipped);
+
+    // The untypeds retyped over the skipped pages are deleted once the frame after them holds the untyped's watermark up
+    for (seL4_Word i = 0; i < num_color_skip_slots; i++) {
+        MockObjectInfo info;
+        check(!mockGetObject(seL4_CapInitThreadCNode, first_empty_slot + SLOTS_REQUIRED + i, seL4_WordBits, &info),
+              "scratch slot %lu still holds an untyped retyped over skipped pages", i);
+    }
+    check(mockNumFailures() == 0, "%lu invocations failed in the mock", mockNumFailures());
+
+    fprintf(stderr, "bench: colored frames: %.3f ms for %lu frames of %lu colors (mask %lx), %lu bytes skipped\n", elapsed_ms, num_frames,
+           num_colors, color_mask, color_skipped_bytes);
+}
+
+static void test_colored_frames(void) {
+    // The untyped starts on a page of color 0, which isn't wanted, and has no children when the first frame is retyped
+    const MockUntyped small = {0x100000, 20, false};
+    run_colored_frames(&small, 8, 8, BIT(5) | BIT(6));
+
+    const MockUntyped large = {0x10000000, 28, false};
+    run_colored_frames(&large, 4096, 8, BIT(3));
+}
+
+struct LeftoverBlock {
+    seL4_Word size_bits;
+    seL4_Word paddr;
+};
+
+static void run_retype_leftover(const char* name, const MockUntyped* untypeds, seL4_Word num_untypeds, seL4_Word num_objects,
+                                seL4_Word num_slots) {
+    set_up(untypeds, num_untypeds);
+    add_create(seL4_CapTableObject, CNODE_RADIX, CNODE_RADIX + seL4_SlotBits, CNODE_SLOT);
+    // Objects of mixed sizes, so that the watermarks end up at all sorts of alignments
+    static const seL4_Word types[][2] = {{seL4_X86_4K, seL4_PageBits}, {seL4_EndpointObject, seL4_EndpointBits},
+                                         {seL4_TCBObject, seL4_TCBBits}};
+    for (seL4_Word i = 0; i < num_objects; i++) {
+        const seL4_Word* type = types[next_random() % 3];
+        add_create(type[0], type[1], type[1], FIRST_OBJECT_SLOT + i);
+    }
+    check(executeOperations(), "%s: creating the objects failed", name);
+
+    // The model: every untyped's leftover memory cut into the biggest aligned blocks, of which the biggest that can be
+    // retyped are passed, biggest first, and the rest discarded
+    std::vector<LeftoverBlock> blocks;
+    seL4_Word bytes_left = 0;
+    for (seL4_Word i = 0; i < num_gp_untypeds; i++) {
+        const UntypedInfo* untyped = &gp_untyped_array[i];
+        seL4_Word size = BIT(untyped->original_size_bits);
+        for (seL4_Word offset = size - untyped->bytes_left; offset < size;) {
+            seL4_Word size_bits = (offset == 0) ? untyped->original_size_bits : __builtin_ctzl(offset);
+            blocks.push_back({size_bits, untyped->paddr + offset});
+            offset += BIT(size_bits);
+        }
+        bytes_left += untyped->bytes_left;
+    }
+    std::stable_sort(blocks.begin(), blocks.end(), [](const LeftoverBlock& a, const LeftoverBlock& b) {
+        return a.size_bits > b.size_bits;
+    });
+    seL4_Word num_expected = 0;
+    seL4_Word max_entries = std::min<seL4_Word>(num_slots, TAILSPRING_MEM_NUM_ENTRIES);
+    while (num_expected < blocks.size() && num_expected < max_entries && blocks[num_expected].size_bits >= seL4_MinUntypedBits) {
+        num_expected++;
+    }
+
+    CapOperation op;
+    memset(&op, 0, sizeof(op));
+    op.op_type = RETYPE_LEFTOVER_GP_UNTYPEDS_OP;
+    op.retype_leftover_gp_untypeds_op.cnode_dest = CNODE_SLOT;
+    op.retype_leftover_gp_untypeds_op.start_slot = 0;
+    op.retype_leftover_gp_untypeds_op.end_slot = num_slots;
+    op.retype_leftover_gp_untypeds_op.cnode_depth = seL4_WordBits;
+
+    double start_ms = now_ms();
+    bool ok = doRetypeLeftoverGPUntypedsOp(&op);
+    double elapsed_ms = now_ms() - start_ms;
+    check(ok, "%s: retyping the leftover untypeds failed", name);
+
+    check(gp_memory_info.num_entries == num_expected, "%s: %lu untypeds were passed instead of %lu", name,
+          gp_memory_info.num_entries, num_expected);
+    seL4_Word bytes_passed = 0;
+    for (seL4_Word i = 0; i < gp_memory_info.num_entries && i < num_expected; i++) {
+        const TailspringMemoryEntry& entry = gp_memory_info.entries[i];
+        check(entry.size_bits == blocks[i].size_bits && entry.paddr == blocks[i].paddr,
+              "%s: entry %lu is 2^%lu bytes at %lx instead of 2^%lu bytes at %lx", name, i, entry.size_bits, entry.paddr,
+              blocks[i].size_bits, blocks[i].paddr);
+        MockObjectInfo info = {};
+        bool present = mockGetObject(first_empty_slot + CNODE_SLOT, i, CNODE_RADIX, &info);
+        check(present && info.type == seL4_UntypedObject && info.size_bits == entry.size_bits && info.paddr == entry.paddr,
+              "%s: slot %lu doesn't hold the untyped of entry %lu", name, i, i);
+        bytes_passed += BIT(entry.size_bits);
+    }
+    check(bytes_passed + gp_memory_info.bytes_discarded == bytes_left, "%s: %lu bytes passed and %lu discarded out of %lu left",
+          name, bytes_passed, gp_memory_info.bytes_discarded, bytes_left);
+    check(mockNumFailures() == 0, "%s: %lu invocations failed in the mock", name, mockNumFailures());
+
+    fprintf(stderr, "bench: retype leftover (%s): %.3f ms for %lu blocks, %lu passed, %lu bytes discarded\n", name, elapsed_ms,
+           (seL4_Word)blocks.size(), gp_memory_info.num_entries, gp_memory_info.bytes_discarded);
+}
+
+static void test_retype_leftover(void) {
+    const MockUntyped untypeds[] = {
+        {0x100000, 20, false}, {0x200000, 17, false}, {0x240000, 14, false}, {0xe0000000, 24, true},
+    };
+    seL4_Word num_untypeds = sizeof(untypeds) / sizeof(untypeds[0]);
+    run_retype_leftover("every block", untypeds, num_untypeds, 64, BIT(CNODE_RADIX));
+    run_retype_leftover("too few slots", untypeds, num_untypeds, 64, 3);
+    // The mock's default boot info, with its 2 GiB of RAM
+    run_retype_leftover("default", nullptr, 0, 512, BIT(CNODE_RADIX));
+}
+
+static void test_chunk_load(void) {
+    set_up(nullptr, 0);
+    add_vspace(1);
+    check(executeOperations(), "setting up the vspace failed");
+
+    CapOperation op;
+    memset(&op, 0, sizeof(op));
+    op.op_type = BINARY_CHUNK_LOAD_OP;
+    op.binary_chunk_load_op.src_vaddr = (seL4_Word)chunk_pages;
+    op.binary_chunk_load_op.dest_vaddr = VSPACE_VADDR;
+    op.binary_chunk_load_op.length = sizeof(chunk_pages);
+    op.binary_chunk_load_op.dest_vspace = VSPACE_SLOT;
+    op.binary_chunk_load_op.writable = true;
+
+    double start_ms = now_ms();
+    bool ok = doBinaryChunkLoadOp(&op);
+    double elapsed_ms = now_ms() - start_ms;
+    check(ok, "loading the chunk failed");
+
+    seL4_Word num_wrong = 0;
+    for (seL4_Word i = 0; i < NUM_CHUNK_PAGES; i++) {
+        seL4_CPtr frame = getFrameForAddr((seL4_Word)chunk_pages + (i << seL4_PageBits));
+        if (!mockIsMapped(frame, first_empty_slot + VSPACE_SLOT, VSPACE_VADDR + (i << seL4_PageBits))) num_wrong++;
+    }
+    check(num_wrong == 0, "%lu of %lu chunk frames aren't mapped into the vspace", num_wrong, (seL4_Word)NUM_CHUNK_PAGES);
+    check(mockNumFailures() == 0, "%lu invocations failed in the mock", mockNumFailures());
+
+    fprintf(stderr, "bench: chunk load: %.3f ms for %lu frames\n", elapsed_ms, (seL4_Word)NUM_CHUNK_PAGES);
+}
+
+static void test_execute_operations(void) {
+    set_up(nullptr, 0);
+    add_vspace(NUM_EXECUTE_PTS);
+    for (seL4_Word i = 0; i < NUM_EXECUTE_FRAMES; i++) {
+        add_create(seL4_X86_4K, seL4_PageBits, seL4_PageBits, FIRST_OBJECT_SLOT + i);
+    }
+    for (seL4_Word i = 0; i < NUM_EXECUTE_FRAMES; i++) {
+        CapOperation* op = add_op(MAP_FRAME_OP);
+        op->map_frame_op.frame = FIRST_OBJECT_SLOT + i;
+        op->map_frame_op.vspace = VSPACE_SLOT;
+        op->map_frame_op.vaddr = VSPACE_VADDR + (i << seL4_PageBits);
+    }
+    add_create(seL4_CapTableObject, CNODE_RADIX, CNODE_RADIX + seL4_SlotBits, CNODE_SLOT);
+    CapOperation* op = add_op(RETYPE_LEFTOVER_GP_UNTYPEDS_OP);
+    op->retype_leftover_gp_untypeds_op.cnode_dest = CNODE_SLOT;
+    op->retype_leftover_gp_untypeds_op.end_slot = BIT(CNODE_RADIX);
+    op->retype_leftover_gp_untypeds_op.cnode_depth = seL4_WordBits;
+
+    double start_ms = now_ms();
+    bool ok = executeOperations();
+    double elapsed_ms = now_ms() - start_ms;
+    check(ok, "executing the operations failed");
+
+    seL4_Word num_wrong = 0;
+    for (seL4_Word i = 0; i < NUM_EXECUTE_FRAMES; i++) {
+        if (!mockIsMapped(first_empty_slot + FIRST_OBJECT_SLOT + i, first_empty_slot + VSPACE_SLOT, VSPACE_VADDR + (i << seL4_PageBits))) {
+            num_wrong++;
+        }
+    }
+    check(num_wrong == 0, "%lu of %lu frames aren't mapped into the vspace", num_wrong, (seL4_Word)NUM_EXECUTE_FRAMES);
+    check(gp_memory_info.num_entries != 0, "no leftover memory was passed");
+    check(mockNumFailures() == 0, "%lu invocations failed in the mock", mockNumFailures());
+
+    fprintf(stderr, "bench: execute operations: %.3f ms for %lu operations, %lu frames mapped\n", elapsed_ms, num_bench_operations,
+           (seL4_Word)NUM_EXECUTE_FRAMES);
+}
+
+int main(int argc, char* argv[]) {
+    seL4_Word iterations = (argc > 1) ? strtoul(argv[1], NULL, 0) : 100000;
+
+    test_best_fit(iterations);
+    test_untyped_reset();
+    test_colored_frames();
+    test_retype_leftover();
+    test_chunk_load();
+    test_execute_operations();
+
+    if (num_failed_checks != 0) {
+        fprintf(stderr, "bench: %lu checks failed\n", num_failed_checks);
+        return EXIT_FAILURE;
+    }
+    fprintf(stderr, "bench: every check passed\n");
+    return EXIT_SUCCESS;
+}
@@ -0,0 +1,41 @@
+#pragma once
+
+// Shared by loader_bench.cpp and the stand-in generated config the loader is built with
+
+#include "tailspring.hpp"
+
+// Every test's slots fit below this, and the loader's scratch slots go above it
+#define SLOTS_REQUIRED ((seL4_Word)1 << 17)
+
+// Room for the longest operation table a test builds
+#define MAX_BENCH_OPERATIONS (1 << 16)
+
+// Each test fills in cap_operations and sets how many of them executeOperations runs
+extern seL4_Word num_bench_operations;
+
+// Defined by the loader
+extern seL4_Word first_empty_slot;
+extern seL4_Word scratch_slots_used;
+extern seL4_Word num_gp_untypeds;
+extern seL4_Word num_device_untypeds;
+extern UntypedInfo gp_untyped_array[TAILSPRING_MEM_NUM_ENTRIES];
+extern TailspringMemoryInfo gp_memory_info;
+extern TailspringMemoryInfo device_memory_info;
+extern TailspringFramebufferInfo* framebuffer_info;
+extern seL4_Word num_color_skip_slots;
+extern seL4_Word color_skipped_bytes;
+extern unsigned char FREE_PAGE[];
+
+void loadBootInfo();
+seL4_CPtr getFrameForAddr(seL4_Word addr);
+seL4_Word getUntypedBestFitIndex(seL4_Word bytes_required);
+bool doRetypeLeftoverGPUntypedsOp(CapOperation* cap_op);
+bool doBinaryChunkLoadOp(CapOperation* cap_op);
+bool executeOperations();
+
+// Defined by the stand-in generated config
+seL4_Error wrapper_X86_ASIDPool_Assign(CapOperation* cap_op, seL4_Word first_empty_slot);
+seL4_Error wrapper_X86_PDPT_Map(CapOperation* cap_op, seL4_Word first_empty_slot);
+seL4_Error wrapper_X86_PageDirectory_Map(CapOperation* cap_op, seL4_Word first_empty_slot);
+seL4_Error wrapper_X86_PageTable_Map(CapOperation* cap_op, seL4_Word first_empty_slot);
+seL4_Error wrapperPageUnmap(seL4_CPtr frame);
@@ -0,0 +1,18 @@
+#pragma once
+
+// Stands in for the generated config when the loader is built for loader_bench. There are no startup threads, and the
+// operations are filled in by each test before it runs them, so their number is only known at run time
+
+#include "loader_bench.hpp"
+
+ENABLE_X86_ASIDPOOL_ASSIGN
+ENABLE_X86_PDPT_MAP
+ENABLE_X86_PAGEDIRECTORY_MAP
+ENABLE_X86_PAGETABLE_MAP
+ENABLE_X86_PAGE_MAP
+
+CapOperation cap_operations[MAX_BENCH_OPERATIONS];
+seL4_Word num_bench_operations = 0;
+
+#undef NUM_OPERATIONS
+#define NUM_OPERATIONS num_bench_operations
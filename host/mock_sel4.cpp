@@ -0,0 +1,741 @@
+// Simulated seL4 kernel for running the loader on the host. It keeps track of the objects and caps the loader creates,
+// checks each invocation the way the kernel would (empty destination slots, enough untyped memory, paging structures
+// present before anything is mapped under them, ...), and counts the invocations. When the loader halts, a summary is
+// printed to stderr and the process exits with 0 if the loader got to the end of its operations
+
+#include <chrono>
+#include <cstdarg>
+#include <cstdio>
+#include <cstdlib>
+#include <deque>
+#include <unordered_set>
+#include <vector>
+
+extern "C" {
+#include <sel4/sel4.h>
+#include <sel4platsupport/bootinfo.h>
+#include <sel4utils/util.h>
+}
+
+#include "tailspring.hpp"
+#include "mock_sel4.hpp"
+
+// Provided by the host linker script and the linker itself. Every page in between is an image frame of the loader
+extern void* _lowest_vaddr;
+extern char _end[];
+
+// Defined by the loader, which records where the reclaimed frames will go in it before moving them
+extern TailspringMemoryInfo gp_memory_info;
+
+namespace {
+
+// Object types the loader can't create, but that the initial caps refer to
+enum { ASIDPoolObject = seL4_ObjectTypeCount, ASIDControlObject, OtherObject };
+
+// Paging structures and pages mapped into a vspace are keyed by their level and the vaddr bits above what they cover
+enum MappingLevel { PDPT_LEVEL = 1, PD_LEVEL, PT_LEVEL, LARGE_PAGE_LEVEL, PAGE_LEVEL };
+const seL4_Word level_shifts[] = {0, 39, 30, 21, 21, 12};
+
+// Highest vaddr user mappings can go at
+const seL4_Word USER_TOP = 0x00007fffffffffff;
+
+const seL4_Word DEFAULT_CNODE_BITS = 18;
+const seL4_Word DEFAULT_RAM_MB = 2048;
+
+struct Cap {
+    int64_t object = -1; // Index into objects, -1 if the slot is empty
+    seL4_Word rights = 0;
+    seL4_Word badge = 0;
+    seL4_Word guard = 0;
+    // For frames and paging structures, the vspace and key they are mapped at
+    int64_t mapped_vspace = -1;
+    seL4_Word mapped_key = 0;
+};
+
+struct Object {
+    seL4_Word type;
+    seL4_Word size_bits;
+    seL4_Word paddr = 0;
+    bool is_device = false;
+    int64_t parent = -1; // The untyped it was retyped from, -1 for objects the kernel created
+    seL4_Word watermark = 0; // Untypeds: bytes retyped so far
+    seL4_Word num_child_caps = 0; // Untypeds: caps to objects retyped from it or from its children
+    std::vector<Cap> slots; // CNodes
+    bool has_asid = false; // VSpaces
+    std::unordered_set<seL4_Word> mappings; // VSpaces
+    seL4_Word asids_used = 0; // ASID pools
+    bool configured = false; // TCBs
+    bool resumed = false;
+    seL4_Word mcp = 0;
+};
+
+enum Invocation {
+    UNTYPED_RETYPE, CNODE_COPY, CNODE_MINT, CNODE_MOVE, CNODE_MUTATE, CNODE_DELETE, TCB_CONFIGURE, TCB_SET_AFFINITY,
+    TCB_SET_SCHED_PARAMS, TCB_WRITE_REGISTERS, TCB_SUSPEND, ASID_CONTROL_MAKE_POOL, ASID_POOL_ASSIGN, PDPT_MAP, PAGE_DIRECTORY_MAP, PAGE_TABLE_MAP,
+    PAGE_MAP, PAGE_UNMAP, NUM_INVOCATIONS
+};
+
+const char* invocation_names[NUM_INVOCATIONS] = {
+    "seL4_Untyped_Retype", "seL4_CNode_Copy", "seL4_CNode_Mint", "seL4_CNode_Move", "seL4_CNode_Mutate", "seL4_CNode_Delete",
+    "seL4_TCB_Configure", "seL4_TCB_SetAffinity", "seL4_TCB_SetSchedParams", "seL4_TCB_WriteRegisters", "seL4_TCB_Suspend",
+    "seL4_X86_ASIDControl_MakePool", "seL4_X86_ASIDPool_Assign", "seL4_X86_PDPT_Map", "seL4_X86_PageDirectory_Map", "seL4_X86_PageTable_Map",
+    "seL4_X86_Page_Map", "seL4_X86_Page_Unmap"
+};
+
+struct InvocationCount {
+    seL4_Word calls = 0;
+    seL4_Word failures = 0;
+};
+
+// A deque, so that references to objects stay valid as more are created
+std::deque<Object> objects;
+int64_t root_cnode = -1;
+
+// The boot info, followed by a page of extra boot info
+alignas(seL4_BootInfoFrameSize) unsigned char boot_info_frames[2 * seL4_BootInfoFrameSize];
+
+InvocationCount counts[NUM_INVOCATIONS];
+seL4_Word object_bytes_retyped = 0;
+seL4_Word untyped_bytes_retyped = 0;
+seL4_Word num_asid_pools = 1; // The root task's
+bool finished = false;
+
+// Untypeds a test asked for instead of the default layout
+std::vector<MockUntyped> test_untypeds;
+std::chrono::steady_clock::time_point start_time;
+std::chrono::steady_clock::time_point end_time;
+
+seL4_Error fail(Invocation invocation, seL4_Error error, const char* format, ...) {
+    counts[invocation].failures++;
+    va_list args;
+    va_start(args, format);
+    fprintf(stderr, "mock: %s failed with error %d: ", invocation_names[invocation], error);
+    vfprintf(stderr, format, args);
+    fprintf(stderr, "\n");
+    va_end(args);
+    return error;
+}
+
+seL4_Word getEnvWord(const char* name, seL4_Word default_value) {
+    const char* value = getenv(name);
+    return value ? strtoull(value, nullptr, 0) : default_value;
+}
+
+int64_t newObject(seL4_Word type, seL4_Word size_bits, seL4_Word paddr, bool is_device) {
+    objects.emplace_back();
+    Object& object = objects.back();
+    object.type = type;
+    object.size_bits = size_bits;
+    object.paddr = paddr;
+    object.is_device = is_device;
+    if (type == seL4_CapTableObject) object.slots.resize(BIT(size_bits));
+    return objects.size() - 1;
+}
+
+Cap newCap(int64_t object) {
+    Cap cap;
+    cap.object = object;
+    cap.rights = seL4_AllRights.words[0];
+    return cap;
+}
+
+// Adds delta to the child caps of every untyped the cap's object was retyped from, directly or through other untypeds.
+// The kernel resets an untyped's watermark once it has none left
+void countChildCap(const Cap& cap, int64_t delta) {
+    if (cap.object < 0) return;
+    for (int64_t untyped = objects[cap.object].parent; untyped >= 0; untyped = objects[untyped].parent) {
+        objects[untyped].num_child_caps += delta;
+    }
+}
+
+// Looks up a cptr in the root cnode, whose guard covers all the bits above its radix
+Cap* lookupCap(seL4_CPtr cptr) {
+    std::vector<Cap>& slots = objects[root_cnode].slots;
+    if (cptr >= slots.size()) return nullptr;
+    return &slots[cptr];
+}
+
+Object* lookupObject(seL4_CPtr cptr, seL4_Word type) {
+    Cap* cap = lookupCap(cptr);
+    if (cap == nullptr || cap->object < 0 || objects[cap->object].type != type) return nullptr;
+    return &objects[cap->object];
+}
+
+// Resolves index to depth bits in the cnode that root refers to. Only the radix bits of the index select the slot,
+// the bits above them are the guard
+Cap* lookupSlot(seL4_CPtr root, seL4_Word index, seL4_Word depth) {
+    Object* cnode = lookupObject(root, seL4_CapTableObject);
+    if (cnode == nullptr || depth < cnode->size_bits || depth > seL4_WordBits) return nullptr;
+    if (depth < seL4_WordBits && (index >> depth) != 0) return nullptr;
+    return &cnode->slots[index & (cnode->slots.size() - 1)];
+}
+
+bool isFrameType(seL4_Word type) {
+    return type == seL4_X86_4K || type == seL4_X86_LargePageObject;
+}
+
+// Returns the size of an object in bits, or 0 if it can't be created with the given size
+seL4_Word getObjectSizeBits(seL4_Word type, seL4_Word size_bits) {
+    switch (type) {
+        case seL4_UntypedObject:
+            return (size_bits >= seL4_MinUntypedBits && size_bits <= seL4_MaxUntypedBits) ? size_bits : 0;
+        case seL4_CapTableObject:
+            return (size_bits >= 1 && size_bits <= 28) ? size_bits + seL4_SlotBits : 0;
+        case seL4_TCBObject: return seL4_TCBBits;
+        case seL4_EndpointObject: return seL4_EndpointBits;
+        case seL4_NotificationObject: return seL4_NotificationBits;
+        case seL4_X86_PDPTObject: return seL4_PDPTBits;
+        case seL4_X64_PML4Object: return seL4_PML4Bits;
+        case seL4_X86_4K: return seL4_PageBits;
+        case seL4_X86_LargePageObject: return seL4_LargePageBits;
+        case seL4_X86_PageTableObject: return seL4_PageTableBits;
+        case seL4_X86_PageDirectoryObject: return seL4_PageDirBits;
+        default: return 0;
+    }
+}
+
+seL4_Word mappingKey(MappingLevel level, seL4_Word vaddr) {
+    return ((seL4_Word)level << 56) | (vaddr >> level_shifts[level]);
+}
+
+// Paging structures other than vspaces can only be copied while they're mapped, and vspaces only once they have an ASID
+bool canDerive(const Cap& cap) {
+    switch (objects[cap.object].type) {
+        case seL4_X86_PDPTObject:
+        case seL4_X86_PageDirectoryObject:
+        case seL4_X86_PageTableObject:
+            return cap.mapped_vspace >= 0;
+        case seL4_X64_PML4Object:
+            return objects[cap.object].has_asid;
+        default:
+            return true;
+    }
+}
+
+void unmapCap(Cap* cap) {
+    if (cap->mapped_vspace < 0) return;
+    objects[cap->mapped_vspace].mappings.erase(cap->mapped_key);
+    cap->mapped_vspace = -1;
+}
+
+// Maps a frame or paging structure at the given level, after checking that the level above it is mapped and that
+// nothing is in the way
+seL4_Error mapIntoVSpace(Invocation invocation, seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, MappingLevel level) {
+    counts[invocation].calls++;
+
+    Cap* cap = lookupCap(service);
+    if (cap == nullptr || cap->object < 0) return fail(invocation, seL4_InvalidCapability, "slot %lu is empty", service);
+    Object& object = objects[cap->object];
+    bool type_ok;
+    switch (level) {
+        case PDPT_LEVEL: type_ok = object.type == seL4_X86_PDPTObject; break;
+        case PD_LEVEL: type_ok = object.type == seL4_X86_PageDirectoryObject; break;
+        case PT_LEVEL: type_ok = object.type == seL4_X86_PageTableObject; break;
+        case LARGE_PAGE_LEVEL: type_ok = object.type == seL4_X86_LargePageObject; break;
+        default: type_ok = object.type == seL4_X86_4K; break;
+    }
+    if (!type_ok) return fail(invocation, seL4_InvalidCapability, "slot %lu holds an object of type %lu", service, object.type);
+    if (cap->mapped_vspace >= 0) return fail(invocation, seL4_InvalidCapability, "slot %lu is already mapped", service);
+
+    Cap* vspace_cap = lookupCap(vspace);
+    if (vspace_cap == nullptr || vspace_cap->object < 0 || objects[vspace_cap->object].type != seL4_X64_PML4Object) {
+        return fail(invocation, seL4_InvalidCapability, "slot %lu is not a vspace", vspace);
+    }
+    Object& vspace_object = objects[vspace_cap->object];
+    if (!vspace_object.has_asid) return fail(invocation, seL4_InvalidCapability, "vspace in slot %lu has no ASID", vspace);
+
+    if (vaddr > USER_TOP) return fail(invocation, seL4_InvalidArgument, "vaddr %lx is in the kernel window", vaddr);
+    if (vaddr & (BIT(level_shifts[level]) - 1)) return fail(invocation, seL4_AlignmentError, "vaddr %lx is misaligned", vaddr);
+
+    MappingLevel parent = (level == LARGE_PAGE_LEVEL) ? PD_LEVEL : (level == PAGE_LEVEL) ? PT_LEVEL : (MappingLevel)(level - 1);
+    if (level != PDPT_LEVEL && vspace_object.mappings.count(mappingKey(parent, vaddr)) == 0) {
+        return fail(invocation, seL4_FailedLookup, "nothing to map vaddr %lx into", vaddr);
+    }
+
+    // Page tables and large pages take up the same page directory entries
+    seL4_Word key = mappingKey(level, vaddr);
+    bool occupied = vspace_object.mappings.count(key) != 0;
+    if (level == PT_LEVEL) occupied |= vspace_object.mappings.count(mappingKey(LARGE_PAGE_LEVEL, vaddr)) != 0;
+    if (level == LARGE_PAGE_LEVEL) occupied |= vspace_object.mappings.count(mappingKey(PT_LEVEL, vaddr)) != 0;
+    if (occupied) return fail(invocation, seL4_DeleteFirst, "vaddr %lx is already mapped", vaddr);
+
+    vspace_object.mappings.insert(key);
+    cap->mapped_vspace = vspace_cap->object;
+    cap->mapped_key = key;
+    return seL4_NoError;
+}
+
+seL4_Error copyCap(Invocation invocation, seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                   seL4_Word src_index, uint8_t src_depth, seL4_Word rights, bool set_badge, seL4_Word badge, bool move) {
+    counts[invocation].calls++;
+
+    Cap* dest = lookupSlot(service, dest_index, dest_depth);
+    if (dest == nullptr) return fail(invocation, seL4_FailedLookup, "no dest slot %lu (depth %u) in %lu", dest_index, dest_depth, service);
+    Cap* src = lookupSlot(src_root, src_index, src_depth);
+    if (src == nullptr) return fail(invocation, seL4_FailedLookup, "no src slot %lu (depth %u) in %lu", src_index, src_depth, src_root);
+    if (src->object < 0) return fail(invocation, seL4_FailedLookup, "src slot %lu is empty", src_index);
+    if (dest->object >= 0) return fail(invocation, seL4_DeleteFirst, "dest slot %lu in %lu is occupied", dest_index, service);
+
+    if (move) {
+        *dest = *src;
+        *src = Cap();
+    } else {
+        if (!canDerive(*src)) return fail(invocation, seL4_IllegalOperation, "cap in slot %lu can't be copied yet", src_index);
+        Cap copy = newCap(src->object);
+        copy.rights = src->rights & rights;
+        copy.badge = src->badge;
+        copy.guard = src->guard;
+        *dest = copy;
+        countChildCap(copy, 1);
+    }
+
+    seL4_Word type = objects[dest->object].type;
+    if (set_badge && (type == seL4_EndpointObject || type == seL4_NotificationObject)) dest->badge = badge;
+    if (set_badge && type == seL4_CapTableObject) dest->guard = badge;
+    return seL4_NoError;
+}
+
+bool addUntyped(seL4_BootInfo* bi, seL4_Word paddr, seL4_Word size_bits, bool is_device) {
+    seL4_Word num_untypeds = bi->untyped.end - bi->untyped.start;
+    if (num_untypeds == CONFIG_MAX_NUM_BOOTINFO_UNTYPED_CAPS) return false;
+
+    seL4_UntypedDesc* desc = &bi->untypedList[num_untypeds];
+    desc->paddr = paddr;
+    desc->sizeBits = size_bits;
+    desc->isDevice = is_device;
+    objects[root_cnode].slots[bi->untyped.end++] = newCap(newObject(seL4_UntypedObject, size_bits, paddr, is_device));
+    return true;
+}
+
+void addUntypeds(seL4_BootInfo* bi, seL4_Word start, seL4_Word end, bool is_device) {
+    while (start < end) {
+        // The biggest block that is aligned to its own size and fits
+        seL4_Word size_bits = 63 - __builtin_clzl(end - start);
+        if (start != 0 && (seL4_Word)__builtin_ctzl(start) < size_bits) size_bits = __builtin_ctzl(start);
+        if (size_bits > seL4_MaxUntypedBits) size_bits = seL4_MaxUntypedBits;
+
+        if (!addUntyped(bi, start, size_bits, is_device)) return;
+        start += BIT(size_bits);
+    }
+}
+
+// Frames created for a cache-colored vspace must have one of its colors and be mapped. Returns how many don't
+seL4_Word checkColoredFrames(seL4_Word* num_checked_out) {
+    seL4_BootInfo* bi = (seL4_BootInfo*)boot_info_frames;
+    seL4_Word num_checked = 0;
+    seL4_Word num_wrong = 0;
+    for (seL4_Word op_index = 0; op_index < num_operations; op_index++) {
+        if (cap_operations[op_index].op_type != COLORED_FRAMES_CREATE_OP) continue;
+        const ColoredFramesCreateOperation& op = cap_operations[op_index].colored_frames_create_op;
+        for (seL4_Word i = 0; i < op.num_frames; i++) {
+            Cap* cap = lookupCap(bi->empty.start + op.first_frame + i);
+            bool ok = cap != nullptr && cap->object >= 0 && objects[cap->object].type == op.frame_type && cap->mapped_vspace >= 0 &&
+                      (op.color_mask & BIT((objects[cap->object].paddr >> seL4_PageBits) & (op.num_colors - 1)));
+            if (!ok) num_wrong++;
+            num_checked++;
+        }
+    }
+    *num_checked_out = num_checked;
+    return num_wrong;
+}
+
+// Frames reclaimed from the loader must not be in use by anything else, i.e. mapped anywhere but the loader's own vspace,
+// and there must be as many as the memory info said there would be. Returns how many frames are wrong
+seL4_Word checkReclaimedFrames(seL4_Word* num_checked_out) {
+    seL4_BootInfo* bi = (seL4_BootInfo*)boot_info_frames;
+    int64_t root_vspace = objects[root_cnode].slots[seL4_CapInitThreadVSpace].object;
+    seL4_Word num_checked = 0;
+    seL4_Word num_wrong = 0;
+    for (seL4_Word op_index = 0; op_index < num_operations; op_index++) {
+        if (cap_operations[op_index].op_type != RECLAIM_LOADER_MEMORY_OP) continue;
+        const ReclaimLoaderMemoryOperation& op = cap_operations[op_index].reclaim_loader_memory_op;
+        Object* cnode = lookupObject(bi->empty.start + op.cnode_dest, seL4_CapTableObject);
+        if (cnode == nullptr) continue;
+        for (seL4_Word slot = op.start_slot; slot < op.end_slot; slot++) {
+            const Cap& cap = cnode->slots[slot];
+            if (cap.object < 0) continue;
+            bool ok = isFrameType(objects[cap.object].type) && (cap.mapped_vspace < 0 || cap.mapped_vspace == root_vspace);
+            if (!ok) num_wrong++;
+            num_checked++;
+        }
+        if (num_checked != gp_memory_info.num_reclaimed_frames) {
+            fprintf(stderr, "mock: %lu reclaimed frames were recorded, but %lu were moved\n", gp_memory_info.num_reclaimed_frames, num_checked);
+            num_wrong += (num_checked > gp_memory_info.num_reclaimed_frames) ? num_checked - gp_memory_info.num_reclaimed_frames
+                                                                             : gp_memory_info.num_reclaimed_frames - num_checked;
+        }
+    }
+    *num_checked_out = num_checked;
+    return num_wrong;
+}
+
+void printSummary() {
+    double elapsed_ms = std::chrono::duration<double, std::milli>(end_time - start_time).count();
+    seL4_Word total_calls = 0;
+    for (const InvocationCount& count : counts) total_calls += count.calls;
+
+    fprintf(stderr, "mock: loader %s in %.3f ms, %lu invocations\n", finished ? "finished" : "halted", elapsed_ms, total_calls);
+    for (int i = 0; i < NUM_INVOCATIONS; i++) {
+        if (counts[i].calls == 0) continue;
+        fprintf(stderr, "mock:   %s: %lu (%lu failed)\n", invocation_names[i], counts[i].calls, counts[i].failures);
+    }
+
+    seL4_Word threads_started = 0;
+    for (const Object& object : objects) {
+        if (object.type == seL4_TCBObject && object.resumed) threads_started++;
+    }
+    // The root thread itself is always running
+    threads_started--;
+    fprintf(stderr, "mock: %lu bytes retyped into objects, %lu bytes into untypeds, %lu threads started\n",
+            object_bytes_retyped, untyped_bytes_retyped, threads_started);
+}
+
+} // namespace
+
+// Builds the root cnode, the initial caps and a boot info describing them. The amount of RAM and the size of the root
+// cnode can be changed with TAILSPRING_HOST_RAM_MB and TAILSPRING_HOST_CNODE_BITS. A framebuffer is described in the
+// extra boot info unless TAILSPRING_HOST_FRAMEBUFFER is 0
+seL4_BootInfo* platsupport_get_bootinfo(void) {
+    seL4_BootInfo* bi = (seL4_BootInfo*)boot_info_frames;
+    if (root_cnode >= 0) return bi;
+
+    seL4_Word cnode_bits = getEnvWord("TAILSPRING_HOST_CNODE_BITS", DEFAULT_CNODE_BITS);
+    seL4_Word ram_bytes = getEnvWord("TAILSPRING_HOST_RAM_MB", DEFAULT_RAM_MB) << 20;
+    // RAM stops below the 32-bit device window
+    if (ram_bytes > 0xc0000000) ram_bytes = 0xc0000000;
+
+    root_cnode = newObject(seL4_CapTableObject, cnode_bits, 0, false);
+    std::vector<Cap>& root_slots = objects[root_cnode].slots;
+
+    Object& root_tcb = objects[newObject(seL4_TCBObject, seL4_TCBBits, 0, false)];
+    root_tcb.configured = root_tcb.resumed = true;
+    root_tcb.mcp = seL4_MaxPrio;
+    root_slots[seL4_CapInitThreadTCB] = newCap(objects.size() - 1);
+    root_slots[seL4_CapInitThreadCNode] = newCap(root_cnode);
+    int64_t root_vspace = newObject(seL4_X64_PML4Object, seL4_PML4Bits, 0, false);
+    objects[root_vspace].has_asid = true;
+    root_slots[seL4_CapInitThreadVSpace] = newCap(root_vspace);
+    root_slots[seL4_CapIRQControl] = newCap(newObject(OtherObject, 0, 0, false));
+    root_slots[seL4_CapASIDControl] = newCap(newObject(ASIDControlObject, 0, 0, false));
+    int64_t root_pool = newObject(ASIDPoolObject, seL4_ASIDPoolBits, 0, false);
+    objects[root_pool].asids_used = 1; // The root vspace
+    root_slots[seL4_CapInitThreadASIDPool] = newCap(root_pool);
+    root_slots[seL4_CapBootInfoFrame] = newCap(newObject(seL4_X86_4K, seL4_PageBits, 0, false));
+    root_slots[seL4_CapInitThreadIPCBuffer] = newCap(newObject(seL4_X86_4K, seL4_PageBits, 0, false));
+
+    memset(bi, 0, sizeof(*bi));
+    bi->numNodes = CONFIG_MAX_NUM_NODES;
+    bi->initThreadCNodeSizeBits = cnode_bits;
+
+    // Every page of the loader binary is an image frame, mapped where it is in this process
+    seL4_Word image_start = (seL4_Word)&_lowest_vaddr;
+    seL4_Word num_image_frames = ((seL4_Word)_end - image_start + BIT(seL4_PageBits) - 1) >> seL4_PageBits;
+    bi->userImageFrames.start = seL4_NumInitialCaps;
+    bi->userImageFrames.end = bi->userImageFrames.start + num_image_frames;
+    for (seL4_Word i = 0; i < num_image_frames; i++) {
+        seL4_Word vaddr = image_start + (i << seL4_PageBits);
+        Cap cap = newCap(newObject(seL4_X86_4K, seL4_PageBits, 0, false));
+        for (int level = PDPT_LEVEL; level <= PT_LEVEL; level++) {
+            objects[root_vspace].mappings.insert(mappingKey((MappingLevel)level, vaddr));
+        }
+        cap.mapped_vspace = root_vspace;
+        cap.mapped_key = mappingKey(PAGE_LEVEL, vaddr);
+        objects[root_vspace].mappings.insert(cap.mapped_key);
+        root_slots[bi->userImageFrames.start + i] = cap;
+    }
+
+    // Laid out like a PC: RAM below 640K and from 1M on (minus what the kernel and loader use), legacy video memory and
+    // the 32-bit device window
+    bi->untyped.start = bi->untyped.end = bi->userImageFrames.end;
+    if (!test_untypeds.empty()) {
+        for (const MockUntyped& untyped : test_untypeds) addUntyped(bi, untyped.paddr, untyped.size_bits, untyped.is_device);
+    } else {
+        addUntypeds(bi, 0x1000, 0x9f000, false);
+        addUntypeds(bi, 0xa0000, 0x100000, true);
+        addUntypeds(bi, 0x800000, ram_bytes, false);
+        addUntypeds(bi, ram_bytes, 0x100000000, true);
+    }
+
+    bi->empty.start = bi->untyped.end;
+    bi->empty.end = BIT(cnode_bits);
+
+    if (getEnvWord("TAILSPRING_HOST_FRAMEBUFFER", 1)) {
+        seL4_X86_BootInfo_fb_t* fb = (seL4_X86_BootInfo_fb_t*)(boot_info_frames + seL4_BootInfoFrameSize);
+        fb->header.id = SEL4_BOOTINFO_HEADER_X86_FRAMEBUFFER;
+        fb->header.len = sizeof(*fb);
+        fb->fb_info = {0xfd000000, 1024 * 4, 1024, 768, 32, 1};
+        bi->extraLen = sizeof(*fb);
+    }
+
+    start_time = std::chrono::steady_clock::now();
+    return bi;
+}
+
+seL4_Error seL4_Untyped_Retype(seL4_CPtr service, seL4_Word type, seL4_Word size_bits, seL4_CPtr root,
+                               seL4_Word node_index, seL4_Word node_depth, seL4_Word node_offset, seL4_Word num_objects) {
+    counts[UNTYPED_RETYPE].calls++;
+
+    Object* untyped = lookupObject(service, seL4_UntypedObject);
+    if (untyped == nullptr) return fail(UNTYPED_RETYPE, seL4_InvalidCapability, "slot %lu is not an untyped", service);
+    int64_t untyped_index = lookupCap(service)->object;
+
+    seL4_Word object_bits = getObjectSizeBits(type, size_bits);
+    if (object_bits == 0) return fail(UNTYPED_RETYPE, seL4_InvalidArgument, "can't create type %lu with size %lu", type, size_bits);
+    if (untyped->is_device && type != seL4_UntypedObject && !isFrameType(type)) {
+        return fail(UNTYPED_RETYPE, seL4_InvalidArgument, "type %lu can't be created from device memory", type);
+    }
+    if (num_objects == 0 || num_objects > CONFIG_RETYPE_FAN_OUT_LIMIT) return fail(UNTYPED_RETYPE, seL4_RangeError, "can't create %lu objects", num_objects);
+
+    Object* dest_cnode;
+    if (node_depth == 0) {
+        dest_cnode = lookupObject(root, seL4_CapTableObject);
+    } else {
+        Cap* slot = lookupSlot(root, node_index, node_depth);
+        dest_cnode = (slot == nullptr || slot->object < 0 || objects[slot->object].type != seL4_CapTableObject) ? nullptr : &objects[slot->object];
+    }
+    if (dest_cnode == nullptr) return fail(UNTYPED_RETYPE, seL4_FailedLookup, "no dest cnode at %lu (depth %lu)", node_index, node_depth);
+    if (node_offset + num_objects > dest_cnode->slots.size()) {
+        return fail(UNTYPED_RETYPE, seL4_RangeError, "slots %lu-%lu are outside the dest cnode", node_offset, node_offset + num_objects);
+    }
+    for (seL4_Word i = 0; i < num_objects; i++) {
+        if (dest_cnode->slots[node_offset + i].object >= 0) {
+            return fail(UNTYPED_RETYPE, seL4_DeleteFirst, "dest slot %lu is occupied", node_offset + i);
+        }
+    }
+
+    // Objects are placed at the watermark, aligned up to their size. Like the kernel, an untyped without children starts over
+    if (untyped->num_child_caps == 0) untyped->watermark = 0;
+    seL4_Word offset = (untyped->watermark + BIT(object_bits) - 1) & ~(BIT(object_bits) - 1);
+    if (offset + (num_objects << object_bits) > BIT(untyped->size_bits)) {
+        return fail(UNTYPED_RETYPE, seL4_NotEnoughMemory, "untyped in slot %lu has %lu of %lu bytes left", service,
+                    BIT(untyped->size_bits) - untyped->watermark, BIT(untyped->size_bits));
+    }
+
+    bool is_device = untyped->is_device;
+    seL4_Word paddr = untyped->paddr + offset;
+    untyped->watermark = offset + (num_objects << object_bits);
+    (type == seL4_UntypedObject ? untyped_bytes_retyped : object_bytes_retyped) += num_objects << object_bits;
+
+    for (seL4_Word i = 0; i < num_objects; i++) {
+        // Creating objects can grow the deque, but references into it stay valid
+        int64_t object = newObject(type, type == seL4_CapTableObject ? size_bits : object_bits, paddr + (i << object_bits), is_device);
+        objects[object].parent = untyped_index;
+        dest_cnode->slots[node_offset + i] = newCap(object);
+        countChildCap(dest_cnode->slots[node_offset + i], 1);
+    }
+    return seL4_NoError;
+}
+
+seL4_Error seL4_CNode_Copy(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth, seL4_CapRights_t rights) {
+    return copyCap(CNODE_COPY, service, dest_index, dest_depth, src_root, src_index, src_depth, rights.words[0], false, 0, false);
+}
+
+seL4_Error seL4_CNode_Mint(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth, seL4_CapRights_t rights, seL4_Word badge) {
+    return copyCap(CNODE_MINT, service, dest_index, dest_depth, src_root, src_index, src_depth, rights.words[0], true, badge, false);
+}
+
+seL4_Error seL4_CNode_Move(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                           seL4_Word src_index, uint8_t src_depth) {
+    return copyCap(CNODE_MOVE, service, dest_index, dest_depth, src_root, src_index, src_depth, 0, false, 0, true);
+}
+
+seL4_Error seL4_CNode_Mutate(seL4_CPtr service, seL4_Word dest_index, uint8_t dest_depth, seL4_CPtr src_root,
+                             seL4_Word src_index, uint8_t src_depth, seL4_Word badge) {
+    return copyCap(CNODE_MUTATE, service, dest_index, dest_depth, src_root, src_index, src_depth, 0, true, badge, true);
+}
+
+seL4_Error seL4_CNode_Delete(seL4_CPtr service, seL4_Word index, uint8_t depth) {
+    counts[CNODE_DELETE].calls++;
+    Cap* cap = lookupSlot(service, index, depth);
+    if (cap == nullptr) return fail(CNODE_DELETE, seL4_FailedLookup, "no slot %lu (depth %u) in %lu", index, depth, service);
+    unmapCap(cap);
+    countChildCap(*cap, -1);
+    *cap = Cap();
+    return seL4_NoError;
+}
+
+seL4_Error seL4_TCB_Configure(seL4_CPtr service, seL4_Word fault_ep, seL4_CPtr cspace_root, seL4_Word cspace_root_data,
+                              seL4_CPtr vspace_root, seL4_Word vspace_root_data, seL4_Word buffer, seL4_CPtr bufferFrame) {
+    counts[TCB_CONFIGURE].calls++;
+    Object* tcb = lookupObject(service, seL4_TCBObject);
+    if (tcb == nullptr) return fail(TCB_CONFIGURE, seL4_InvalidCapability, "slot %lu is not a TCB", service);
+    if (lookupObject(cspace_root, seL4_CapTableObject) == nullptr) {
+        return fail(TCB_CONFIGURE, seL4_InvalidCapability, "slot %lu is not a cnode", cspace_root);
+    }
+    Object* vspace = lookupObject(vspace_root, seL4_X64_PML4Object);
+    if (vspace == nullptr || !vspace->has_asid) {
+        return fail(TCB_CONFIGURE, seL4_InvalidCapability, "slot %lu is not a vspace with an ASID", vspace_root);
+    }
+    if (buffer & (BIT(seL4_IPCBufferSizeBits) - 1)) return fail(TCB_CONFIGURE, seL4_AlignmentError, "IPC buffer %lx is misaligned", buffer);
+    Cap* buffer_cap = lookupCap(bufferFrame);
+    if (buffer_cap == nullptr || buffer_cap->object < 0 || !isFrameType(objects[buffer_cap->object].type)) {
+        return fail(TCB_CONFIGURE, seL4_InvalidCapability, "slot %lu is not a frame", bufferFrame);
+    }
+    tcb->configured = true;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_TCB_SetAffinity(seL4_CPtr service, seL4_Word affinity) {
+    counts[TCB_SET_AFFINITY].calls++;
+    if (lookupObject(service, seL4_TCBObject) == nullptr) return fail(TCB_SET_AFFINITY, seL4_InvalidCapability, "slot %lu is not a TCB", service);
+    if (affinity >= CONFIG_MAX_NUM_NODES) return fail(TCB_SET_AFFINITY, seL4_InvalidArgument, "there is no core %lu", affinity);
+    return seL4_NoError;
+}
+
+seL4_Error seL4_TCB_SetSchedParams(seL4_CPtr service, seL4_CPtr authority, seL4_Word mcp, seL4_Word priority) {
+    counts[TCB_SET_SCHED_PARAMS].calls++;
+    Object* tcb = lookupObject(service, seL4_TCBObject);
+    Object* authority_tcb = lookupObject(authority, seL4_TCBObject);
+    if (tcb == nullptr || authority_tcb == nullptr) {
+        return fail(TCB_SET_SCHED_PARAMS, seL4_InvalidCapability, "slot %lu or %lu is not a TCB", service, authority);
+    }
+    if (mcp > authority_tcb->mcp || priority > authority_tcb->mcp) {
+        return fail(TCB_SET_SCHED_PARAMS, seL4_RangeError, "priority %lu/%lu is above the authority's %lu", priority, mcp, authority_tcb->mcp);
+    }
+    tcb->mcp = mcp;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_TCB_WriteRegisters(seL4_CPtr service, bool resume_target, uint8_t arch_flags, seL4_Word count,
+                                   seL4_UserContext* regs) {
+    counts[TCB_WRITE_REGISTERS].calls++;
+    Object* tcb = lookupObject(service, seL4_TCBObject);
+    if (tcb == nullptr) return fail(TCB_WRITE_REGISTERS, seL4_InvalidCapability, "slot %lu is not a TCB", service);
+    if (resume_target && !tcb->configured) return fail(TCB_WRITE_REGISTERS, seL4_IllegalOperation, "TCB in slot %lu was never configured", service);
+    if (resume_target) tcb->resumed = true;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_TCB_Suspend(seL4_CPtr service) {
+    counts[TCB_SUSPEND].calls++;
+    if (service == seL4_CapInitThreadTCB) {
+        if (!finished) end_time = std::chrono::steady_clock::now();
+        printSummary();
+        if (finished) {
+            seL4_Word num_checked;
+            seL4_Word num_wrong = checkColoredFrames(&num_checked);
+            if (num_checked > 0) fprintf(stderr, "mock: %lu colored frames checked, %lu wrong\n", num_checked, num_wrong);
+            if (num_wrong > 0) exit(EXIT_FAILURE);
+            num_wrong = checkReclaimedFrames(&num_checked);
+            if (num_checked > 0) fprintf(stderr, "mock: %lu reclaimed frames checked, %lu in use\n", num_checked, num_wrong);
+            if (num_wrong > 0) exit(EXIT_FAILURE);
+        }
+        exit(finished ? EXIT_SUCCESS : EXIT_FAILURE);
+    }
+    Object* tcb = lookupObject(service, seL4_TCBObject);
+    if (tcb == nullptr) return fail(TCB_SUSPEND, seL4_InvalidCapability, "slot %lu is not a TCB", service);
+    tcb->resumed = false;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_X86_ASIDControl_MakePool(seL4_CPtr service, seL4_CPtr untyped, seL4_CPtr root, seL4_Word index, uint8_t depth) {
+    counts[ASID_CONTROL_MAKE_POOL].calls++;
+    if (lookupObject(service, ASIDControlObject) == nullptr) {
+        return fail(ASID_CONTROL_MAKE_POOL, seL4_InvalidCapability, "slot %lu is not the ASID control cap", service);
+    }
+    // The root task's pool takes up one of the kernel's pool slots
+    if (num_asid_pools == BIT(seL4_NumASIDPoolsBits)) return fail(ASID_CONTROL_MAKE_POOL, seL4_DeleteFirst, "no room for another ASID pool");
+
+    Object* untyped_object = lookupObject(untyped, seL4_UntypedObject);
+    if (untyped_object == nullptr || untyped_object->size_bits != seL4_ASIDPoolBits || untyped_object->is_device) {
+        return fail(ASID_CONTROL_MAKE_POOL, seL4_InvalidCapability, "slot %lu is not a non-device untyped of %u bits", untyped, seL4_ASIDPoolBits);
+    }
+    if (untyped_object->num_child_caps != 0) return fail(ASID_CONTROL_MAKE_POOL, seL4_RevokeFirst, "untyped in slot %lu has children", untyped);
+
+    Cap* dest = lookupSlot(root, index, depth);
+    if (dest == nullptr) return fail(ASID_CONTROL_MAKE_POOL, seL4_FailedLookup, "no slot at %lu (depth %u)", index, depth);
+    if (dest->object >= 0) return fail(ASID_CONTROL_MAKE_POOL, seL4_DeleteFirst, "dest slot %lu is occupied", index);
+
+    untyped_object->watermark = BIT(seL4_ASIDPoolBits);
+    num_asid_pools++;
+    int64_t pool = newObject(ASIDPoolObject, seL4_ASIDPoolBits, untyped_object->paddr, false);
+    objects[pool].parent = lookupCap(untyped)->object;
+    *dest = newCap(pool);
+    countChildCap(*dest, 1);
+    return seL4_NoError;
+}
+
+seL4_Error seL4_X86_ASIDPool_Assign(seL4_CPtr service, seL4_CPtr vspace) {
+    counts[ASID_POOL_ASSIGN].calls++;
+    Object* pool = lookupObject(service, ASIDPoolObject);
+    if (pool == nullptr) return fail(ASID_POOL_ASSIGN, seL4_InvalidCapability, "slot %lu is not an ASID pool", service);
+    Object* vspace_object = lookupObject(vspace, seL4_X64_PML4Object);
+    if (vspace_object == nullptr || vspace_object->has_asid) {
+        return fail(ASID_POOL_ASSIGN, seL4_InvalidCapability, "slot %lu is not a vspace without an ASID", vspace);
+    }
+    if (pool->asids_used == BIT(seL4_ASIDPoolIndexBits)) return fail(ASID_POOL_ASSIGN, seL4_DeleteFirst, "ASID pool in slot %lu is full", service);
+    pool->asids_used++;
+    vspace_object->has_asid = true;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_X86_PDPT_Map(seL4_CPtr service, seL4_CPtr pml4, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    return mapIntoVSpace(PDPT_MAP, service, pml4, vaddr, PDPT_LEVEL);
+}
+
+seL4_Error seL4_X86_PageDirectory_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    return mapIntoVSpace(PAGE_DIRECTORY_MAP, service, vspace, vaddr, PD_LEVEL);
+}
+
+seL4_Error seL4_X86_PageTable_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    return mapIntoVSpace(PAGE_TABLE_MAP, service, vspace, vaddr, PT_LEVEL);
+}
+
+seL4_Error seL4_X86_Page_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_CapRights_t rights,
+                             seL4_X86_VMAttributes attr) {
+    Cap* cap = lookupCap(service);
+    bool is_large = cap != nullptr && cap->object >= 0 && objects[cap->object].type == seL4_X86_LargePageObject;
+    return mapIntoVSpace(PAGE_MAP, service, vspace, vaddr, is_large ? LARGE_PAGE_LEVEL : PAGE_LEVEL);
+}
+
+seL4_Error seL4_X86_Page_Unmap(seL4_CPtr service) {
+    counts[PAGE_UNMAP].calls++;
+    Cap* cap = lookupCap(service);
+    if (cap == nullptr || cap->object < 0 || !isFrameType(objects[cap->object].type)) {
+        return fail(PAGE_UNMAP, seL4_InvalidCapability, "slot %lu is not a frame", service);
+    }
+    unmapCap(cap);
+    return seL4_NoError;
+}
+
+// Only called once the loader has run every operation
+void seL4_DebugDumpScheduler(void) {
+    finished = true;
+    end_time = std::chrono::steady_clock::now();
+}
+
+void mockReset(const MockUntyped* untypeds, seL4_Word num_untypeds) {
+    objects.clear();
+    root_cnode = -1;
+    for (InvocationCount& count : counts) count = InvocationCount();
+    object_bytes_retyped = 0;
+    untyped_bytes_retyped = 0;
+    num_asid_pools = 1;
+    finished = false;
+    test_untypeds.assign(untypeds, untypeds + num_untypeds);
+}
+
+bool mockGetObject(seL4_CPtr root, seL4_Word index, seL4_Word depth, MockObjectInfo* info_out) {
+    Cap* cap = lookupSlot(root, index, depth);
+    if (cap == nullptr || cap->object < 0) return false;
+    const Object& object = objects[cap->object];
+    info_out->type = object.type;
+    info_out->paddr = object.paddr;
+    info_out->size_bits = object.size_bits;
+    return true;
+}
+
+bool mockIsMapped(seL4_CPtr frame, seL4_CPtr vspace, seL4_Word vaddr) {
+    Cap* cap = lookupCap(frame);
+    Cap* vspace_cap = lookupCap(vspace);
+    if (cap == nullptr || cap->object < 0 || vspace_cap == nullptr || vspace_cap->object < 0) return false;
+    MappingLevel level = (objects[cap->object].type == seL4_X86_LargePageObject) ? LARGE_PAGE_LEVEL : PAGE_LEVEL;
+    return cap->mapped_vspace == vspace_cap->object && cap->mapped_key == mappingKey(level, vaddr);
+}
+
+seL4_Word mockNumFailures() {
+    seL4_Word num_failures = 0;
+    for (const InvocationCount& count : counts) num_failures += count.failures;
+    return num_failures;
+}
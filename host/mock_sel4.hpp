@@ -0,0 +1,34 @@
+#pragma once
+
+// Lets host tests set up the mock kernel and look at what the loader made of it. The host build of the loader itself
+// doesn't use these
+
+extern "C" {
+#include <sel4/sel4.h>
+}
+
+struct MockUntyped {
+    seL4_Word paddr;
+    seL4_Word size_bits;
+    bool is_device;
+};
+
+struct MockObjectInfo {
+    seL4_Word type;
+    seL4_Word paddr;
+    seL4_Word size_bits;
+};
+
+// Throws away every object and cap, so that the next platsupport_get_bootinfo call builds a new root cnode and boot info.
+// The boot info lists exactly the given untypeds, or the default layout if there are none
+void mockReset(const MockUntyped* untypeds, seL4_Word num_untypeds);
+
+// Looks up index to depth bits in the cnode in slot root of the root cnode, and describes the object the cap there refers
+// to. Returns false if there is no such slot or it is empty
+bool mockGetObject(seL4_CPtr root, seL4_Word index, seL4_Word depth, MockObjectInfo* info_out);
+
+// Whether the frame in slot frame of the root cnode is mapped into the vspace in slot vspace at vaddr
+bool mockIsMapped(seL4_CPtr frame, seL4_CPtr vspace, seL4_Word vaddr);
+
+// How many invocations have failed since the last reset
+seL4_Word mockNumFailures();
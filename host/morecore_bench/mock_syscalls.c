@@ -0,0 +1,234 @@
+#include "mock_syscalls.h"
+
+#include <stdarg.h>
+#include <stdbool.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+// Paging structures and pages mapped into the vspace are keyed by their level and the vaddr bits above what they cover
+enum MappingLevel { PDPT_LEVEL = 1, PD_LEVEL, PT_LEVEL, LARGE_PAGE_LEVEL, PAGE_LEVEL };
+static const seL4_Word level_shifts[] = {0, 39, 30, 21, 21, 12};
+
+// Highest vaddr user mappings can go at
+#define USER_TOP 0x00007fffffffffffUL
+
+typedef struct {
+    int type; // -1 if the slot is empty
+    seL4_Word watermark; // Untypeds: bytes retyped so far
+    seL4_Word size_bits; // Untypeds
+    seL4_Word mapped_key; // Frames and paging structures: 0 if not mapped
+} MockSlot;
+
+// Open addressing, with 0 marking an empty entry and TOMBSTONE one whose mapping was removed
+#define MAPPINGS_BITS 20
+#define MAPPINGS_SIZE (1UL << MAPPINGS_BITS)
+#define TOMBSTONE (~0UL)
+
+const char* mock_invocation_names[MOCK_NUM_INVOCATIONS] = {
+    "seL4_Untyped_Retype", "seL4_CNode_Delete", "seL4_X86_PDPT_Map", "seL4_X86_PageDirectory_Map", "seL4_X86_PageTable_Map",
+    "seL4_X86_Page_Map"
+};
+
+MockCounts mock_counts;
+
+static MockSlot slots[MOCK_NUM_SLOTS];
+static seL4_Word mappings[MAPPINGS_SIZE];
+static seL4_Word num_mappings = 0;
+static seL4_Word failed_lookup_level = 0;
+
+static seL4_Error fail(MockInvocation invocation, seL4_Error error, const char* format, ...) {
+    mock_counts.failures[invocation]++;
+    va_list args;
+    va_start(args, format);
+    fprintf(stderr, "mock: %s failed with error %d: ", mock_invocation_names[invocation], error);
+    vfprintf(stderr, format, args);
+    fprintf(stderr, "\n");
+    va_end(args);
+    return error;
+}
+
+static MockSlot* lookup_slot(seL4_CPtr cptr) {
+    return (cptr < MOCK_NUM_SLOTS) ? &slots[cptr] : NULL;
+}
+
+static bool slot_has_type(seL4_CPtr cptr, int type) {
+    MockSlot* slot = lookup_slot(cptr);
+    return slot != NULL && slot->type == type;
+}
+
+static seL4_Word mapping_key(enum MappingLevel level, seL4_Word vaddr) {
+    return ((seL4_Word)level << 56) | (vaddr >> level_shifts[level]);
+}
+
+static seL4_Word* find_mapping(seL4_Word key, bool for_insert) {
+    seL4_Word index = (key * 0x9e3779b97f4a7c15UL) >> (64 - MAPPINGS_BITS);
+    while (mappings[index] != 0 && mappings[index] != key) {
+        if (for_insert && mappings[index] == TOMBSTONE) break;
+        index = (index + 1) & (MAPPINGS_SIZE - 1);
+    }
+    return &mappings[index];
+}
+
+static bool is_mapped(enum MappingLevel level, seL4_Word vaddr) {
+    return *find_mapping(mapping_key(level, vaddr), false) != 0;
+}
+
+static void add_mapping(seL4_Word key) {
+    if (++num_mappings > MAPPINGS_SIZE / 2) {
+        fprintf(stderr, "mock: more than %lu mappings\n", MAPPINGS_SIZE / 2);
+        exit(EXIT_FAILURE);
+    }
+    *find_mapping(key, true) = key;
+}
+
+static void remove_mapping(seL4_Word key) {
+    *find_mapping(key, false) = TOMBSTONE;
+    num_mappings--;
+}
+
+static seL4_Word get_object_size_bits(seL4_Word type) {
+    switch (type) {
+        case seL4_X86_4K: return seL4_PageBits;
+        case seL4_X86_LargePageObject: return seL4_LargePageBits;
+        case seL4_X86_PageTableObject: return seL4_PageTableBits;
+        case seL4_X86_PageDirectoryObject: return seL4_PageDirBits;
+        case seL4_X86_PDPTObject: return seL4_PDPTBits;
+        default: return 0;
+    }
+}
+
+
+void mock_reset(seL4_CPtr cnode_slot, seL4_CPtr vspace_slot) {
+    for (seL4_Word i = 0; i < MOCK_NUM_SLOTS; i++) {
+        slots[i] = (MockSlot){.type = -1};
+    }
+    for (seL4_Word i = 0; i < MAPPINGS_SIZE; i++) {
+        mappings[i] = 0;
+    }
+    num_mappings = 0;
+    mock_counts = (MockCounts){0};
+
+    slots[cnode_slot].type = seL4_CapTableObject;
+    slots[vspace_slot].type = seL4_X64_PML4Object;
+}
+
+void mock_add_untyped(seL4_CPtr slot, seL4_Word size_bits) {
+    slots[slot] = (MockSlot){.type = seL4_UntypedObject, .size_bits = size_bits};
+}
+
+
+// Objects are only ever retyped straight into the cnode, which the lib's allocator does by passing a depth of 0
+seL4_Error seL4_Untyped_Retype(seL4_CPtr service, seL4_Word type, seL4_Word size_bits, seL4_CPtr root,
+                               seL4_Word node_index, seL4_Word node_depth, seL4_Word node_offset, seL4_Word num_objects) {
+    (void)size_bits;
+    mock_counts.calls[MOCK_UNTYPED_RETYPE]++;
+
+    if (!slot_has_type(service, seL4_UntypedObject)) return fail(MOCK_UNTYPED_RETYPE, seL4_InvalidCapability, "slot %lu is not an untyped", service);
+    if (!slot_has_type(root, seL4_CapTableObject) || node_index != 0 || node_depth != 0) {
+        return fail(MOCK_UNTYPED_RETYPE, seL4_FailedLookup, "destination is not the cnode in slot %lu", root);
+    }
+    seL4_Word object_size_bits = get_object_size_bits(type);
+    if (object_size_bits == 0) return fail(MOCK_UNTYPED_RETYPE, seL4_InvalidArgument, "type %lu is not supported", type);
+    if (num_objects == 0 || num_objects > CONFIG_RETYPE_FAN_OUT_LIMIT) {
+        return fail(MOCK_UNTYPED_RETYPE, seL4_RangeError, "%lu objects requested", num_objects);
+    }
+    if (node_offset + num_objects > MOCK_NUM_SLOTS) return fail(MOCK_UNTYPED_RETYPE, seL4_RangeError, "slot %lu is out of range", node_offset);
+    for (seL4_Word i = 0; i < num_objects; i++) {
+        if (slots[node_offset + i].type != -1) return fail(MOCK_UNTYPED_RETYPE, seL4_DeleteFirst, "slot %lu is not empty", node_offset + i);
+    }
+
+    MockSlot* untyped = &slots[service];
+    seL4_Word object_size = 1UL << object_size_bits;
+    seL4_Word start = (untyped->watermark + object_size - 1) & ~(object_size - 1);
+    if (start + num_objects * object_size > (1UL << untyped->size_bits)) {
+        return fail(MOCK_UNTYPED_RETYPE, seL4_NotEnoughMemory, "untyped in slot %lu has %lu bytes left", service,
+                    (1UL << untyped->size_bits) - untyped->watermark);
+    }
+    untyped->watermark = start + num_objects * object_size;
+
+    for (seL4_Word i = 0; i < num_objects; i++) {
+        slots[node_offset + i] = (MockSlot){.type = (int)type};
+    }
+    return seL4_NoError;
+}
+
+seL4_Error seL4_CNode_Delete(seL4_CPtr service, seL4_Word index, uint8_t depth) {
+    mock_counts.calls[MOCK_CNODE_DELETE]++;
+
+    if (!slot_has_type(service, seL4_CapTableObject) || depth != seL4_WordBits) {
+        return fail(MOCK_CNODE_DELETE, seL4_FailedLookup, "slot %lu is not the cnode, or depth %u is wrong", service, depth);
+    }
+    MockSlot* slot = lookup_slot(index);
+    if (slot == NULL) return fail(MOCK_CNODE_DELETE, seL4_RangeError, "slot %lu is out of range", index);
+
+    if (slot->mapped_key != 0) remove_mapping(slot->mapped_key);
+    *slot = (MockSlot){.type = -1};
+    return seL4_NoError;
+}
+
+// Maps a frame or paging structure at the given level. If a structure above it is missing, the lookup level is set to
+// the number of vaddr bits the highest missing one covers, the same as the kernel does
+static seL4_Error map_into_vspace(MockInvocation invocation, seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, enum MappingLevel level) {
+    mock_counts.calls[invocation]++;
+
+    static const int level_types[] = {0, seL4_X86_PDPTObject, seL4_X86_PageDirectoryObject, seL4_X86_PageTableObject,
+                                      seL4_X86_LargePageObject, seL4_X86_4K};
+    if (!slot_has_type(service, level_types[level])) return fail(invocation, seL4_InvalidCapability, "slot %lu has the wrong type", service);
+    MockSlot* slot = lookup_slot(service);
+    if (slot->mapped_key != 0) return fail(invocation, seL4_InvalidCapability, "slot %lu is already mapped", service);
+    if (!slot_has_type(vspace, seL4_X64_PML4Object)) return fail(invocation, seL4_InvalidCapability, "slot %lu is not a vspace", vspace);
+
+    if (vaddr > USER_TOP) return fail(invocation, seL4_InvalidArgument, "vaddr %lx is in the kernel window", vaddr);
+    if (vaddr & ((1UL << level_shifts[level]) - 1)) return fail(invocation, seL4_AlignmentError, "vaddr %lx is misaligned", vaddr);
+
+    // Pages are mapped into the lowest structure that can hold them
+    enum MappingLevel lowest_parent = (level == PAGE_LEVEL) ? PT_LEVEL : (level == LARGE_PAGE_LEVEL) ? PD_LEVEL : level - 1;
+    for (enum MappingLevel parent = PDPT_LEVEL; parent <= lowest_parent; parent++) {
+        if (!is_mapped(parent, vaddr)) {
+            // This is how the morecore finds out which paging structures to create, so it isn't printed
+            failed_lookup_level = level_shifts[parent];
+            mock_counts.failures[invocation]++;
+            return seL4_FailedLookup;
+        }
+    }
+
+    // Page tables and large pages take up the same page directory entries
+    bool occupied = is_mapped(level, vaddr);
+    if (level == PT_LEVEL) occupied |= is_mapped(LARGE_PAGE_LEVEL, vaddr);
+    if (level == LARGE_PAGE_LEVEL) occupied |= is_mapped(PT_LEVEL, vaddr);
+    if (occupied) return fail(invocation, seL4_DeleteFirst, "vaddr %lx is already mapped", vaddr);
+
+    slot->mapped_key = mapping_key(level, vaddr);
+    add_mapping(slot->mapped_key);
+    if (level == PAGE_LEVEL) mock_counts.pages_mapped++;
+    if (level == LARGE_PAGE_LEVEL) mock_counts.large_pages_mapped++;
+    return seL4_NoError;
+}
+
+seL4_Error seL4_X86_PDPT_Map(seL4_CPtr service, seL4_CPtr pml4, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    (void)attr;
+    return map_into_vspace(MOCK_PDPT_MAP, service, pml4, vaddr, PDPT_LEVEL);
+}
+
+seL4_Error seL4_X86_PageDirectory_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    (void)attr;
+    return map_into_vspace(MOCK_PAGE_DIRECTORY_MAP, service, vspace, vaddr, PD_LEVEL);
+}
+
+seL4_Error seL4_X86_PageTable_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_X86_VMAttributes attr) {
+    (void)attr;
+    return map_into_vspace(MOCK_PAGE_TABLE_MAP, service, vspace, vaddr, PT_LEVEL);
+}
+
+seL4_Error seL4_X86_Page_Map(seL4_CPtr service, seL4_CPtr vspace, seL4_Word vaddr, seL4_CapRights_t rights,
+                             seL4_X86_VMAttributes attr) {
+    (void)rights;
+    (void)attr;
+    MockSlot* slot = lookup_slot(service);
+    enum MappingLevel level = (slot != NULL && slot->type == seL4_X86_LargePageObject) ? LARGE_PAGE_LEVEL : PAGE_LEVEL;
+    return map_into_vspace(MOCK_PAGE_MAP, service, vspace, vaddr, level);
+}
+
+seL4_Word seL4_MappingFailedLookupLevel(void) {
+    return failed_lookup_level;
+}
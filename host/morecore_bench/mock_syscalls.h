@@ -0,0 +1,29 @@
+// Simulated kernel for running the lib's morecore on the host. There is a single cnode whose slot numbers are the cptrs,
+// holding untypeds, frames and x86_64 paging structures. Invocations are checked the way the kernel would check them
+// and counted, but nothing is mapped for real: the caller backs the heap with host memory of its own
+
+#pragma once
+
+#include <sel4/sel4.h>
+
+#define MOCK_NUM_SLOTS 65536
+
+typedef enum {
+    MOCK_UNTYPED_RETYPE, MOCK_CNODE_DELETE, MOCK_PDPT_MAP, MOCK_PAGE_DIRECTORY_MAP, MOCK_PAGE_TABLE_MAP, MOCK_PAGE_MAP,
+    MOCK_NUM_INVOCATIONS
+} MockInvocation;
+
+extern const char* mock_invocation_names[MOCK_NUM_INVOCATIONS];
+
+typedef struct {
+    seL4_Word calls[MOCK_NUM_INVOCATIONS];
+    seL4_Word failures[MOCK_NUM_INVOCATIONS];
+    seL4_Word pages_mapped;
+    seL4_Word large_pages_mapped;
+} MockCounts;
+
+extern MockCounts mock_counts;
+
+// Empties every slot, then puts the cnode and a vspace with an ASID in the given slots
+void mock_reset(seL4_CPtr cnode_slot, seL4_CPtr vspace_slot);
+void mock_add_untyped(seL4_CPtr slot, seL4_Word size_bits);
@@ -0,0 +1,163 @@
+// Benchmarks the lib's morecore against the simulated kernel in mock_syscalls.c. The heap is grown with brk in small
+// steps, the way malloc grows it, and then large blocks are handed out with mmap and every other one is given back with
+// munmap. This is done once with large pages and once with regular frames only. The heap is backed by host memory and
+// every page handed out is written to. For each run, the time spent in the morecore and the invocations it made are
+// printed. The mock is much cheaper than real syscalls, so the invocation counts say more than the times do.
+// Usage: morecore_bench [heap size in MiB]
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <time.h>
+
+#include <tailspring_alloc.h>
+#include <tailspring_morecore.h>
+
+#include "mock_syscalls.h"
+
+#define VSPACE_SLOT 1
+#define CNODE_SLOT 2
+#define GP_UNTYPEDS_START 16
+#define FREE_SLOTS_START 1024
+#define CSPACE_SIZE_BITS 16
+
+#define MIB (1UL << 20)
+// The heap doesn't start on a large page boundary, so that both kinds of page are needed to grow it
+#define HEAP_OFFSET (64UL << 10)
+
+static TailspringMemoryInfo gp_memory_info;
+static TailspringAllocator alloc;
+static TailspringMorecore morecore;
+
+static seL4_Word random_state = 0x2545f4914f6cdd1dUL;
+
+static seL4_Word next_random(void) {
+    random_state ^= random_state << 13;
+    random_state ^= random_state >> 7;
+    random_state ^= random_state << 17;
+    return random_state;
+}
+
+static double now_ms(void) {
+    struct timespec time;
+    clock_gettime(CLOCK_MONOTONIC, &time);
+    return time.tv_sec * 1e3 + time.tv_nsec / 1e6;
+}
+
+static void touch_pages(seL4_Word start, seL4_Word end) {
+    for (seL4_Word addr = start & ~(seL4_Word)(TAILSPRING_PAGE_SIZE - 1); addr < end; addr += TAILSPRING_PAGE_SIZE) {
+        if (addr >= start) *(volatile char*)addr = 1;
+    }
+}
+
+// One untyped of each size from 1 GiB down to a page, biggest first like the loader passes them
+static seL4_Word set_up_untypeds(void) {
+    gp_memory_info.num_entries = 0;
+    for (seL4_Word size_bits = 30; size_bits >= seL4_PageBits; size_bits--) {
+        seL4_Word index = gp_memory_info.num_entries++;
+        gp_memory_info.entries[index].size_bits = size_bits;
+        gp_memory_info.entries[index].paddr = 0;
+        mock_add_untyped(GP_UNTYPEDS_START + index, size_bits);
+    }
+    return gp_memory_info.num_entries;
+}
+
+static void run(const char* name, bool large_pages, seL4_Word heap_start, seL4_Word heap_size) {
+    mock_reset(CNODE_SLOT, VSPACE_SLOT);
+    seL4_Word num_untypeds = set_up_untypeds();
+
+    TailspringHandoff handoff = {0};
+    handoff.magic = TAILSPRING_HANDOFF_MAGIC;
+    handoff.version = TAILSPRING_HANDOFF_VERSION;
+    handoff.size = sizeof(handoff);
+    handoff.gp_memory_info = (seL4_Word)&gp_memory_info;
+    handoff.cspace_size_bits = CSPACE_SIZE_BITS;
+    handoff.cspace_guard_bits = seL4_WordBits - CSPACE_SIZE_BITS;
+    handoff.gp_untypeds_start = GP_UNTYPEDS_START;
+    handoff.gp_untypeds_end = GP_UNTYPEDS_START + num_untypeds;
+    handoff.heap_start = heap_start;
+    handoff.heap_max_size = heap_size;
+    handoff.cspace_slot = CNODE_SLOT;
+    handoff.vspace_slot = VSPACE_SLOT;
+    handoff.free_slots_start = FREE_SLOTS_START;
+    handoff.free_slots_end = 1UL << CSPACE_SIZE_BITS;
+
+    if (!tailspring_alloc_init_from_handoff(&alloc, &handoff) || !tailspring_morecore_init(&morecore, &handoff, &alloc)) {
+        fprintf(stderr, "bench: couldn't set up the morecore\n");
+        exit(EXIT_FAILURE);
+    }
+    morecore.large_pages = large_pages;
+
+    double elapsed_ms = 0;
+    double start_ms;
+
+    // Grow the break to three quarters of the heap
+    seL4_Word brk_target = heap_start + heap_size / 4 * 3;
+    seL4_Word num_brks = 0;
+    seL4_Word brk = heap_start;
+    while (brk < brk_target) {
+        seL4_Word new_brk = brk + TAILSPRING_PAGE_SIZE + next_random() % (128UL << 10);
+        start_ms = now_ms();
+        seL4_Word result = tailspring_morecore_brk(&morecore, new_brk);
+        elapsed_ms += now_ms() - start_ms;
+        num_brks++;
+        if (result != new_brk) break;
+        touch_pages(brk, new_brk);
+        brk = new_brk;
+    }
+
+    // Hand out the rest in large blocks, giving every other one back
+    seL4_Word num_mmaps = 0;
+    seL4_Word mmap_bytes = 0;
+    for (;;) {
+        seL4_Word length = (64UL << 10) + next_random() % (192UL << 10);
+        start_ms = now_ms();
+        void* block = tailspring_morecore_mmap(&morecore, length);
+        elapsed_ms += now_ms() - start_ms;
+        num_mmaps++;
+        if (block == NULL) break;
+        touch_pages((seL4_Word)block, (seL4_Word)block + length);
+
+        if (num_mmaps % 2 == 0) {
+            start_ms = now_ms();
+            tailspring_morecore_munmap(&morecore, block, length);
+            elapsed_ms += now_ms() - start_ms;
+        } else {
+            mmap_bytes += length;
+        }
+    }
+
+    seL4_Word total_calls = 0;
+    for (int i = 0; i < MOCK_NUM_INVOCATIONS; i++) {
+        total_calls += mock_counts.calls[i];
+    }
+    printf("bench: %s: %.3f ms, %lu invocations\n", name, elapsed_ms, total_calls);
+    printf("bench:   brk grew %.1f MiB in %lu calls, mmap kept %.1f MiB over %lu calls\n", (double)(brk - heap_start) / MIB,
+           num_brks, (double)mmap_bytes / MIB, num_mmaps);
+    printf("bench:   %lu pages and %lu large pages mapped\n", mock_counts.pages_mapped, mock_counts.large_pages_mapped);
+    for (int i = 0; i < MOCK_NUM_INVOCATIONS; i++) {
+        if (mock_counts.calls[i] == 0) continue;
+        printf("bench:   %s: %lu (%lu failed)\n", mock_invocation_names[i], mock_counts.calls[i], mock_counts.failures[i]);
+    }
+}
+
+int main(int argc, char* argv[]) {
+    // Every frame takes up a slot in the allocator, so with regular frames only a little over 16 MiB fits
+    seL4_Word heap_size = ((argc > 1) ? strtoul(argv[1], NULL, 0) : 12) * MIB;
+
+    // Host memory to back the heap, aligned so that the heap's large pages line up with the host's
+    seL4_Word reserved_size = heap_size + HEAP_OFFSET + (1UL << seL4_LargePageBits);
+    void* reserved = mmap(NULL, reserved_size, PROT_READ | PROT_WRITE, MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0);
+    if (reserved == MAP_FAILED) {
+        perror("bench: mmap");
+        return EXIT_FAILURE;
+    }
+    seL4_Word large_page_size = 1UL << seL4_LargePageBits;
+    seL4_Word heap_start = (((seL4_Word)reserved + large_page_size - 1) & ~(large_page_size - 1)) + HEAP_OFFSET;
+
+    run("large pages", true, heap_start, heap_size);
+    memset((void*)heap_start, 0, heap_size);
+    run("regular frames", false, heap_start, heap_size);
+    return EXIT_SUCCESS;
+}
@@ -5,7 +5,17 @@
 
 #include <tailspring_shared.h>
 
+// Returns the handoff struct that tailspring placed on this thread's stack, or NULL if it's missing or has an
+// unknown magic/older version. The pointer is cached, so calls after the first return immediately
+const TailspringHandoff* tailspring_init(char *envp[]);
+
+// The functions below parse the envp strings, which are kept for compatibility. Prefer tailspring_init
 bool tailspring_get_ipc_buffer_addr(char *envp[], seL4_IPCBuffer** ipc_buffer_addr_out);
 bool tailspring_get_gp_memory_info(char *envp[], TailspringMemoryInfo** gp_memory_info_out);
+bool tailspring_get_gp_untypeds_slot(char *envp[], seL4_CPtr* gp_untypeds_slot_out);
 bool tailspring_get_device_memory_info(char *envp[], TailspringMemoryInfo** device_memory_info_out);
-bool tailspring_get_system_info(char *envp[], TailspringSystemInfo** system_info_out);
\ No newline at end of file
+bool tailspring_get_system_info(char *envp[], TailspringSystemInfo** system_info_out);
+bool tailspring_get_device_mappings_info(char *envp[], TailspringDeviceMappingsInfo** device_mappings_info_out);
+
+// Returns the vaddr that the device memory at paddr was mapped to, or NULL if paddr isn't in any device mapping
+void* tailspring_find_device_mapping(const TailspringDeviceMappingsInfo* device_mappings_info, seL4_Word paddr);
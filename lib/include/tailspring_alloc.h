@@ -0,0 +1,64 @@
+#pragma once
+
+#include <sel4/sel4.h>
+#include <stdbool.h>
+
+#include <tailspring_shared.h>
+
+// Maximum number of cnode slots the allocator can keep track of
+#define TAILSPRING_ALLOC_MAX_SLOTS 4096
+#define TAILSPRING_ALLOC_BITMAP_WORDS (TAILSPRING_ALLOC_MAX_SLOTS / seL4_WordBits)
+
+typedef struct {
+    seL4_CPtr cptr;
+    seL4_Word size_bits;
+    seL4_Word watermark; // Bytes already handed out, objects are always retyped from here upwards
+    // Links for the list of untypeds in the same bin, -1 if there is no next/previous untyped
+    int next;
+    int prev;
+} TailspringAllocUntyped;
+
+// Allocates objects out of the general purpose untypeds that Tailspring passed to this thread, and slots to put them in.
+// Untypeds are kept in bins by how much free space they have left (bin n holds untypeds with between 2^n and 2^(n+1) bytes
+// left), and a bitmask of non-empty bins lets the smallest bin that is guaranteed to fit an object be found in O(1).
+// Memory is never given back, since seL4 can only reuse an untyped's memory once every object in it has been revoked
+typedef struct {
+    TailspringAllocUntyped untypeds[TAILSPRING_MEM_NUM_ENTRIES];
+    seL4_Word num_untypeds;
+    int bins[seL4_WordBits]; // Index of the first untyped in each bin, or -1 if the bin is empty
+    seL4_Word bin_mask;      // Bit n is set if bins[n] is not empty
+
+    // Cap to the cnode that retyped objects are placed in
+    seL4_CPtr cnode;
+    // Slots in the cnode that can be handed out. Bit n of the bitmap is set if slot (slots_start + n) is in use
+    seL4_CPtr slots_start;
+    seL4_Word num_slots;
+    seL4_Word slot_hint; // Every bitmap word below this index is known to be full
+    seL4_Word slot_bitmap[TAILSPRING_ALLOC_BITMAP_WORDS];
+} TailspringAllocator;
+
+// gp_memory_info and first_untyped_slot describe the untypeds Tailspring passed to this thread (see tailspring_get_gp_memory_info
+// and tailspring_get_gp_untypeds_slot). cnode is a cap to this thread's cspace root, and [free_slots_start, free_slots_end) are
+// the slots in it the allocator may use. Slots are handed out as cptrs, so the cnode's guard should cover the rest of the word
+// (e.g. size 5 and guard 59 on 64-bit). Returns false if there are more than TAILSPRING_ALLOC_MAX_SLOTS free slots
+bool tailspring_alloc_init(TailspringAllocator* alloc, const TailspringMemoryInfo* gp_memory_info, seL4_CPtr first_untyped_slot,
+                           seL4_CPtr cnode, seL4_CPtr free_slots_start, seL4_CPtr free_slots_end);
+
+// Same as above, but takes everything from this thread's handoff struct: its gp untypeds and their memory info page, the
+// cap to its own cspace (cspace_slot) and the free slots. Of the slots tailspring left empty, the longer run of
+// [free_slots_start, free_slots_end) and the gp untyped slots past the last untyped passed is used. Returns false if the
+// thread has no gp untypeds, no cap to its cspace, or a cspace whose guard doesn't cover the rest of the word
+bool tailspring_alloc_init_from_handoff(TailspringAllocator* alloc, const TailspringHandoff* handoff);
+
+bool tailspring_alloc_slot(TailspringAllocator* alloc, seL4_CPtr* slot_out);
+void tailspring_free_slot(TailspringAllocator* alloc, seL4_CPtr slot);
+
+// Retypes a new object into a free slot. size_bits is passed to seL4_Untyped_Retype as-is (only meaningful for variable
+// sized objects like untypeds and cnodes), while object_size_bits is log2 of how much memory the object actually takes up
+seL4_Error tailspring_alloc_object(TailspringAllocator* alloc, seL4_Word type, seL4_Word size_bits, seL4_Word object_size_bits,
+                                   seL4_CPtr* slot_out);
+
+// Same as above, but retypes count objects with a single syscall into consecutive slots starting at first_slot_out.
+// count should not be more than the kernel's retype fan out limit
+seL4_Error tailspring_alloc_objects(TailspringAllocator* alloc, seL4_Word type, seL4_Word size_bits, seL4_Word object_size_bits,
+                                    seL4_Word count, seL4_CPtr* first_slot_out);
@@ -0,0 +1,53 @@
+#pragma once
+
+#include <sel4/sel4.h>
+#include <stdarg.h>
+#include <stdbool.h>
+#include <stddef.h>
+
+#include <tailspring_alloc.h>
+#include <tailspring_shared.h>
+
+// Backs brk and anonymous mmap with the heap tailspring reserved for this thread, [heap_start, heap_start + heap_max_size)
+// in its handoff struct, so that malloc can be used without setting up a morecore area by hand. The loader maps the first
+// heap_size bytes, and the rest is mapped on demand with frames retyped out of the thread's gp untypeds, along with any
+// paging structures they need. brk grows up from the bottom of the heap and mmap grows down from the top.
+// Wherever a grow covers a whole large page of the heap, a large page is mapped instead of regular frames, and brk maps
+// ahead to the next large page boundary so that the grows after it can do the same. Only x86_64 is supported
+typedef struct {
+    TailspringAllocator* alloc;
+    seL4_CPtr vspace;
+    bool large_pages; // Set by tailspring_morecore_init, can be cleared to only map regular frames
+
+    seL4_Word heap_start;
+    seL4_Word heap_end;
+    seL4_Word brk;
+    seL4_Word mmap_start; // Lowest address handed out by mmap
+    // [heap_start, low_mapped) and [high_mapped, heap_end) are mapped. Once they meet, the whole heap is
+    seL4_Word low_mapped;
+    seL4_Word high_mapped;
+} TailspringMorecore;
+
+// alloc is where frames and paging structures come from, usually set up with tailspring_alloc_init_from_handoff.
+// Returns false if the thread has no heap. Without a cap to its vspace (vspace_slot), the heap can't grow past what
+// the loader mapped
+bool tailspring_morecore_init(TailspringMorecore* morecore, const TailspringHandoff* handoff, TailspringAllocator* alloc);
+
+// Same as the brk syscall: moves the break to new_brk and returns it, or returns the current break if new_brk is 0 or
+// the break couldn't be moved there
+seL4_Word tailspring_morecore_brk(TailspringMorecore* morecore, seL4_Word new_brk);
+
+// Returns length bytes of zeroed memory, or NULL if there is no room left. Memory is only ever given back by
+// tailspring_morecore_munmap if it is the lowest mapping mmap handed out, and frames are never unmapped
+void* tailspring_morecore_mmap(TailspringMorecore* morecore, size_t length);
+void tailspring_morecore_munmap(TailspringMorecore* morecore, void* addr, size_t length);
+
+// Sets up a morecore and allocator of the lib's own from the handoff alone, for the syscall handlers below
+bool tailspring_morecore_init_default(const TailspringHandoff* handoff);
+
+// Handlers for the brk, mmap and munmap syscalls over the morecore set up by tailspring_morecore_init_default, to be
+// installed with muslcsys_install_syscall(__NR_brk, tailspring_morecore_sys_brk) and so on. mmap only supports
+// anonymous private mappings without a fixed address, the memory is always readable and writable
+long tailspring_morecore_sys_brk(va_list ap);
+long tailspring_morecore_sys_mmap(va_list ap);
+long tailspring_morecore_sys_munmap(va_list ap);
@@ -15,11 +15,19 @@ typedef struct {
 } TailspringMemoryEntry;
 
 #define TAILSPRING_PAGE_SIZE (1 << seL4_PageBits)
-#define TAILSPRING_MEM_NUM_ENTRIES ((TAILSPRING_PAGE_SIZE - sizeof(seL4_Word)) / sizeof(TailspringMemoryEntry))
+#define TAILSPRING_MEM_NUM_ENTRIES ((TAILSPRING_PAGE_SIZE - 4 * sizeof(seL4_Word)) / sizeof(TailspringMemoryEntry))
 
-// Fills one page
+// Fills one page. General-purpose entries are sorted from biggest to smallest
 typedef struct {
     seL4_Word num_entries;
+    // General-purpose memory that was left over but couldn't be passed on, because there were more blocks than slots or entries
+    seL4_Word bytes_discarded;
+    // Frames the loader no longer needed, if the config gave a cnode `reclaimed_frames`. They are in that cnode's slots
+    // [reclaimed_frames_start, reclaimed_frames_start + num_reclaimed_frames), and are still mapped into the loader's vspace,
+    // so they have to be unmapped before they can be mapped anywhere else. The loader moves them there after starting the
+    // last thread, so the slots can still be empty until it has suspended itself
+    seL4_Word reclaimed_frames_start;
+    seL4_Word num_reclaimed_frames;
     TailspringMemoryEntry entries[TAILSPRING_MEM_NUM_ENTRIES];
 } TailspringMemoryInfo;
 
@@ -30,6 +38,23 @@ typedef struct {
 static_assert(sizeof(TailspringMemoryInfo) <= TAILSPRING_PAGE_SIZE);
 
 
+typedef struct {
+    seL4_Word paddr;
+    seL4_Word vaddr;
+    seL4_Word size;
+} TailspringDeviceMapping;
+
+#define TAILSPRING_DEVICE_MAPPINGS_NUM_ENTRIES ((TAILSPRING_PAGE_SIZE - sizeof(seL4_Word)) / sizeof(TailspringDeviceMapping))
+
+// Fills one page. Entries are sorted by paddr
+typedef struct {
+    seL4_Word num_entries;
+    TailspringDeviceMapping entries[TAILSPRING_DEVICE_MAPPINGS_NUM_ENTRIES];
+} TailspringDeviceMappingsInfo;
+
+static_assert(sizeof(TailspringDeviceMappingsInfo) <= TAILSPRING_PAGE_SIZE);
+
+
 typedef struct {
     uint64_t addr;
     uint32_t pitch;
@@ -45,4 +70,60 @@ typedef struct {
     bool framebuffer_info_present;
 } TailspringSystemInfo;
 
-static_assert(sizeof(TailspringSystemInfo) <= TAILSPRING_PAGE_SIZE);
\ No newline at end of file
+static_assert(sizeof(TailspringSystemInfo) <= TAILSPRING_PAGE_SIZE);
+
+
+#define TAILSPRING_HANDOFF_MAGIC 0x54535052  // "TSPR"
+#define TAILSPRING_HANDOFF_VERSION 3
+
+// Auxiliary vector type whose value is the address of the thread's TailspringHandoff struct.
+// Chosen well clear of the types used by Linux and the seL4 runtime
+#define TAILSPRING_AT_HANDOFF 0x5453
+
+#define TAILSPRING_HANDOFF_NAME_LEN 64
+
+// Placed by tailspring at the top of each thread's stack. Addresses are 0 and slot ranges are empty (start == end)
+// if the thread wasn't given that item. New fields are only ever added to the end, bumping the version
+typedef struct {
+    seL4_Word magic;
+    seL4_Word version;
+    seL4_Word size;  // sizeof(TailspringHandoff) at the version tailspring was built with
+
+    seL4_Word thread_index;  // Position of this thread in the config file
+    seL4_Word num_threads;
+
+    // Addresses in this thread's vspace
+    seL4_Word ipc_buffer;
+    seL4_Word system_info;
+    seL4_Word gp_memory_info;
+    seL4_Word device_memory_info;
+    seL4_Word device_mappings_info;
+    seL4_Word stack_top;
+    seL4_Word stack_size;
+
+    // Layout of this thread's cspace, depth = guard_bits + size_bits
+    seL4_Word cspace_size_bits;
+    seL4_Word cspace_guard_bits;
+
+    // Slot ranges [start, end) in this thread's cspace
+    seL4_Word gp_untypeds_start;
+    seL4_Word gp_untypeds_end;
+    seL4_Word device_untypeds_start;
+    seL4_Word device_untypeds_end;
+
+    char name[TAILSPRING_HANDOFF_NAME_LEN];  // Null terminated, truncated if too long
+
+    // Added in version 2. Zeroed memory mapped for this thread alone before it started, or 0 if it has no heap
+    seL4_Word heap_start;
+    seL4_Word heap_size;
+
+    // Added in version 3. Vaddr space reserved for the heap, [heap_start, heap_start + heap_max_size), of which the first
+    // heap_size bytes are mapped
+    seL4_Word heap_max_size;
+    // Slots in this thread's cspace that hold caps to its own cspace and vspace, or 0 if the config didn't place them there
+    seL4_Word cspace_slot;
+    seL4_Word vspace_slot;
+    // Longest run of slots [start, end) in this thread's cspace that tailspring left empty
+    seL4_Word free_slots_start;
+    seL4_Word free_slots_end;
+} TailspringHandoff;
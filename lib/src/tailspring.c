@@ -54,6 +54,37 @@ static bool get_env_var_num(const char *target_name, char *envp[], seL4_Word* va
 }
 
 
+// Same layout as auxv_t in the seL4 runtime: an int followed by a word-sized union
+typedef struct {
+    int a_type;
+    seL4_Word a_val;
+} AuxvEntry;
+
+static const TailspringHandoff* cached_handoff = NULL;
+
+const TailspringHandoff* tailspring_init(char *envp[]) {
+    if (cached_handoff) return cached_handoff;
+
+    // The auxiliary vectors start just after the null terminator of envp
+    char** env_var_ptr = envp;
+    while (*env_var_ptr) env_var_ptr++;
+
+    // Tailspring places the handoff entry first, but don't rely on it
+    for (AuxvEntry* auxv = (AuxvEntry*)(env_var_ptr + 1); auxv->a_type != 0; auxv++) {
+        if (auxv->a_type != TAILSPRING_AT_HANDOFF) continue;
+
+        const TailspringHandoff* handoff = (const TailspringHandoff*)auxv->a_val;
+        // Newer versions only add fields to the end, so they're still readable
+        if (handoff->magic != TAILSPRING_HANDOFF_MAGIC || handoff->version < TAILSPRING_HANDOFF_VERSION) return NULL;
+
+        cached_handoff = handoff;
+        return handoff;
+    }
+
+    return NULL;
+}
+
+
 bool tailspring_get_ipc_buffer_addr(char *envp[], seL4_IPCBuffer** ipc_buffer_addr_out) {
     return get_env_var_num("ipc_buffer", envp, (seL4_Word*)ipc_buffer_addr_out);
 }
@@ -62,6 +93,10 @@ bool tailspring_get_gp_memory_info(char *envp[], TailspringMemoryInfo** gp_memor
     return get_env_var_num("gp_memory_info", envp, (seL4_Word*)gp_memory_info_out);
 }
 
+bool tailspring_get_gp_untypeds_slot(char *envp[], seL4_CPtr* gp_untypeds_slot_out) {
+    return get_env_var_num("gp_untypeds_slot", envp, (seL4_Word*)gp_untypeds_slot_out);
+}
+
 bool tailspring_get_device_memory_info(char *envp[], TailspringMemoryInfo** device_memory_info_out) {
     return get_env_var_num("device_memory_info", envp, (seL4_Word*)device_memory_info_out);
 }
@@ -69,4 +104,31 @@ bool tailspring_get_device_memory_info(char *envp[], TailspringMemoryInfo** devi
 
 bool tailspring_get_system_info(char *envp[], TailspringSystemInfo** system_info_out) {
     return get_env_var_num("system_info", envp, (seL4_Word*)system_info_out);
-}
\ No newline at end of file
+}
+
+bool tailspring_get_device_mappings_info(char *envp[], TailspringDeviceMappingsInfo** device_mappings_info_out) {
+    return get_env_var_num("device_mappings_info", envp, (seL4_Word*)device_mappings_info_out);
+}
+
+
+void* tailspring_find_device_mapping(const TailspringDeviceMappingsInfo* device_mappings_info, seL4_Word paddr) {
+    // Entries are sorted by paddr, so binary search for the last entry that starts at or below paddr
+    seL4_Word lower = 0;
+    seL4_Word upper = device_mappings_info->num_entries;
+    while (lower < upper) {
+        seL4_Word middle = lower + (upper - lower) / 2;
+        if (device_mappings_info->entries[middle].paddr <= paddr) {
+            lower = middle + 1;
+        } else {
+            upper = middle;
+        }
+    }
+
+    // No entry starts at or below paddr
+    if (lower == 0) return NULL;
+
+    const TailspringDeviceMapping* mapping = &device_mappings_info->entries[lower - 1];
+    if (paddr - mapping->paddr >= mapping->size) return NULL;
+
+    return (void*)(mapping->vaddr + (paddr - mapping->paddr));
+}
@@ -0,0 +1,185 @@
+#include "tailspring_alloc.h"
+
+#include <string.h>
+
+#define WORD_BIT(n) ((seL4_Word)1 << (n))
+
+static seL4_Word floor_log2(seL4_Word value) {
+    return seL4_WordBits - 1 - __builtin_clzl(value);
+}
+
+static seL4_Word ceil_log2(seL4_Word value) {
+    return (value <= 1) ? 0 : floor_log2(value - 1) + 1;
+}
+
+
+// Puts an untyped at the head of the bin matching how much free space it has left. Full untypeds aren't put in any bin
+static void bin_insert(TailspringAllocator* alloc, int index) {
+    TailspringAllocUntyped* untyped = &alloc->untypeds[index];
+    seL4_Word bytes_free = WORD_BIT(untyped->size_bits) - untyped->watermark;
+    if (bytes_free == 0) return;
+
+    seL4_Word bin = floor_log2(bytes_free);
+    untyped->prev = -1;
+    untyped->next = alloc->bins[bin];
+    if (untyped->next != -1) alloc->untypeds[untyped->next].prev = index;
+    alloc->bins[bin] = index;
+    alloc->bin_mask |= WORD_BIT(bin);
+}
+
+static void bin_remove(TailspringAllocator* alloc, int index) {
+    TailspringAllocUntyped* untyped = &alloc->untypeds[index];
+    seL4_Word bin = floor_log2(WORD_BIT(untyped->size_bits) - untyped->watermark);
+
+    if (untyped->prev != -1) {
+        alloc->untypeds[untyped->prev].next = untyped->next;
+    } else {
+        alloc->bins[bin] = untyped->next;
+    }
+    if (untyped->next != -1) alloc->untypeds[untyped->next].prev = untyped->prev;
+
+    if (alloc->bins[bin] == -1) alloc->bin_mask &= ~WORD_BIT(bin);
+}
+
+
+bool tailspring_alloc_init(TailspringAllocator* alloc, const TailspringMemoryInfo* gp_memory_info, seL4_CPtr first_untyped_slot,
+                           seL4_CPtr cnode, seL4_CPtr free_slots_start, seL4_CPtr free_slots_end) {
+    if (free_slots_end - free_slots_start > TAILSPRING_ALLOC_MAX_SLOTS) return false;
+
+    memset(alloc, 0, sizeof(*alloc));
+    for (seL4_Word bin = 0; bin < seL4_WordBits; bin++) {
+        alloc->bins[bin] = -1;
+    }
+
+    // The untyped described by entry n of the memory info page is in slot (first_untyped_slot + n)
+    alloc->num_untypeds = gp_memory_info->num_entries;
+    for (seL4_Word i = 0; i < alloc->num_untypeds; i++) {
+        alloc->untypeds[i].cptr = first_untyped_slot + i;
+        alloc->untypeds[i].size_bits = gp_memory_info->entries[i].size_bits;
+        alloc->untypeds[i].watermark = 0;
+        bin_insert(alloc, i);
+    }
+
+    alloc->cnode = cnode;
+    alloc->slots_start = free_slots_start;
+    alloc->num_slots = free_slots_end - free_slots_start;
+    alloc->slot_hint = 0;
+    return true;
+}
+
+bool tailspring_alloc_init_from_handoff(TailspringAllocator* alloc, const TailspringHandoff* handoff) {
+    if (handoff->gp_memory_info == 0 || handoff->cspace_slot == 0) return false;
+    if (handoff->cspace_guard_bits + handoff->cspace_size_bits != seL4_WordBits) return false;
+
+    const TailspringMemoryInfo* gp_memory_info = (const TailspringMemoryInfo*)handoff->gp_memory_info;
+    seL4_CPtr free_slots_start = handoff->free_slots_start;
+    seL4_CPtr free_slots_end = handoff->free_slots_end;
+    seL4_CPtr untyped_slots_left = handoff->gp_untypeds_start + gp_memory_info->num_entries;
+    if (handoff->gp_untypeds_end - untyped_slots_left > free_slots_end - free_slots_start) {
+        free_slots_start = untyped_slots_left;
+        free_slots_end = handoff->gp_untypeds_end;
+    }
+    if (free_slots_end - free_slots_start > TAILSPRING_ALLOC_MAX_SLOTS) free_slots_end = free_slots_start + TAILSPRING_ALLOC_MAX_SLOTS;
+
+    return tailspring_alloc_init(alloc, gp_memory_info, handoff->gp_untypeds_start, handoff->cspace_slot, free_slots_start,
+                                 free_slots_end);
+}
+
+
+bool tailspring_alloc_slot(TailspringAllocator* alloc, seL4_CPtr* slot_out) {
+    seL4_Word num_words = (alloc->num_slots + seL4_WordBits - 1) / seL4_WordBits;
+    for (seL4_Word word_index = alloc->slot_hint; word_index < num_words; word_index++) {
+        seL4_Word word = alloc->slot_bitmap[word_index];
+        if (word == ~(seL4_Word)0) continue;
+
+        seL4_Word bit = __builtin_ctzl(~word);
+        seL4_Word slot_index = word_index * seL4_WordBits + bit;
+        if (slot_index >= alloc->num_slots) break;
+
+        alloc->slot_bitmap[word_index] |= WORD_BIT(bit);
+        alloc->slot_hint = word_index;
+        *slot_out = alloc->slots_start + slot_index;
+        return true;
+    }
+    alloc->slot_hint = num_words;
+    return false;
+}
+
+void tailspring_free_slot(TailspringAllocator* alloc, seL4_CPtr slot) {
+    seL4_Word slot_index = slot - alloc->slots_start;
+    seL4_Word word_index = slot_index / seL4_WordBits;
+    alloc->slot_bitmap[word_index] &= ~WORD_BIT(slot_index % seL4_WordBits);
+    if (word_index < alloc->slot_hint) alloc->slot_hint = word_index;
+}
+
+// Finds and marks count consecutive free slots, skipping over full bitmap words
+static bool alloc_slot_run(TailspringAllocator* alloc, seL4_Word count, seL4_CPtr* first_slot_out) {
+    if (count == 1) return tailspring_alloc_slot(alloc, first_slot_out);
+
+    seL4_Word run_start = 0;
+    seL4_Word run_length = 0;
+    for (seL4_Word slot_index = alloc->slot_hint * seL4_WordBits; slot_index < alloc->num_slots; slot_index++) {
+        seL4_Word word = alloc->slot_bitmap[slot_index / seL4_WordBits];
+        if (slot_index % seL4_WordBits == 0 && word == ~(seL4_Word)0) {
+            slot_index += seL4_WordBits - 1;
+            run_length = 0;
+            continue;
+        }
+        if (word & WORD_BIT(slot_index % seL4_WordBits)) {
+            run_length = 0;
+            continue;
+        }
+
+        if (run_length == 0) run_start = slot_index;
+        if (++run_length == count) {
+            for (seL4_Word i = run_start; i < run_start + count; i++) {
+                alloc->slot_bitmap[i / seL4_WordBits] |= WORD_BIT(i % seL4_WordBits);
+            }
+            *first_slot_out = alloc->slots_start + run_start;
+            return true;
+        }
+    }
+    return false;
+}
+
+
+seL4_Error tailspring_alloc_object(TailspringAllocator* alloc, seL4_Word type, seL4_Word size_bits, seL4_Word object_size_bits,
+                                   seL4_CPtr* slot_out) {
+    return tailspring_alloc_objects(alloc, type, size_bits, object_size_bits, 1, slot_out);
+}
+
+seL4_Error tailspring_alloc_objects(TailspringAllocator* alloc, seL4_Word type, seL4_Word size_bits, seL4_Word object_size_bits,
+                                    seL4_Word count, seL4_CPtr* first_slot_out) {
+    if (count == 0) return seL4_RangeError;
+
+    // Any untyped with at least 2^needed_bits bytes free is guaranteed to fit the objects. Untyped sizes are powers of two,
+    // so aligning the watermark up to the object size can never push the objects past the end of the untyped
+    seL4_Word needed_bits = object_size_bits + ceil_log2(count);
+    if (needed_bits >= seL4_WordBits) return seL4_NotEnoughMemory;
+
+    // The lowest non-empty bin at or above needed_bits holds the tightest guaranteed fit
+    seL4_Word candidate_bins = alloc->bin_mask & ~(WORD_BIT(needed_bits) - 1);
+    if (candidate_bins == 0) return seL4_NotEnoughMemory;
+    int index = alloc->bins[__builtin_ctzl(candidate_bins)];
+    TailspringAllocUntyped* untyped = &alloc->untypeds[index];
+
+    seL4_CPtr first_slot;
+    if (!alloc_slot_run(alloc, count, &first_slot)) return seL4_NotEnoughMemory;
+
+    seL4_Error error = seL4_Untyped_Retype(untyped->cptr, type, size_bits, alloc->cnode, 0, 0, first_slot, count);
+    if (error != seL4_NoError) {
+        for (seL4_Word i = 0; i < count; i++) {
+            tailspring_free_slot(alloc, first_slot + i);
+        }
+        return error;
+    }
+
+    // Move the untyped to the bin matching its new amount of free space
+    seL4_Word object_size = WORD_BIT(object_size_bits);
+    bin_remove(alloc, index);
+    untyped->watermark = ((untyped->watermark + object_size - 1) & ~(object_size - 1)) + count * object_size;
+    bin_insert(alloc, index);
+
+    *first_slot_out = first_slot;
+    return seL4_NoError;
+}
@@ -0,0 +1,204 @@
+#include "tailspring_morecore.h"
+
+#include <errno.h>
+#include <string.h>
+#include <sys/mman.h>
+
+#define WORD_BIT(n) ((seL4_Word)1 << (n))
+#define PAGE_SIZE_4K WORD_BIT(seL4_PageBits)
+#define LARGE_PAGE_SIZE WORD_BIT(seL4_LargePageBits)
+
+static seL4_Word align_down(seL4_Word value, seL4_Word alignment) {
+    return value & ~(alignment - 1);
+}
+
+static seL4_Word align_up(seL4_Word value, seL4_Word alignment) {
+    return (value + alignment - 1) & ~(alignment - 1);
+}
+
+
+static void delete_cap(TailspringMorecore* morecore, seL4_CPtr slot) {
+    seL4_CNode_Delete(morecore->alloc->cnode, slot, seL4_WordBits);
+    tailspring_free_slot(morecore->alloc, slot);
+}
+
+// Creates and maps the paging structure that a mapping at vaddr failed to find, given the level the lookup failed at
+static seL4_Error create_paging_structure(TailspringMorecore* morecore, seL4_Word vaddr, seL4_Word lookup_level) {
+    seL4_Word type;
+    seL4_Word size_bits;
+    switch (lookup_level) {
+        case SEL4_MAPPING_LOOKUP_NO_PDPT: type = seL4_X86_PDPTObject; size_bits = seL4_PDPTBits; break;
+        case SEL4_MAPPING_LOOKUP_NO_PD: type = seL4_X86_PageDirectoryObject; size_bits = seL4_PageDirBits; break;
+        case SEL4_MAPPING_LOOKUP_NO_PT: type = seL4_X86_PageTableObject; size_bits = seL4_PageTableBits; break;
+        default: return seL4_FailedLookup;
+    }
+
+    seL4_CPtr slot;
+    seL4_Error error = tailspring_alloc_object(morecore->alloc, type, 0, size_bits, &slot);
+    if (error != seL4_NoError) return error;
+
+    // The lookup level is the number of vaddr bits the missing structure covers
+    seL4_Word structure_vaddr = align_down(vaddr, WORD_BIT(lookup_level));
+    switch (lookup_level) {
+        case SEL4_MAPPING_LOOKUP_NO_PDPT:
+            error = seL4_X86_PDPT_Map(slot, morecore->vspace, structure_vaddr, seL4_X86_Default_VMAttributes);
+            break;
+        case SEL4_MAPPING_LOOKUP_NO_PD:
+            error = seL4_X86_PageDirectory_Map(slot, morecore->vspace, structure_vaddr, seL4_X86_Default_VMAttributes);
+            break;
+        default:
+            error = seL4_X86_PageTable_Map(slot, morecore->vspace, structure_vaddr, seL4_X86_Default_VMAttributes);
+            break;
+    }
+    if (error != seL4_NoError) delete_cap(morecore, slot);
+    return error;
+}
+
+// Retypes a page of the given type and maps it at vaddr, along with any paging structures missing above it. Memory that
+// was retyped for a mapping that then failed is lost, like any other memory the allocator hands out
+static bool map_page(TailspringMorecore* morecore, seL4_Word vaddr, seL4_Word type, seL4_Word size_bits) {
+    seL4_CPtr frame;
+    seL4_Error error = tailspring_alloc_object(morecore->alloc, type, 0, size_bits, &frame);
+    if (error != seL4_NoError) return false;
+
+    while ((error = seL4_X86_Page_Map(frame, morecore->vspace, vaddr, seL4_ReadWrite, seL4_X86_Default_VMAttributes)) == seL4_FailedLookup) {
+        error = create_paging_structure(morecore, vaddr, seL4_MappingFailedLookupLevel());
+        if (error != seL4_NoError) break;
+    }
+    if (error != seL4_NoError) delete_cap(morecore, frame);
+    return error == seL4_NoError;
+}
+
+static bool can_map(const TailspringMorecore* morecore) {
+    return morecore->alloc != NULL && morecore->vspace != seL4_CapNull;
+}
+
+// Maps upwards from low_mapped until needed, and then on to ahead as long as there is memory for it. Large pages are
+// used wherever one fits below ahead, falling back to regular frames if there is no untyped left that fits one.
+// Returns false if needed couldn't be reached
+static bool map_low(TailspringMorecore* morecore, seL4_Word needed, seL4_Word ahead) {
+    seL4_Word limit = (ahead < morecore->high_mapped) ? ahead : morecore->high_mapped;
+    while (can_map(morecore) && morecore->low_mapped < limit) {
+        seL4_Word vaddr = morecore->low_mapped;
+        bool large_fits = morecore->large_pages && vaddr % LARGE_PAGE_SIZE == 0 && limit - vaddr >= LARGE_PAGE_SIZE;
+        if (large_fits && map_page(morecore, vaddr, seL4_X86_LargePageObject, seL4_LargePageBits)) {
+            morecore->low_mapped += LARGE_PAGE_SIZE;
+        } else if (map_page(morecore, vaddr, seL4_X86_4K, seL4_PageBits)) {
+            morecore->low_mapped += PAGE_SIZE_4K;
+        } else {
+            break;
+        }
+    }
+    return morecore->low_mapped >= needed || morecore->low_mapped >= morecore->high_mapped;
+}
+
+// Same as above, but maps downwards from high_mapped
+static bool map_high(TailspringMorecore* morecore, seL4_Word needed, seL4_Word ahead) {
+    seL4_Word limit = (ahead > morecore->low_mapped) ? ahead : morecore->low_mapped;
+    while (can_map(morecore) && morecore->high_mapped > limit) {
+        seL4_Word vaddr_end = morecore->high_mapped;
+        bool large_fits = morecore->large_pages && vaddr_end % LARGE_PAGE_SIZE == 0 && vaddr_end - limit >= LARGE_PAGE_SIZE;
+        if (large_fits && map_page(morecore, vaddr_end - LARGE_PAGE_SIZE, seL4_X86_LargePageObject, seL4_LargePageBits)) {
+            morecore->high_mapped -= LARGE_PAGE_SIZE;
+        } else if (map_page(morecore, vaddr_end - PAGE_SIZE_4K, seL4_X86_4K, seL4_PageBits)) {
+            morecore->high_mapped -= PAGE_SIZE_4K;
+        } else {
+            break;
+        }
+    }
+    return morecore->high_mapped <= needed || morecore->high_mapped <= morecore->low_mapped;
+}
+
+
+bool tailspring_morecore_init(TailspringMorecore* morecore, const TailspringHandoff* handoff, TailspringAllocator* alloc) {
+    if (handoff->heap_start == 0) return false;
+
+    morecore->alloc = alloc;
+    morecore->vspace = handoff->vspace_slot;
+    morecore->large_pages = true;
+    morecore->heap_start = handoff->heap_start;
+    morecore->heap_end = handoff->heap_start + handoff->heap_max_size;
+    morecore->brk = morecore->heap_start;
+    morecore->mmap_start = morecore->heap_end;
+    morecore->low_mapped = morecore->heap_start + handoff->heap_size;
+    morecore->high_mapped = morecore->heap_end;
+    return true;
+}
+
+seL4_Word tailspring_morecore_brk(TailspringMorecore* morecore, seL4_Word new_brk) {
+    if (new_brk < morecore->heap_start || new_brk > morecore->mmap_start) return morecore->brk;
+
+    seL4_Word needed = align_up(new_brk, PAGE_SIZE_4K);
+    if (needed > morecore->low_mapped) {
+        seL4_Word ahead = morecore->large_pages ? align_up(needed, LARGE_PAGE_SIZE) : needed;
+        if (!map_low(morecore, needed, ahead)) return morecore->brk;
+    }
+
+    // Memory below the break starts out zeroed, even if it was handed out before
+    if (new_brk < morecore->brk) memset((void*)new_brk, 0, morecore->brk - new_brk);
+    morecore->brk = new_brk;
+    return new_brk;
+}
+
+void* tailspring_morecore_mmap(TailspringMorecore* morecore, size_t length) {
+    seL4_Word size = align_up(length, PAGE_SIZE_4K);
+    if (length == 0 || size < length || size > morecore->mmap_start - align_up(morecore->brk, PAGE_SIZE_4K)) return NULL;
+
+    seL4_Word new_start = morecore->mmap_start - size;
+    if (new_start < morecore->high_mapped) {
+        seL4_Word ahead = morecore->large_pages ? align_down(new_start, LARGE_PAGE_SIZE) : new_start;
+        if (!map_high(morecore, new_start, ahead)) return NULL;
+    }
+
+    morecore->mmap_start = new_start;
+    return (void*)new_start;
+}
+
+void tailspring_morecore_munmap(TailspringMorecore* morecore, void* addr, size_t length) {
+    seL4_Word size = align_up(length, PAGE_SIZE_4K);
+    if ((seL4_Word)addr != morecore->mmap_start || size > morecore->heap_end - morecore->mmap_start) return;
+
+    // Zeroed now so that mmap can hand it out again as is
+    memset(addr, 0, size);
+    morecore->mmap_start += size;
+}
+
+
+static TailspringAllocator default_alloc;
+static TailspringMorecore default_morecore;
+static bool default_morecore_ready = false;
+
+bool tailspring_morecore_init_default(const TailspringHandoff* handoff) {
+    // Without an allocator, the heap can still be handed out as far as the loader mapped it
+    TailspringAllocator* alloc = tailspring_alloc_init_from_handoff(&default_alloc, handoff) ? &default_alloc : NULL;
+    default_morecore_ready = tailspring_morecore_init(&default_morecore, handoff, alloc);
+    return default_morecore_ready;
+}
+
+long tailspring_morecore_sys_brk(va_list ap) {
+    seL4_Word new_brk = va_arg(ap, seL4_Word);
+    // Like the kernel, a failed brk returns the current break. Without a heap there is none
+    if (!default_morecore_ready) return 0;
+    return tailspring_morecore_brk(&default_morecore, new_brk);
+}
+
+long tailspring_morecore_sys_mmap(va_list ap) {
+    void* addr = va_arg(ap, void*);
+    size_t length = va_arg(ap, size_t);
+    int prot = va_arg(ap, int);
+    int flags = va_arg(ap, int);
+    (void)addr;
+    (void)prot;
+
+    if (!(flags & MAP_ANONYMOUS) || (flags & MAP_FIXED)) return -EINVAL;
+    if (!default_morecore_ready) return -ENOMEM;
+    void* result = tailspring_morecore_mmap(&default_morecore, length);
+    return result ? (long)result : -ENOMEM;
+}
+
+long tailspring_morecore_sys_munmap(va_list ap) {
+    void* addr = va_arg(ap, void*);
+    size_t length = va_arg(ap, size_t);
+    if (default_morecore_ready) tailspring_morecore_munmap(&default_morecore, addr, length);
+    return 0;
+}
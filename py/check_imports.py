@@ -0,0 +1,61 @@
+from pathlib import Path
+from typing import Dict
+import argparse
+import subprocess
+import sys
+
+# Heavy modules that are only needed once a config or ELF file is read, so importing the generator mustn't import them
+LAZY_MODULES = ('yaml', 'elftools')
+
+
+# Imports main.py in a fresh interpreter under -X importtime. Returns the cumulative import time of each module in microseconds
+def measure_imports() -> Dict[str, int]:
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=Path(__file__).resolve().parent,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing main.py failed:\n{result.stderr}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # Lines look like `import time:       123 |       4567 |   tailspring.context`, after a header line of the same form
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def check_imports():
+    parser = argparse.ArgumentParser(
+        prog='Tailspring Import Check',
+        description='Checks that importing the generator doesn\'t import yaml or elftools, and prints how long the import '
+                    'took. Exits with 1 if either was imported or the import took longer than --max-ms')
+
+    parser.add_argument('--max-ms', dest='max_ms', type=float,
+                        help='Fail if importing main.py takes longer than this many milliseconds')
+
+    parser.add_argument('--top', dest='top', type=int, default=10,
+                        help='Number of the slowest modules to print. Defaults to 10')
+
+    args = parser.parse_args()
+    times = measure_imports()
+
+    total_ms = times['main'] / 1000
+    print(f"Importing main.py took {total_ms:.1f} ms. Slowest modules, including what they import:")
+    for name, time in sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {time / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = [module for module in LAZY_MODULES if any(name == module or name.startswith(module + '.') for name in times)]
+    if eager:
+        print(f"Imported eagerly, but should only be imported once they're used: {', '.join(eager)}", file=sys.stderr)
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"Importing main.py took longer than {args.max_ms} ms", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    check_imports()
@@ -0,0 +1,24 @@
+import tailspring.daemon as daemon
+import main
+from pathlib import Path
+import argparse
+
+
+def run_daemon():
+    parser = argparse.ArgumentParser(
+        prog='Tailspring Daemon',
+        description='Keeps the Tailspring generator running between builds, with the thread binaries and seL4 info parsed '
+                    'already. Builds are handed to it by passing --daemon-socket to main.py')
+
+    parser.add_argument('--socket', dest='socket_path', required=True,
+                        help='Path of the Unix socket to listen on')
+
+    parser.add_argument('--poll-interval', dest='poll_interval', type=float, default=0.5,
+                        help='How often to check the inputs of the last build for changes, in seconds. Defaults to 0.5')
+
+    args = parser.parse_args()
+    daemon.serve(Path(args.socket_path), args.poll_interval, main.generate)
+
+
+if __name__ == "__main__":
+    run_daemon()
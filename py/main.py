@@ -7,37 +7,83 @@ import tailspring.ops_gen as ops_gen
 import tailspring.fragment_gen as fragment_gen
 import tailspring.paging as paging
 import tailspring.thread_setup as thread_setup
+import tailspring.report as report
+import tailspring.slot_alloc as slot_alloc
+import tailspring.daemon as daemon
+from typing import Dict, List, Optional
+import sys
 
 
 def main():
-    # Create empty context object
-    ctx = Context()
+    # If a daemon is running it does the build, since it has the inputs parsed already. Otherwise the build is done here
+    returncode = daemon.request_build(sys.argv[1:])
+    if returncode is not None:
+        sys.exit(returncode)
 
+    generate(Context())
+
+
+# argv defaults to the process's own arguments. The daemon calls this for every build, with a fresh ctx each time
+def generate(ctx: Context, argv: Optional[List[str]] = None):
     # Get cli arguments
     cli_args.declare_args(ctx)
-    cli_args.parse_args(ctx)
+    cli_args.parse_args(ctx, argv)
+
+    # Without --variant there is a single build, which uses ctx itself
+    if not ctx.variants:
+        build(ctx)
+        if ctx.report_path is not None:
+            report.write_report(ctx)
+        elif ctx.depfile_path is not None:
+            fragment_gen.write_depfile(ctx.depfile_path, [ctx])
+        return
+
+    variant_ctxs: Dict[str, Context] = {}
+    for variant in ctx.variants:
+        variant_ctx = cli_args.make_variant_context(ctx, variant)
+        build(variant_ctx)
+        variant_ctxs[variant.name] = variant_ctx
+
+    if ctx.report_path is not None:
+        report.write_variant_reports(ctx.report_path, variant_ctxs)
+    elif ctx.depfile_path is not None:
+        fragment_gen.write_depfile(ctx.depfile_path, list(variant_ctxs.values()))
 
+
+# Runs every step for one config, once its arguments are in ctx. In report mode nothing is written
+def build(ctx: Context):
     # Depending on the arch we're building for, different cap types and so different enums are available
-    ts_enums.extend_CapType_enums_with_arch(ctx.arch)
+    ctx.cap_types = ts_enums.get_CapType_for_arch(ctx.arch)
 
     # Get the list of underivable cap types after we've extended enums
-    ctx.underivable_cap_types = ts_enums.get_underivable_cap_types()
+    ctx.underivable_cap_types = ts_enums.get_underivable_cap_types(ctx.cap_types)
+    ctx.paging_arch_info = paging.PagingArchInfo(ctx.arch, ctx.cap_types)
 
     # Convert the data in the configuration file into objects that are easier to manipulate
     wrapper_creator.create_object_wrappers(ctx)
 
-    # Create the paging structures necessary to map in each vspace
-    paging.create_paging_structures(ctx)
+    # Decide which core each thread should run on
+    thread_setup.place_threads_on_cores(ctx)
 
-    # Set the values of per-thread attributes such as stack address and ipc buffer address - this does create some operations as well
+    # Lay out each vspace and set the values of per-thread attributes such as stack address and ipc buffer address - this does create some operations as well
     thread_setup.set_per_thread_values(ctx)
 
-    # Parse the elf files associated with each vspace, extract the load segments, and combine them together into a single linkable obj file
-    obj_file_gen.gen_startup_threads_obj_file(ctx)
+    # Create the paging structures necessary to map in each vspace
+    paging.create_paging_structures(ctx)
 
     # Generate the list of operations that need to be performed to set up the system's state according to the config
     ops_gen.gen_cap_ops_list(ctx)
 
+    # Decide which slot of the loader's cnode each cap goes in, reusing the slots of caps that have been moved out
+    slot_alloc.allocate_slots(ctx)
+
+    # In report mode nothing is linked or written, the cost of the config is just summarized afterwards
+    if ctx.report_path is not None:
+        return
+
+    # Parse the elf files associated with each vspace, extract the load segments, and combine them together into a single linkable obj file
+    obj_file_gen.gen_startup_threads_obj_file(ctx)
+
     fragment_gen.write_fragments(ctx)
     fragment_gen.flush_fragments(ctx)
 
@@ -1,10 +1,13 @@
 from tailspring.context import Context
 import tailspring.ts_enums as ts_enums
+import tailspring.ts_types as ts_types
 from pathlib import Path
 import argparse
-import yaml
+import hashlib
 import json
+import os
 import subprocess
+from typing import Dict, List, Optional, Tuple
 
 
 # argparse custom action to parse a list of key-value pairs that represent a dictionary of str -> Path
@@ -26,8 +29,14 @@ def declare_args(ctx: Context):
         prog='Tailspring Parser',
         description='Generates C headers from a configuration file for the Tailspring thread loader')
 
-    parser.add_argument('--config', dest='config_path', required=True,
-                        help='Path to the configuration file')
+    parser.add_argument('--config', dest='config_path',
+                        help='Path to the configuration file (required unless --variant is given)')
+
+    parser.add_argument('--variant', dest='variants', nargs=4, action='append',
+                        metavar=('NAME', 'CONFIG', 'OUTPUT_HEADER', 'OUTPUT_STARTUP_THREADS_OBJ'),
+                        help='Generates one of several variants in this run, with its own config and outputs, instead of using --config, '
+                             '--output-header and --output-startup-threads-obj. Can be given more than once. The variants share the '
+                             'parsed thread binaries, the seL4 info and identical chunk objects. Each needs its own output directory')
 
     parser.add_argument('--sel4-info-getter', dest='sel4_info_getter_path', required=True,
                         help='Path to the compiled sel4_info_getter binary')
@@ -38,20 +47,42 @@ def declare_args(ctx: Context):
     parser.add_argument('--startup-threads-paths', dest='startup_threads_paths', required=True, nargs='*',
                         help='Key-value pairs mapping startup thread names in the config file to the path of the thread binary')
 
-    parser.add_argument('--output-header', dest='output_header_path', required=True,
-                        help='Path to the output generated header file')
+    parser.add_argument('--output-header', dest='output_header_path',
+                        help='Path to the output generated header file (required unless --report is given)')
+
+    parser.add_argument('--output-startup-threads-obj', dest='output_startup_threads_obj_path',
+                        help='Path to the output generated object file containing startup thread data (required unless --report is given)')
+
+    parser.add_argument('--depfile', dest='depfile_path',
+                        help='Optional path to write a Make style depfile to, listing every input the output depends on')
 
-    parser.add_argument('--output-startup-threads-obj', dest='output_startup_threads_obj_path', required=True,
-                        help='Path to the output generated object file containing startup thread data')
+    parser.add_argument('--report', dest='report_path', nargs='?', const='-',
+                        help='Only report what the config costs instead of generating any output. Printed, or written as JSON if a path is given')
+
+    parser.add_argument('--daemon-socket', dest='daemon_socket_path',
+                        help='Optional path to the socket of a running generator daemon (py/daemon.py) to hand the build to. '
+                             'If no daemon is listening there, the build is done as usual')
 
     ctx.arg_parser = parser
 
 
-def parse_args(ctx: Context):
-    args = ctx.arg_parser.parse_args()
+# argv defaults to the process's own arguments. The daemon passes in the arguments of the build it was asked for
+def parse_args(ctx: Context, argv: Optional[List[str]] = None):
+    args = ctx.arg_parser.parse_args(argv)
 
-    # Parse config file
-    ctx.config = parse_config(args.config_path)
+    ctx.report_path = args.report_path
+    if args.variants is not None:
+        if args.config_path is not None or args.output_header_path is not None or args.output_startup_threads_obj_path is not None:
+            ctx.arg_parser.error("--config, --output-header and --output-startup-threads-obj can't be used with --variant")
+        ctx.variants = parse_variants(args.variants, ctx)
+    else:
+        if args.config_path is None:
+            ctx.arg_parser.error("--config is required unless --variant is given")
+        if ctx.report_path is None and (args.output_header_path is None or args.output_startup_threads_obj_path is None):
+            ctx.arg_parser.error("--output-header and --output-startup-threads-obj are required unless --report is given")
+        output_header_path = Path(args.output_header_path) if args.output_header_path is not None else None
+        output_startup_threads_obj_path = Path(args.output_startup_threads_obj_path) if args.output_startup_threads_obj_path is not None else None
+        set_build_paths(ctx, Path(args.config_path), output_header_path, output_startup_threads_obj_path)
 
     # Validate GCC path
     gcc_path = Path(args.gcc_path)
@@ -59,17 +90,9 @@ def parse_args(ctx: Context):
         raise ValueError(f"GCC path is invalid: {gcc_path}")
     ctx.gcc_path = gcc_path
 
-    # Validate output header path
-    output_header_path = Path(args.output_header_path)
-    if not output_header_path.parent.is_dir():
-        raise ValueError(f"Output header path is invalid: {output_header_path}")
-    ctx.output_header_path = output_header_path
-
-    # Validate output startup threads data path
-    output_startup_threads_obj_path = Path(args.output_startup_threads_obj_path)
-    if not output_startup_threads_obj_path.parent.is_dir():
-        raise ValueError(f"Output startup threads data path is invalid: {output_startup_threads_obj_path}")
-    ctx.output_startup_threads_obj_path = output_startup_threads_obj_path
+    # With variants, the depfile has a rule for each of them
+    if ctx.report_path is None and args.depfile_path is not None:
+        ctx.depfile_path = Path(args.depfile_path)
 
     # Parse key-value pairs for startup threads paths dict
     startup_threads_paths_dict = {}
@@ -85,6 +108,7 @@ def parse_args(ctx: Context):
     sel4_info_getter_path = Path(args.sel4_info_getter_path)
     if not sel4_info_getter_path.parent.is_dir():
         raise ValueError(f"seL4 info getter path is invalid: {sel4_info_getter_path}")
+    ctx.sel4_info_getter_path = sel4_info_getter_path
     ctx.sel4_info = get_sel4_info(sel4_info_getter_path)
 
     # Extract frequently used symbols from sel4_info
@@ -97,16 +121,117 @@ def parse_args(ctx: Context):
         raise RuntimeError(f"Could not find arch '{arch_from_sel4_info}' returned from seL4 info getter")
     ctx.page_size_bits = ctx.sel4_info['literals']['seL4_PageBits']
     ctx.page_size = 1 << ctx.page_size_bits
-    ctx.temp_dir = ctx.output_startup_threads_obj_path.parent
+    ctx.max_num_nodes = ctx.sel4_info['literals']['CONFIG_MAX_NUM_NODES']
+    ctx.mcs = bool(ctx.sel4_info['literals']['CONFIG_KERNEL_MCS'])
+
+
+def parse_variants(variant_args: List[List[str]], ctx: Context) -> List[ts_types.Variant]:
+    variants = []
+    for name, config_path, output_header_path, output_startup_threads_obj_path in variant_args:
+        if any(variant.name == name for variant in variants):
+            raise ValueError(f"Found duplicate variant '{name}'")
+        variant = ts_types.Variant(name=name, config_path=Path(config_path), output_header_path=Path(output_header_path),
+                                   output_startup_threads_obj_path=Path(output_startup_threads_obj_path))
+
+        # Chunk objects and the linker script are written next to the startup threads object, under names that only depend
+        # on the chunk, so variants in the same directory would overwrite each other's
+        if ctx.report_path is None:
+            for other in variants:
+                if other.output_startup_threads_obj_path.parent.resolve() == variant.output_startup_threads_obj_path.parent.resolve():
+                    raise ValueError(f"Variants '{other.name}' and '{name}' write their startup threads objects to the same directory")
+        variants.append(variant)
+    return variants
+
+
+# Sets up the config and outputs of a single build. The outputs are None when reporting
+def set_build_paths(ctx: Context, config_path: Path, output_header_path: Optional[Path], output_startup_threads_obj_path: Optional[Path]):
+    # Parse config file
+    ctx.config_path = config_path
+    ctx.config = parse_config(ctx.config_path)
+
+    if ctx.report_path is None:
+        # Validate output header path
+        if not output_header_path.parent.is_dir():
+            raise ValueError(f"Output header path is invalid: {output_header_path}")
+        ctx.output_header_path = output_header_path
+
+        # Validate output startup threads data path
+        if not output_startup_threads_obj_path.parent.is_dir():
+            raise ValueError(f"Output startup threads data path is invalid: {output_startup_threads_obj_path}")
+        ctx.output_startup_threads_obj_path = output_startup_threads_obj_path
+        ctx.temp_dir = ctx.output_startup_threads_obj_path.parent
+
+
+# Each variant gets a context of its own, with everything that doesn't depend on the config taken from the run's context.
+# The parsed thread binaries and the chunk objects are shared rather than copied, so that later variants can reuse them
+def make_variant_context(ctx: Context, variant: ts_types.Variant) -> Context:
+    variant_ctx = Context(arg_parser=ctx.arg_parser, sel4_info_getter_path=ctx.sel4_info_getter_path, gcc_path=ctx.gcc_path,
+                          report_path=ctx.report_path, startup_threads_paths=ctx.startup_threads_paths, sel4_info=ctx.sel4_info,
+                          elf_images=ctx.elf_images, chunk_objects=ctx.chunk_objects, arch=ctx.arch, page_size_bits=ctx.page_size_bits,
+                          page_size=ctx.page_size, max_num_nodes=ctx.max_num_nodes, mcs=ctx.mcs)
+    output_header_path = variant.output_header_path if ctx.report_path is None else None
+    output_startup_threads_obj_path = variant.output_startup_threads_obj_path if ctx.report_path is None else None
+    set_build_paths(variant_ctx, variant.config_path, output_header_path, output_startup_threads_obj_path)
+    return variant_ctx
 
 
 def parse_config(config_path: Path) -> dict:
+    # yaml is only needed here, so it's imported lazily to keep startup fast
+    import yaml
+    # The libyaml-backed loader is much faster, but is only available if PyYAML was built against libyaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
     with open(config_path, 'r') as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=loader)
+
+
+# Getter outputs this process has already read, by getter path, along with the getter's mtime. Only the daemon runs more
+# than one build in a process, and this saves it from reading the cache file every time
+sel4_info_by_getter: Dict[Path, Tuple[int, dict]] = {}
 
 
 def get_sel4_info(sel4_info_getter_path: Path) -> dict:
-    result = subprocess.run([sel4_info_getter_path], capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"Failed to call sel4 info getter with error: {result.stderr}")
-    return json.loads(result.stdout)
+    # Relative paths are resolved, since the daemon's builds can come from different directories
+    key = sel4_info_getter_path.resolve()
+    getter_mtime = sel4_info_getter_path.stat().st_mtime_ns
+    known_mtime, known_sel4_info = sel4_info_by_getter.get(key, (None, None))
+    if known_mtime == getter_mtime:
+        return known_sel4_info
+    sel4_info = read_sel4_info(sel4_info_getter_path, getter_mtime)
+    sel4_info_by_getter[key] = (getter_mtime, sel4_info)
+    return sel4_info
+
+
+def read_sel4_info(sel4_info_getter_path: Path, getter_mtime: int) -> dict:
+    # The output only changes when the getter is rebuilt, so it's cached next to the getter. The mtime is checked first
+    # since it's cheap, and if it changed the binary is hashed in case it was rebuilt without actually changing
+    cache_path = sel4_info_getter_path.with_name(sel4_info_getter_path.name + '.cache.json')
+
+    cache = None
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    if cache is not None and cache.get('mtime') == getter_mtime:
+        return cache['sel4_info']
+
+    getter_hash = hashlib.sha256(sel4_info_getter_path.read_bytes()).hexdigest()
+    if cache is not None and cache.get('sha256') == getter_hash:
+        sel4_info = cache['sel4_info']
+    else:
+        result = subprocess.run([sel4_info_getter_path], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to call sel4 info getter with error: {result.stderr}")
+        sel4_info = json.loads(result.stdout)
+
+    # Failing to write the cache only costs speed, e.g. if the build directory is read-only
+    try:
+        tmp_cache_path = cache_path.with_name(cache_path.name + '.tmp')
+        with open(tmp_cache_path, 'w') as f:
+            json.dump({'mtime': getter_mtime, 'sha256': getter_hash, 'sel4_info': sel4_info}, f)
+        os.replace(tmp_cache_path, cache_path)
+    except OSError:
+        pass
+
+    return sel4_info
@@ -4,7 +4,7 @@ import tailspring.ts_enums as ts_enums
 import tailspring.paging as paging
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple, Type
 import argparse
 
 
@@ -14,21 +14,35 @@ class Context:
 
     # These are gathered from cli arguments
     config: dict = field(default_factory=dict)
+    config_path: Path = None
+    sel4_info_getter_path: Path = None
     gcc_path: Path = None
     output_header_path: Path = None
     output_startup_threads_obj_path: Path = None
+    depfile_path: Path = None  # Optional, only written if given
+    variants: List[ts_types.Variant] = field(default_factory=list)  # Only set with --variant, in the run's context rather than the variants'
+    report_path: str = None  # '-' to print the report, otherwise the path to write it to as JSON. None if not reporting
     # All the startup threads need to be loaded from some binary image, although it's inconvenient to
     # write out the path to the binary every time in the config file. Instead, the thread binaries are
     # referenced by name, and a mapping of name -> path is passed in as an argument which is stored here
     startup_threads_paths: Dict[str, Path] = field(default_factory=dict)
     sel4_info: dict = field(default_factory=dict)  # This is set by invoking the executable passed as the sel4_info_getter
+    # Parsed thread binaries by path. Normally empty at the start, but the daemon hands in the ones from earlier builds
+    elf_images: Dict[Path, ts_types.ELFImage] = field(default_factory=dict)
+    # Chunk object files made so far in this run, by chunk name and hash of the chunk's data. Shared between variants
+    chunk_objects: Dict[Tuple[str, bytes], Path] = field(default_factory=dict)
 
     # These are pulled directly from sel4_info
     arch: ts_enums.Arch = None
     page_size_bits: int = None
     page_size: int = None
+    max_num_nodes: int = None  # Number of cores the kernel was configured for
+    mcs: bool = None  # Whether the kernel uses the MCS scheduler, where threads need a scheduling context to run
     temp_dir: Path = None
 
+    # CapType with the values for this arch filled in. Every cap type used in a build comes from here
+    cap_types: Type[ts_enums.CapType] = None
+
     # Some cap types can't be derived from or copied
     underivable_cap_types: List[ts_enums.CapType] = field(default_factory=list)
 
@@ -37,6 +51,9 @@ class Context:
     cap_modifications: Dict[str, ts_types.CapModification] = field(default_factory=dict)
     vspaces: Dict[str, ts_types.VSpace] = field(default_factory=dict)  # Maps vspace name to vspace object
     threads: Dict[str, ts_types.Thread] = field(default_factory=dict)  # Maps thread name (tcb name) to thread object
+    shared_regions: Dict[str, ts_types.SharedRegion] = field(default_factory=dict)  # Maps shared region name to shared region object
+    asid_pools: List[ts_types.ASIDPool] = field(default_factory=list)  # Only the pools the loader makes, not the root task's
+    num_cache_colors: int = 1
 
     # Optional cnode that can be designated to store leftover general purpose untypeds (i.e. the rest of the system's non-device memory)
     # after tailspring is done allocating objects. Only one cnode can be set for this
@@ -44,6 +61,15 @@ class Context:
 
     device_untypeds_cnode: ts_types.CNode = None  # Same as above but for device memory
 
+    # Optional cnode that gets the frames of the loader's image and boot info that it no longer needs once everything is set up
+    reclaimed_frames_cnode: ts_types.CNode = None
+
+    # The info frames are shared by the whole system. Each vspace that needs one maps a read-only copy
+    # There are up to two system info frames, keyed by whether they hold the framebuffer info
+    system_info_frames: Dict[bool, ts_types.Cap] = field(default_factory=dict)
+    gp_memory_info_frame: ts_types.Cap = None  # Only created if gp_untypeds_cnode is set
+    device_memory_info_frame: ts_types.Cap = None  # Only created if device_untypeds_cnode is set
+
     # List of operations
     ops_list: List[op_types.Operation] = field(default_factory=list)
 
@@ -0,0 +1,199 @@
+from tailspring.context import Context
+import tailspring.ts_types as ts_types
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import argparse
+import io
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+# Runs one build in the daemon's process, given the context to fill in and the build's arguments
+BuildFunc = Callable[[Context, List[str]], None]
+
+
+# Each message is a single line of JSON
+def send_message(f, message: dict):
+    f.write(json.dumps(message).encode() + b'\n')
+    f.flush()
+
+
+def receive_message(f) -> Optional[dict]:
+    line = f.readline()
+    return json.loads(line) if line else None
+
+
+# Hands the build to the daemon listening on the socket given with --daemon-socket, and passes on its output.
+# Returns the build's exit code, or None if no socket was given or no daemon answered, so that the caller builds by itself
+def request_build(argv: List[str]) -> Optional[int]:
+    # Only --daemon-socket is looked at here, the daemon parses the rest
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--daemon-socket', dest='daemon_socket_path')
+    args, _ = parser.parse_known_args(argv)
+    if args.daemon_socket_path is None:
+        return None
+
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(args.daemon_socket_path)
+    except OSError:
+        return None
+
+    with sock, sock.makefile('rwb') as f:
+        send_message(f, {'argv': argv, 'cwd': os.getcwd()})
+        # The daemon hangs up without replying if it's about to exit, e.g. because the generator's sources changed
+        reply = receive_message(f)
+    if reply is None:
+        return None
+
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['returncode']
+
+
+def get_mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+# The daemon can't pick up changes to its own code, so it exits when any of it changes
+def get_source_paths() -> List[Path]:
+    package_dir = Path(__file__).resolve().parent
+    return sorted(package_dir.glob('*.py')) + sorted(package_dir.parent.glob('*.py'))
+
+
+class Daemon:
+    def __init__(self, build_func: BuildFunc):
+        self.build_func = build_func
+        # Kept between builds, so that a binary is only parsed again once it changes
+        self.elf_images: Dict[Path, ts_types.ELFImage] = {}
+        self.source_mtimes = {path: get_mtime(path) for path in get_source_paths()}
+
+        # The last build, which is rerun whenever one of its inputs changes so that its outputs are already up to date
+        # by the time the build system asks for them
+        self.last_argv: Optional[List[str]] = None
+        self.last_cwd: Optional[str] = None
+        self.last_reply: Optional[dict] = None
+        self.input_mtimes: Dict[Path, Optional[int]] = {}  # Inputs of the last build, with their mtimes when it started
+        self.output_paths: List[Path] = []
+
+    def sources_changed(self) -> bool:
+        return any(get_mtime(path) != mtime for path, mtime in self.source_mtimes.items())
+
+    # Returns the first input of the last build that changed since it started, or None
+    def get_changed_input(self) -> Optional[Path]:
+        for path, mtime in self.input_mtimes.items():
+            if get_mtime(path) != mtime:
+                return path
+        return None
+
+    def build(self, argv: List[str], cwd: str) -> dict:
+        # The inputs of a build are only known once its arguments are parsed, so the mtimes of the last build's inputs are
+        # taken before it starts. If one changes while the build runs, the next poll sees it and builds again
+        mtimes_before = {path: get_mtime(path) for path in self.input_mtimes}
+
+        ctx = Context()
+        ctx.elf_images = self.elf_images
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        returncode = 0
+        # Builds are run one at a time, so the daemon can move into the directory the build was asked for from
+        old_cwd = os.getcwd()
+        os.chdir(cwd)
+        try:
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    self.build_func(ctx, argv)
+                except SystemExit as e:
+                    # Raised by argparse for bad arguments
+                    returncode = e.code if isinstance(e.code, int) else 1
+                except Exception:
+                    traceback.print_exc()
+                    returncode = 1
+
+            inputs = [ctx.config_path, ctx.sel4_info_getter_path] + list(ctx.startup_threads_paths.values())
+            inputs += [variant.config_path for variant in ctx.variants]
+            input_paths = [path.resolve() for path in inputs if path is not None]
+            outputs = [ctx.output_header_path, ctx.output_startup_threads_obj_path, ctx.depfile_path]
+            if ctx.report_path is None:
+                outputs += [path for variant in ctx.variants for path in (variant.output_header_path, variant.output_startup_threads_obj_path)]
+            self.output_paths = [path.resolve() for path in outputs if path is not None]
+        finally:
+            os.chdir(old_cwd)
+
+        self.input_mtimes = {path: mtimes_before[path] if path in mtimes_before else get_mtime(path) for path in input_paths}
+        self.last_argv = argv
+        self.last_cwd = cwd
+        self.last_reply = {'returncode': returncode, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+        return self.last_reply
+
+    # A request for the same build as last time is answered straight away if nothing it depends on changed
+    def handle_request(self, argv: List[str], cwd: str) -> dict:
+        if (argv == self.last_argv and cwd == self.last_cwd and self.get_changed_input() is None and
+                all(path.exists() for path in self.output_paths)):
+            return self.last_reply
+        return self.build(argv, cwd)
+
+    def poll(self):
+        if self.last_argv is None:
+            return
+        changed_input = self.get_changed_input()
+        if changed_input is not None:
+            start = time.perf_counter()
+            reply = self.build(self.last_argv, self.last_cwd)
+            result = 'done' if reply['returncode'] == 0 else 'failed'
+            print(f"{changed_input} changed, rebuilt in {time.perf_counter() - start:.3f} s ({result})", flush=True)
+
+
+# Serves builds on a Unix socket until the generator's own sources change. Inputs are polled every poll_interval seconds
+def serve(socket_path: Path, poll_interval: float, build_func: BuildFunc):
+    if socket_path.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(socket_path))
+        except OSError:
+            # Left behind by a daemon that didn't shut down cleanly
+            socket_path.unlink()
+        else:
+            raise RuntimeError(f"A daemon is already listening on {socket_path}")
+        finally:
+            probe.close()
+
+    daemon = Daemon(build_func)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen()
+    server.settimeout(poll_interval)
+    print(f"Listening on {socket_path}", flush=True)
+    try:
+        while not daemon.sources_changed():
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                daemon.poll()
+                continue
+
+            conn.settimeout(None)
+            try:
+                with conn, conn.makefile('rwb') as f:
+                    request = receive_message(f)
+                    # Hanging up makes the client build by itself
+                    if request is None or daemon.sources_changed():
+                        continue
+                    start = time.perf_counter()
+                    reply = daemon.handle_request(request['argv'], request['cwd'])
+                    send_message(f, reply)
+            except OSError:
+                # The client went away, e.g. because the build was interrupted. The outputs are written either way
+                continue
+            print(f"Served a build in {time.perf_counter() - start:.3f} s", flush=True)
+        print("Generator sources changed, exiting", flush=True)
+    finally:
+        server.close()
+        socket_path.unlink()
@@ -1,4 +1,8 @@
 from tailspring.context import Context
+from pathlib import Path
+from typing import List
+import io
+import os
 
 
 def write_fragments(ctx: Context):
@@ -20,9 +24,7 @@ def write_ops_list_fragment(ctx: Context):
 
     # Format as C array
     f.write('CapOperation cap_operations[] = {\n')
-    for op in ctx.ops_list:
-        for op_list_entry in op.format_as_C_entry():
-            f.write(op_list_entry + ',\n')
+    f.write(''.join(op_list_entry + ',\n' for op in ctx.ops_list for op_list_entry in op.format_as_C_entry()))
     f.write('};\n')
 
 
@@ -35,12 +37,48 @@ def write_extern_linker_symbols_fragment(ctx: Context):
     f = ctx.extern_linker_symbols_fragment
     for vspace_name, vspace in ctx.vspaces.items():
         for chunk in vspace.binary_chunks:
-            f.write(f'extern void* {chunk.start_symbol};\n')
+            if chunk.shared_from is None:
+                f.write(f'extern void* {chunk.start_symbol};\n')
 
 
 def flush_fragments(ctx: Context):
-    with open(ctx.output_header_path, 'w') as f:
-        ctx.preamble_fragment.flush(f)
-        ctx.extern_linker_symbols_fragment.flush(f)
-        ctx.mapping_funcs_enable_fragment.flush(f)
-        ctx.ops_fragment.flush(f)
+    # Fragments are flushed into a buffer first so the header is only rewritten if it changed
+    buffer = io.StringIO()
+    ctx.preamble_fragment.flush(buffer)
+    ctx.extern_linker_symbols_fragment.flush(buffer)
+    ctx.mapping_funcs_enable_fragment.flush(buffer)
+    ctx.ops_fragment.flush(buffer)
+    write_if_changed(ctx.output_header_path, buffer.getvalue().encode())
+
+
+# Leaves the file (and its mtime) untouched if it already has the same contents, so that
+# anything depending on it isn't rebuilt. Returns whether the file was written
+def write_if_changed(path: Path, data: bytes) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    # Write to a temporary file first so an interrupted build never leaves a half written output behind
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+# Writes a Make style depfile listing every file the generator read, so the build system can rerun it exactly when needed.
+# Each build gets its own rule, as each variant's header depends on its own config
+def write_depfile(depfile_path: Path, ctxs: List[Context]):
+    def escape(path: Path) -> str:
+        return str(path).replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+    rules = []
+    for ctx in ctxs:
+        # Only the thread binaries that are actually loaded into a vspace feed the output
+        inputs = [ctx.config_path, ctx.sel4_info_getter_path] + sorted({vspace.binary_path for vspace in ctx.vspaces.values()})
+        deps = ' \\\n  '.join(escape(path.resolve()) for path in inputs)
+        rules.append(f'{escape(ctx.output_header_path.resolve())}: \\\n  {deps}\n')
+    write_if_changed(depfile_path, ''.join(rules).encode())
@@ -0,0 +1,201 @@
+import tailspring.context as context
+import tailspring.ts_enums as ts_enums
+import tailspring.ts_types as ts_types
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import bisect
+
+
+# A region of a vspace that the layout engine needs to place, such as a stack or an IPC buffer
+@dataclass
+class Region:
+    name: str
+    size: int  # Multiple of the page size
+    vaddr: Optional[int] = None  # Set beforehand if the region is pinned, otherwise filled in by the layout engine
+    guard_below: int = 0  # Bytes directly below the region that must be left unmapped, e.g. so a stack overrun faults
+    alignment: Optional[int] = None  # Defaults to the size of page_type
+    page_type: Optional[ts_enums.CapType] = None  # Type of page the region is mapped with, or None for the smallest page
+    reserve_above: int = 0  # Unmapped bytes directly above the region that must be left free, e.g. for a heap to grow into
+
+
+# Disjoint half-open intervals kept sorted by lower bound, so that lookups are a binary search
+class IntervalIndex:
+    def __init__(self):
+        self.lowers: List[int] = []
+        self.uppers: List[int] = []
+        self.names: List[str] = []
+
+    # Returns the name of an interval overlapping [lower, upper), or None if the range is free
+    def find_overlap(self, lower: int, upper: int) -> Optional[str]:
+        # Since the intervals are disjoint, the last one starting below upper also ends the highest of those that do,
+        # so it's the only one that needs to be checked
+        i = bisect.bisect_left(self.lowers, upper) - 1
+        if i >= 0 and self.uppers[i] > lower:
+            return self.names[i]
+        return None
+
+    def add(self, lower: int, upper: int, name: str):
+        overlap = self.find_overlap(lower, upper)
+        if overlap is not None:
+            raise ValueError(f"'{name}' @ [{hex(lower)}, {hex(upper)}) overlaps with '{overlap}'")
+
+        i = bisect.bisect_left(self.lowers, lower)
+        self.lowers.insert(i, lower)
+        self.uppers.insert(i, upper)
+        self.names.insert(i, name)
+
+    # Yields the free gaps inside [lower, upper) as (lower, upper) tuples, from lowest to highest
+    def gaps(self, lower: int, upper: int) -> Iterator[Tuple[int, int]]:
+        curr = lower
+        # Skip intervals that end at or below the start of the range
+        for i in range(bisect.bisect_right(self.uppers, lower), len(self.lowers)):
+            if self.lowers[i] >= upper:
+                break
+            if self.lowers[i] > curr:
+                yield curr, self.lowers[i]
+            curr = max(curr, self.uppers[i])
+        if curr < upper:
+            yield curr, upper
+
+
+# Keeps track of which paging structures a vspace needs so far, to price where a region would be cheapest to place.
+# Structures are identified by their type and their vaddr shifted down by the number of bits they cover
+class PagingCost:
+    def __init__(self, ctx: 'context.Context'):
+        self.arch_info = ctx.paging_arch_info
+        # There is always exactly one topmost structure (the vspace itself), so only the ones below it are tracked
+        self.present: Dict[ts_enums.CapType, Set[int]] = {structure: set() for structure in self.arch_info.order[1:-1]}
+
+    def __needed(self, lower: int, upper: int, page_type: Optional[ts_enums.CapType]) -> Iterator[Tuple[ts_enums.CapType, int]]:
+        if upper <= lower:
+            return
+        parent = self.arch_info.get_parent_structure(page_type)
+        for structure in self.arch_info.order[1:self.arch_info.order.index(parent) + 1]:
+            span_bits = self.arch_info.sum_bits_up_to_structure(structure)
+            for index in range(lower >> span_bits, ((upper - 1) >> span_bits) + 1):
+                yield structure, index
+
+    # How many new paging structures would be needed to map [lower, upper)
+    def cost(self, lower: int, upper: int, page_type: Optional[ts_enums.CapType] = None) -> int:
+        return sum(1 for structure, index in self.__needed(lower, upper, page_type) if index not in self.present[structure])
+
+    def add(self, lower: int, upper: int, page_type: Optional[ts_enums.CapType] = None):
+        for structure, index in self.__needed(lower, upper, page_type):
+            self.present[structure].add(index)
+
+    # Returns the (lower, upper) ranges covered by the structures of the given type that are needed so far
+    def ranges(self, structure: ts_enums.CapType) -> List[Tuple[int, int]]:
+        span_bits = self.arch_info.sum_bits_up_to_structure(structure)
+        return [(index << span_bits, (index + 1) << span_bits) for index in sorted(self.present[structure])]
+
+    def counts(self) -> Dict[ts_enums.CapType, int]:
+        return {structure: len(indexes) for structure, indexes in self.present.items()}
+
+
+def align_up(val: int, alignment: int) -> int:
+    return val + (-val % alignment)
+
+
+def align_down(val: int, alignment: int) -> int:
+    return val - (val % alignment)
+
+
+class VSpaceLayout:
+    def __init__(self, vspace: ts_types.VSpace, ctx: 'context.Context'):
+        self.vspace = vspace
+        self.ctx = ctx
+        self.index = IntervalIndex()
+        self.paging_cost = PagingCost(ctx)
+
+        # Regions are placed no lower than the ELF image, so that small offsets from a null pointer never land in mapped memory,
+        # and stay in the lower half of the address space that user threads can use
+        self.search_lower = min(chunk.dest_vaddr_aligned for chunk in vspace.binary_chunks)
+        self.search_upper = 1 << (ctx.paging_arch_info.sum_bits_up_to_structure(ctx.paging_arch_info.get_topmost_structure()) - 1)
+
+        # Everything that was already given an address in the config
+        for chunk in vspace.binary_chunks:
+            self.reserve(chunk.dest_vaddr_aligned, chunk.dest_vaddr_aligned + chunk.total_length_with_padding, chunk.name)
+
+        for shared_region in ctx.shared_regions.values():
+            for mapping in shared_region.mappings:
+                if mapping.vspace == vspace:
+                    self.reserve(mapping.vaddr, mapping.vaddr + shared_region.size, shared_region.name, shared_region.page_type)
+
+        for device_mapping in vspace.device_mappings:
+            self.reserve(device_mapping.vaddr, device_mapping.vaddr + device_mapping.size, f'device mapping @ {hex(device_mapping.paddr)}')
+
+    # Only [lower, upper) is mapped. The reserve_above bytes above it are kept free, but need no paging structures
+    def reserve(self, lower: int, upper: int, name: str, page_type: Optional[ts_enums.CapType] = None, guard_below: int = 0,
+                reserve_above: int = 0):
+        if guard_below:
+            self.index.add(lower - guard_below, lower, f'{name} guard')
+        self.index.add(lower, upper + reserve_above, name)
+        self.paging_cost.add(lower, upper, page_type)
+
+    # Pinned regions are reserved first, then the rest are placed biggest first. Each region goes wherever it needs the fewest
+    # new paging structures, so small regions fill up the page tables that are already needed before new ones are created
+    def place_regions(self, regions: List[Region]):
+        for region in regions:
+            if region.alignment is None:
+                region.alignment = 1 << self.ctx.paging_arch_info.get_page_bits(region.page_type or self.ctx.paging_arch_info.order[-1])
+
+        for region in regions:
+            if region.vaddr is not None:
+                if region.vaddr % region.alignment != 0:
+                    raise ValueError(f"Pinned vaddr {hex(region.vaddr)} of '{region.name}' in VSpace '{self.vspace.name}' must be aligned to {hex(region.alignment)}")
+                self.reserve(region.vaddr, region.vaddr + region.size, region.name, region.page_type, region.guard_below,
+                             region.reserve_above)
+
+        for region in sorted((region for region in regions if region.vaddr is None), key=lambda r: r.size + r.reserve_above,
+                             reverse=True):
+            region.vaddr = self.__find_cheapest_vaddr(region)
+            self.reserve(region.vaddr, region.vaddr + region.size, region.name, region.page_type, region.guard_below,
+                         region.reserve_above)
+
+    def __find_cheapest_vaddr(self, region: Region) -> int:
+        parent = self.ctx.paging_arch_info.get_parent_structure(region.page_type)
+        parent_span = 1 << self.ctx.paging_arch_info.sum_bits_up_to_structure(parent)
+        # Space the region takes up, of which only the first region.size bytes cost paging structures
+        extent = region.size + region.reserve_above
+
+        # Candidate start addresses: the lowest and highest spot in every free gap inside the structures that are
+        # already needed, plus the first fit in the whole vspace, both as-is and starting on a fresh structure boundary
+        candidates = []
+        search_ranges = [(max(lower, self.search_lower), min(upper, self.search_upper)) for lower, upper in self.paging_cost.ranges(parent)]
+        for search_lower, search_upper in search_ranges:
+            for gap_lower, gap_upper in self.index.gaps(search_lower, search_upper):
+                candidates.append(align_up(gap_lower + region.guard_below, region.alignment))
+                candidates.append(align_down(gap_upper - extent, region.alignment))
+
+        for alignment in (region.alignment, max(region.alignment, parent_span)):
+            for gap_lower, gap_upper in self.index.gaps(self.search_lower, self.search_upper):
+                start = align_up(gap_lower + region.guard_below, alignment)
+                if start + extent <= gap_upper:
+                    candidates.append(start)
+                    break
+
+        best = None
+        for start in candidates:
+            if start - region.guard_below < self.search_lower or start + extent > self.search_upper:
+                continue
+            if self.index.find_overlap(start - region.guard_below, start + extent) is not None:
+                continue
+            cost = (self.paging_cost.cost(start, start + region.size, region.page_type), start)
+            if best is None or cost < best:
+                best = cost
+
+        if best is None:
+            raise RuntimeError(f"Could not find space for '{region.name}' ({hex(extent)} bytes) in VSpace '{self.vspace.name}'")
+        return best[1]
+
+    def report(self):
+        counts = self.paging_cost.counts()
+        counts_str = ', '.join(f"{count} {structure.name}" for structure, count in counts.items())
+        print(f"  {self.vspace.name}: 1 {self.ctx.paging_arch_info.get_topmost_structure().name}, {counts_str}")
+
+
+# Assigns a vaddr to every region that wasn't pinned, and returns the layout so the caller can report its cost
+def lay_out_vspace(vspace: ts_types.VSpace, regions: List[Region], ctx: 'context.Context') -> VSpaceLayout:
+    vspace_layout = VSpaceLayout(vspace, ctx)
+    vspace_layout.place_regions(regions)
+    return vspace_layout
@@ -1,34 +1,52 @@
 from tailspring.context import Context
 import tailspring.ts_types as ts_types
+from tailspring.fragment_gen import write_if_changed
+from typing import Dict
+import hashlib
+import os
 import subprocess
 from pathlib import Path
 
 
 def gen_startup_threads_obj_file(ctx: Context):
     # Create all the object files for every chunk
+    chunk_obj_paths: Dict[str, Path] = {}
     for vspace_name, vspace in ctx.vspaces.items():
-        gen_obj_files_for_vspace(vspace, ctx)
+        gen_obj_files_for_vspace(vspace, chunk_obj_paths, ctx)
 
     # Write linker script that links object files together
     linker_script_path = ctx.output_startup_threads_obj_path.parent / 'script.ld'
     write_linker_script(linker_script_path)
 
-    # We need to get the file paths for every chunk
-    all_chunks = [chunk for vspace in ctx.vspaces.values() for chunk in vspace.binary_chunks]
-    all_chunk_paths = [chunk.get_path(ctx.temp_dir) for chunk in all_chunks]
+    # We need to get the file paths for every chunk. Chunks that share another chunk's frames aren't in the image
+    all_chunks = [chunk for vspace in ctx.vspaces.values() for chunk in vspace.binary_chunks if chunk.shared_from is None]
+    all_chunk_paths = [chunk_obj_paths[chunk.name] for chunk in all_chunks]
 
-    # Finally, link all the segments together into the final obj file, containing the data of every startup thread
+    # Finally, link all the segments together into the final obj file, containing the data of every startup thread.
+    # It's linked to a temporary path first so that the real output is only touched if it changed
+    output_path = ctx.output_startup_threads_obj_path
+    linked_obj_path = output_path.with_name(output_path.name + '.tmp')
     result = subprocess.run([ctx.gcc_path,  # GCC path
                              '-static', '-nostdlib', '-Wl,-r,--build-id=none',  # Flags
                              '-Wl,-T', linker_script_path,  # Linker script
-                             '-o', ctx.output_startup_threads_obj_path  # Output file
+                             '-o', linked_obj_path  # Output file
                              ] + all_chunk_paths,  # Input files
                             capture_output=True, text=True)
     if result.returncode != 0:
+        linked_obj_path.unlink(missing_ok=True)
         raise RuntimeError(f"Failed to generate startup threads object file with linker error: {result.stderr}")
 
+    try:
+        unchanged = output_path.read_bytes() == linked_obj_path.read_bytes()
+    except OSError:
+        unchanged = False
+    if unchanged:
+        linked_obj_path.unlink()
+    else:
+        os.replace(linked_obj_path, output_path)
 
-def gen_obj_files_for_vspace(vspace: ts_types.VSpace, ctx: Context):
+
+def gen_obj_files_for_vspace(vspace: ts_types.VSpace, chunk_obj_paths: Dict[str, Path], ctx: Context):
     chunks_sorted = sorted(vspace.binary_chunks, key=lambda chunk: chunk.dest_vaddr_aligned)
     # Make sure chunks don't overlap
     for i in range(len(chunks_sorted)-1):
@@ -39,25 +57,41 @@ def gen_obj_files_for_vspace(vspace: ts_types.VSpace, ctx: Context):
             raise RuntimeError(f"Chunk '{fst_chunk.name}' @ {hex(fst_chunk.dest_vaddr)} overlaps with chunk '{snd_chunk.name}' @ {hex(snd_chunk.dest_vaddr)} in VSpace '{vspace.name}'")
 
     for chunk in chunks_sorted:
-        gen_obj_file_for_chunk(chunk, ctx)
+        if chunk.shared_from is None:
+            chunk_obj_paths[chunk.name] = gen_obj_file_for_chunk(chunk, ctx)
+
 
+# Returns the path of the chunk's object file
+def gen_obj_file_for_chunk(chunk: ts_types.BinaryChunk, ctx: Context) -> Path:
+    # An earlier variant in this run may have made an object from the same chunk already. Its symbols only depend on the
+    # chunk's name, so the object can be linked in as it is
+    key = (chunk.name, hashlib.sha256(chunk.data_aligned).digest())
+    if key in ctx.chunk_objects:
+        return ctx.chunk_objects[key]
+    chunk_obj_path = chunk.get_path(ctx.temp_dir)
+    ctx.chunk_objects[key] = chunk_obj_path
 
-def gen_obj_file_for_chunk(chunk: ts_types.BinaryChunk, ctx: Context):
-    # Write .bin file containing raw dump of segment contents
-    chunk_bin_path = chunk.get_path(ctx.temp_dir).with_suffix('.bin')
-    with open(chunk_bin_path, 'wb') as f:
-        f.write(chunk.data_aligned)
+    # Write .bin file containing raw dump of segment contents. If it's the same as the last build's, the object file made
+    # from it is still up to date, so only the chunks of vspaces that changed go through the linker again
+    chunk_bin_path = chunk_obj_path.with_suffix('.bin')
+    if not write_if_changed(chunk_bin_path, chunk.data_aligned) and chunk_obj_path.is_file():
+        return chunk_obj_path
 
     # Finally, we use the linker (called through gcc) to transform the raw .bin file into a linkable object file
     # The linker will automatically add start, end, and size symbols with a prefix that depends on the input file path,
-    # so we set our cwd to the output directory and use relative paths to avoid ridiculously long symbol names
+    # so we set our cwd to the output directory and use relative paths to avoid ridiculously long symbol names.
+    # The object is linked to a temporary path, so that an interrupted link never leaves a broken object next to a matching .bin
+    tmp_obj_path = chunk_obj_path.with_name(chunk_obj_path.name + '.tmp')
     result = subprocess.run([ctx.gcc_path,  # GCC path
                              '-static', '-nostdlib', '-fno-lto', '-Wl,-r,-b,binary',  # Flags
                              chunk_bin_path.name,  # Input file
-                             '-o', chunk.get_path(ctx.temp_dir).name  # Output file
+                             '-o', tmp_obj_path.name  # Output file
                              ], cwd=ctx.temp_dir, capture_output=True, text=True)
     if result.returncode != 0:
+        chunk_bin_path.unlink()
         raise RuntimeError(f"Failed to generate chunk '{chunk.name}' with linker error: {result.stderr}")
+    os.replace(tmp_obj_path, chunk_obj_path)
+    return chunk_obj_path
 
 
 def write_linker_script(path: Path):
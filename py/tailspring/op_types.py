@@ -2,10 +2,13 @@
 
 import tailspring.ts_types as ts_types
 import tailspring.ts_enums as ts_enums
-from typing import List
+from typing import List, Optional
 
 
 class Operation:
+    # Large configs have hundreds of thousands of operations, so they don't carry a __dict__ each
+    __slots__ = ()
+
     # Format arguments as a designated initialized element of the C operation list
     @staticmethod
     def format_args_as_C_entry(op_name, **kwargs):
@@ -16,15 +19,45 @@ class Operation:
     def format_as_C_entry(self):
         raise NotImplementedError
 
+    # Rough number of syscalls the loader makes to carry out this operation, for the report.
+    # Returns one estimate for each entry returned by format_as_C_entry
+    def estimate_syscalls(self) -> List[int]:
+        raise NotImplementedError
+
+    # Caps in the loader's cnode that this operation reads, places into a slot, and leaves the slot of empty.
+    # Used to work out when each slot is free to be reused
+    def get_uses(self) -> List[ts_types.Cap]:
+        return []
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return []
+
+    def get_kills(self) -> List[ts_types.Cap]:
+        return []
+
 
 # Specifically for creating a cap that is *not* a cnode
 class CapCreateOperation(Operation):
+    __slots__ = ('dest', 'size_bits', 'bytes_required', 'dest_cnode', 'dest_index')
+
     def __init__(self, dest: ts_types.Cap, size_bits: int):
         self.dest = dest
         self.size_bits = size_bits
         self.bytes_required = 1 << size_bits
+        # Set by slot_alloc if the cap is created straight into the one cnode it ends up in, instead of the loader's
+        self.dest_cnode: Optional[ts_types.CNode] = None
+        self.dest_index = 0
 
     def format_as_C_entry(self) -> List[str]:
+        if self.dest_cnode is not None:
+            return [self.format_args_as_C_entry('create_op',
+                                                cap_type=self.dest.type.value,
+                                                bytes_required=self.bytes_required,
+                                                dest=self.dest_index,
+                                                dest_root=self.dest_cnode.address,
+                                                size_bits=self.size_bits,
+                                                dest_depth=self.dest_cnode.size + self.dest_cnode.guard
+                                                )]
         return [self.format_args_as_C_entry('create_op',
                                             cap_type=self.dest.type.value,
                                             bytes_required=self.bytes_required,
@@ -32,11 +65,22 @@ class CapCreateOperation(Operation):
                                             size_bits=self.size_bits
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [] if self.dest_cnode is None else [self.dest_cnode]
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return [self.dest] if self.dest_cnode is None else []
+
 
 class CNodeCreateOperation(Operation):
+    __slots__ = ('dest', 'bytes_required')
+
     # slot_bits is the log2 of the size of a CSlot in bytes
     def __init__(self, dest: ts_types.CNode, slot_bits: int):
-        assert (dest.type == ts_enums.CapType.cnode)
+        assert (isinstance(dest, ts_types.CNode))
         self.dest = dest
         self.bytes_required = 1 << (dest.size + slot_bits)
 
@@ -44,7 +88,7 @@ class CNodeCreateOperation(Operation):
         # Two ops are needed - one to create the CNode (which is initially placed in slot 0)
         # and then one to mutate it to its final location, setting its guard in the process
         return [self.format_args_as_C_entry('create_op',
-                                            cap_type=ts_enums.CapType.cnode.value,
+                                            cap_type=self.dest.type.value,
                                             bytes_required=self.bytes_required,
                                             dest=0,
                                             size_bits=self.dest.size
@@ -56,16 +100,36 @@ class CNodeCreateOperation(Operation):
                                             ),
                 ]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1, 1]
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return [self.dest]
+
 
 class MintOperation(Operation):
+    __slots__ = ('src', 'dest', 'rights', 'rights_str', 'badge', 'dest_cnode', 'dest_index')
+
     def __init__(self, src: ts_types.Cap, dest: ts_types.Cap, rights: List[ts_enums], badge: int):
         self.src = src
         self.dest = dest
         self.rights = rights
         self.rights_str = ts_enums.CapRight.list_to_C_expr(self.rights)
         self.badge = badge
+        # Set by slot_alloc if the cap is minted straight into the one cnode it ends up in, instead of the loader's
+        self.dest_cnode: Optional[ts_types.CNode] = None
+        self.dest_index = 0
 
     def format_as_C_entry(self) -> List[str]:
+        if self.dest_cnode is not None:
+            return [self.format_args_as_C_entry('mint_op',
+                                                badge=self.badge,
+                                                src=self.src.address,
+                                                dest=self.dest_index,
+                                                dest_root=self.dest_cnode.address,
+                                                rights=self.rights_str,
+                                                dest_depth=self.dest_cnode.size + self.dest_cnode.guard
+                                                )]
         return [self.format_args_as_C_entry('mint_op',
                                             badge=self.badge,
                                             src=self.src.address,
@@ -73,8 +137,19 @@ class MintOperation(Operation):
                                             rights=self.rights_str
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.src] if self.dest_cnode is None else [self.src, self.dest_cnode]
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return [self.dest] if self.dest_cnode is None else []
+
 
 class CopyOperation(Operation):
+    __slots__ = ('src', 'dest', 'index')
+
     def __init__(self, src: ts_types.Cap, dest: ts_types.CNode, index: int):
         assert (dest.caps[index] == src)
         self.src = src
@@ -89,8 +164,16 @@ class CopyOperation(Operation):
                                             dest_depth=self.dest.size + self.dest.guard
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.src, self.dest]
+
 
 class MoveOperation(Operation):
+    __slots__ = ('src', 'dest', 'index')
+
     def __init__(self, src: ts_types.Cap, dest: ts_types.CNode, index: int):
         assert (dest.caps[index] == src)
         self.src = src
@@ -105,8 +188,19 @@ class MoveOperation(Operation):
                                             dest_depth=self.dest.size + self.dest.guard
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.src, self.dest]
+
+    def get_kills(self) -> List[ts_types.Cap]:
+        return [self.src]
+
 
 class MapOperation(Operation):
+    __slots__ = ('service', 'vspace', 'vaddr', 'map_func')
+
     def __init__(self, service: ts_types.Cap, vspace: ts_types.Cap, vaddr: int, map_func: str):
         self.service = service
         self.vspace = vspace
@@ -121,27 +215,118 @@ class MapOperation(Operation):
                                             vspace=self.vspace.address
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.service, self.vspace]
+
 
 class BinaryChunkLoadOperation(Operation):
-    def __init__(self, src_vaddr_sym: str, dest_vaddr: int, length: int, dest_vspace: ts_types.VSpace):
+    __slots__ = ('src_vaddr_sym', 'dest_vaddr', 'length', 'dest_vspace', 'writable', 'page_size_bits')
+
+    def __init__(self, src_vaddr_sym: str, dest_vaddr: int, length: int, dest_vspace: ts_types.VSpace, writable: bool, page_size_bits: int):
         # src_vaddr is a string because it contains the linker symbol of the chunk's start address
         self.src_vaddr_sym = src_vaddr_sym
         self.dest_vaddr = dest_vaddr
         self.length = length
         self.dest_vspace = dest_vspace
+        self.writable = writable
+        self.page_size_bits = page_size_bits
 
     def format_as_C_entry(self) -> List[str]:
         return [self.format_args_as_C_entry('binary_chunk_load_op',
                                             src_vaddr=f'SYM_VAL({self.src_vaddr_sym})',
                                             dest_vaddr=self.dest_vaddr,
                                             length=self.length,
+                                            dest_vspace=self.dest_vspace.address,
+                                            writable=int(self.writable)
+                                            )]
+
+    # Each page is unmapped from the loader and mapped into the destination
+    def estimate_syscalls(self) -> List[int]:
+        return [2 * (self.length >> self.page_size_bits)]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.dest_vspace]
+
+
+# Maps read-only copies of the frames of a chunk that another vspace already loaded, instead of loading the same data twice
+class BinaryChunkShareOperation(Operation):
+    __slots__ = ('src_vaddr_sym', 'dest_vaddr', 'length', 'frames', 'dest_vspace', 'page_size_bits')
+
+    def __init__(self, src_vaddr_sym: str, dest_vaddr: int, length: int, frames: List[ts_types.Cap], dest_vspace: ts_types.VSpace, page_size_bits: int):
+        # src_vaddr is a string because it contains the linker symbol of the loaded chunk's start address
+        self.src_vaddr_sym = src_vaddr_sym
+        self.dest_vaddr = dest_vaddr
+        self.length = length
+        self.frames = frames
+        self.dest_vspace = dest_vspace
+        self.page_size_bits = page_size_bits
+
+    def format_as_C_entry(self) -> List[str]:
+        return [self.format_args_as_C_entry('binary_chunk_share_op',
+                                            src_vaddr=f'SYM_VAL({self.src_vaddr_sym})',
+                                            dest_vaddr=self.dest_vaddr,
+                                            length=self.length,
+                                            first_frame=self.frames[0].address,
                                             dest_vspace=self.dest_vspace.address
                                             )]
 
+    # Each frame cap is minted and then mapped
+    def estimate_syscalls(self) -> List[int]:
+        return [2 * (self.length >> self.page_size_bits)]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.dest_vspace]
+
+    # The copies are minted by offset from the first one, so they need consecutive slots
+    def get_defs(self) -> List[ts_types.Cap]:
+        return self.frames
+
+
+# Copies a chunk into frames that were already created, instead of mapping the loader's own image frames, so that the
+# frames can be chosen by color
+class BinaryChunkCopyOperation(Operation):
+    __slots__ = ('src_vaddr_sym', 'dest_vaddr', 'length', 'frames', 'dest_vspace', 'writable', 'page_size_bits')
+
+    def __init__(self, src_vaddr_sym: str, dest_vaddr: int, length: int, frames: List[ts_types.Cap], dest_vspace: ts_types.VSpace,
+                 writable: bool, page_size_bits: int):
+        # src_vaddr is a string because it contains the linker symbol of the chunk's start address
+        self.src_vaddr_sym = src_vaddr_sym
+        self.dest_vaddr = dest_vaddr
+        self.length = length
+        self.frames = frames
+        self.dest_vspace = dest_vspace
+        self.writable = writable
+        self.page_size_bits = page_size_bits
+
+    def format_as_C_entry(self) -> List[str]:
+        return [self.format_args_as_C_entry('binary_chunk_copy_op',
+                                            src_vaddr=f'SYM_VAL({self.src_vaddr_sym})',
+                                            dest_vaddr=self.dest_vaddr,
+                                            length=self.length,
+                                            first_frame=self.frames[0].address,
+                                            dest_vspace=self.dest_vspace.address,
+                                            writable=int(self.writable)
+                                            )]
+
+    # Each frame is mapped into the loader, filled, unmapped and then mapped into the destination
+    def estimate_syscalls(self) -> List[int]:
+        return [3 * (self.length >> self.page_size_bits)]
 
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.dest_vspace] + self.frames
+
+
+# Configures a TCB and then starts it - the registers are written with resume set, so no separate start is needed
 class TCBSetupOperation(Operation):
+    __slots__ = ('tcb', 'cspace', 'vspace', 'ipc_buffer', 'ipc_buffer_addr', 'entry_addr', 'stack_pointer_addr', 'arg0', 'arg1', 'arg2',
+                 'affinity', 'priority', 'max_priority', 'sched_context', 'budget', 'period')
+
     def __init__(self, tcb: ts_types.Cap, cspace: ts_types.Cap, vspace: ts_types.VSpace, ipc_buffer: ts_types.Cap,
-                 ipc_buffer_addr: int, entry_addr: int, stack_pointer_addr: int, arg0: int, arg1: int, arg2: int):
+                 ipc_buffer_addr: int, entry_addr: int, stack_pointer_addr: int, arg0: int, arg1: int, arg2: int, affinity: int,
+                 priority: int, max_priority: int, sched_context: Optional[ts_types.Cap], budget: Optional[int], period: Optional[int]):
         self.tcb = tcb
         self.cspace = cspace
         self.vspace = vspace
@@ -152,6 +337,12 @@ class TCBSetupOperation(Operation):
         self.arg0 = arg0
         self.arg1 = arg1
         self.arg2 = arg2
+        self.affinity = affinity
+        self.priority = priority
+        self.max_priority = max_priority
+        self.sched_context = sched_context
+        self.budget = budget
+        self.period = period
 
     def format_as_C_entry(self) -> List[str]:
         return [self.format_args_as_C_entry('tcb_setup_op',
@@ -161,14 +352,32 @@ class TCBSetupOperation(Operation):
                                             arg0=self.arg0,
                                             arg1=self.arg1,
                                             arg2=self.arg2,
+                                            budget=self.budget or 0,
+                                            period=self.period or 0,
                                             cspace=self.cspace.address,
                                             vspace=self.vspace.address,
                                             ipc_buffer=self.ipc_buffer.address,
-                                            tcb=self.tcb.address
+                                            tcb=self.tcb.address,
+                                            affinity=self.affinity,
+                                            sched_context=self.sched_context.address if self.sched_context else 0,
+                                            priority=self.priority,
+                                            max_priority=self.max_priority
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        # Configure and WriteRegisters, plus the scheduling context setup on MCS kernels
+        if self.sched_context is not None:
+            return [4]
+        return [2 + (self.affinity != 0) + (self.priority != 0 or self.max_priority != 0)]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        caps = [self.tcb, self.cspace, self.vspace, self.ipc_buffer]
+        return caps + [self.sched_context] if self.sched_context is not None else caps
+
 
 class MapFrameOperation(Operation):
+    __slots__ = ('frame', 'vspace', 'vaddr')
+
     def __init__(self, frame: ts_types.Cap, vspace: ts_types.VSpace, vaddr: int):
         # src_vaddr is a string because it contains the linker symbol of the segment's start address
         self.frame = frame
@@ -182,8 +391,50 @@ class MapFrameOperation(Operation):
                                             vspace=self.vspace.address
                                             )]
 
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.frame, self.vspace]
+
+
+# Retypes frames out of the device untyped that covers the mapping's physical address range, then maps them into the vspace
+class DeviceMapOperation(Operation):
+    __slots__ = ('device_mapping', 'vspace')
+
+    def __init__(self, device_mapping: ts_types.DeviceMapping, vspace: ts_types.VSpace):
+        self.device_mapping = device_mapping
+        self.vspace = vspace
+
+    def format_as_C_entry(self) -> List[str]:
+        first_frame = self.device_mapping.frames[0]
+        return [self.format_args_as_C_entry('device_map_op',
+                                            cap_type=first_frame.type.value,
+                                            paddr=self.device_mapping.paddr,
+                                            vaddr=self.device_mapping.vaddr,
+                                            num_frames=len(self.device_mapping.frames),
+                                            first_frame=first_frame.address,
+                                            vspace=self.vspace.address,
+                                            cached=int(self.device_mapping.cached)
+                                            )]
+
+    # Doesn't count the filler untypeds needed to move the watermark, since those depend on the device untypeds at boot.
+    # Assumes the default retype fan out limit of 256
+    def estimate_syscalls(self) -> List[int]:
+        num_frames = len(self.device_mapping.frames)
+        return [-(-num_frames // 256) + num_frames]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.vspace]
+
+    # The frames are retyped in one go, so they need consecutive slots
+    def get_defs(self) -> List[ts_types.Cap]:
+        return self.device_mapping.frames
+
 
 class RetypeLeftoverGPUntypedsOperation(Operation):
+    __slots__ = ('cnode_dest', 'start_slot', 'end_slot', 'cnode_depth')
+
     def __init__(self, cnode_dest: ts_types.CNode, start_slot: int, end_slot: int, cnode_depth: int):
         self.cnode_dest = cnode_dest
         self.start_slot = start_slot
@@ -198,8 +449,17 @@ class RetypeLeftoverGPUntypedsOperation(Operation):
                                             cnode_depth=self.cnode_depth
                                             )]
 
+    # Upper bound, the real number depends on the untypeds at boot
+    def estimate_syscalls(self) -> List[int]:
+        return [self.end_slot - self.start_slot]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.cnode_dest]
+
 
 class MoveDeviceUntypedsOperation(Operation):
+    __slots__ = ('cnode_dest', 'start_slot', 'end_slot', 'cnode_depth')
+
     def __init__(self, cnode_dest: ts_types.CNode, start_slot: int, end_slot: int, cnode_depth: int):
         self.cnode_dest = cnode_dest
         self.start_slot = start_slot
@@ -214,56 +474,162 @@ class MoveDeviceUntypedsOperation(Operation):
                                             cnode_depth=self.cnode_depth
                                             )]
 
+    # Upper bound, the real number depends on the untypeds at boot
+    def estimate_syscalls(self) -> List[int]:
+        return [self.end_slot - self.start_slot]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.cnode_dest]
+
+
+class ReclaimLoaderMemoryOperation(Operation):
+    __slots__ = ('cnode_dest', 'start_slot', 'end_slot', 'cnode_depth')
+
+    def __init__(self, cnode_dest: ts_types.CNode, start_slot: int, end_slot: int, cnode_depth: int):
+        self.cnode_dest = cnode_dest
+        self.start_slot = start_slot
+        self.end_slot = end_slot
+        self.cnode_depth = cnode_depth
+
+    def format_as_C_entry(self) -> List[str]:
+        return [self.format_args_as_C_entry('reclaim_loader_memory_op',
+                                            cnode_dest=self.cnode_dest.address,
+                                            start_slot=self.start_slot,
+                                            end_slot=self.end_slot,
+                                            cnode_depth=self.cnode_depth
+                                            )]
+
+    # Upper bound, the real number depends on the size of the loader's image
+    def estimate_syscalls(self) -> List[int]:
+        return [self.end_slot - self.start_slot]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.cnode_dest]
+
+
+# Writes where the frames of the ReclaimLoaderMemoryOperation will go into the general-purpose memory info. The info is
+# passed on before the threads start, while the frames can only be moved once they have
+class RecordReclaimedFramesOperation(ReclaimLoaderMemoryOperation):
+    def format_as_C_entry(self) -> List[str]:
+        return [self.format_args_as_C_entry('record_reclaimed_frames_op',
+                                            cnode_dest=self.cnode_dest.address,
+                                            start_slot=self.start_slot,
+                                            end_slot=self.end_slot,
+                                            cnode_depth=self.cnode_depth
+                                            )]
+
+    def estimate_syscalls(self) -> List[int]:
+        return [0]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return []
+
 
 class PassGPMemoryInfoOperation(Operation):
-    def __init__(self, dest_vaddr: int, frame: ts_types.Cap, dest_vspace: ts_types.VSpace):
-        self.dest_vaddr = dest_vaddr
+    __slots__ = ('frame',)
+
+    def __init__(self, frame: ts_types.Cap):
         self.frame = frame
-        self.dest_vspace = dest_vspace
 
     def format_as_C_entry(self) -> List[str]:
         return [self.format_args_as_C_entry('pass_gp_memory_info_op',
-                                            dest_vaddr=self.dest_vaddr,
-                                            frame=self.frame.address,
-                                            dest_vspace=self.dest_vspace.address
+                                            frame=self.frame.address
                                             )]
 
+    # Mapping the frame into the loader and unmapping it again
+    def estimate_syscalls(self) -> List[int]:
+        return [2]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.frame]
+
 
 class PassDeviceMemoryInfoOperation(Operation):
-    def __init__(self, dest_vaddr: int, frame: ts_types.Cap, dest_vspace: ts_types.VSpace):
-        self.dest_vaddr = dest_vaddr
+    __slots__ = ('frame',)
+
+    def __init__(self, frame: ts_types.Cap):
         self.frame = frame
-        self.dest_vspace = dest_vspace
 
     def format_as_C_entry(self) -> List[str]:
         return [self.format_args_as_C_entry('pass_device_memory_info_op',
-                                            dest_vaddr=self.dest_vaddr,
-                                            frame=self.frame.address,
-                                            dest_vspace=self.dest_vspace.address
+                                            frame=self.frame.address
                                             )]
 
+    # Mapping the frame into the loader and unmapping it again
+    def estimate_syscalls(self) -> List[int]:
+        return [2]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.frame]
+
 
 class PassSystemInfoOperation(Operation):
-    def __init__(self, dest_vaddr: int, frame: ts_types.Cap, dest_vspace: ts_types.VSpace, pass_framebuffer_info: bool):
-        self.dest_vaddr = dest_vaddr
+    __slots__ = ('frame', 'pass_framebuffer_info')
+
+    def __init__(self, frame: ts_types.Cap, pass_framebuffer_info: bool):
         self.frame = frame
-        self.dest_vspace = dest_vspace
         self.pass_framebuffer_info = pass_framebuffer_info
 
     def format_as_C_entry(self) -> List[str]:
         return [self.format_args_as_C_entry('pass_system_info_op',
-                                            dest_vaddr=self.dest_vaddr,
                                             frame=self.frame.address,
-                                            dest_vspace=self.dest_vspace.address,
                                             pass_framebuffer_info=int(self.pass_framebuffer_info)
                                             )]
 
+    # Mapping the frame into the loader and unmapping it again
+    def estimate_syscalls(self) -> List[int]:
+        return [2]
 
-class TCBStartOperation(Operation):
-    def __init__(self, tcb: ts_types.Cap):
-        self.tcb = tcb
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.frame]
+
+
+# Makes an ASID pool out of an untyped that is exactly the size of one
+class MakeASIDPoolOperation(Operation):
+    __slots__ = ('untyped', 'dest')
+
+    def __init__(self, untyped: ts_types.Cap, dest: ts_types.Cap):
+        self.untyped = untyped
+        self.dest = dest
 
     def format_as_C_entry(self) -> List[str]:
-        return [self.format_args_as_C_entry('tcb_start_op',
-                                            tcb=self.tcb.address
+        return [self.format_args_as_C_entry('make_asid_pool_op',
+                                            untyped=self.untyped.address,
+                                            dest=self.dest.address
                                             )]
+
+    def estimate_syscalls(self) -> List[int]:
+        return [1]
+
+    def get_uses(self) -> List[ts_types.Cap]:
+        return [self.untyped]
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return [self.dest]
+
+
+# Creates frames in consecutive slots, only out of memory whose cache color is in the mask. The color of a frame is its
+# physical page number modulo the number of colors
+class ColoredFramesCreateOperation(Operation):
+    __slots__ = ('frames', 'color_mask', 'num_colors')
+
+    def __init__(self, frames: List[ts_types.Cap], color_mask: int, num_colors: int):
+        self.frames = frames
+        self.color_mask = color_mask
+        self.num_colors = num_colors
+
+    def format_as_C_entry(self) -> List[str]:
+        return [self.format_args_as_C_entry('colored_frames_create_op',
+                                            frame_type=self.frames[0].type.value,
+                                            color_mask=hex(self.color_mask),
+                                            first_frame=self.frames[0].address,
+                                            num_frames=len(self.frames),
+                                            num_colors=self.num_colors
+                                            )]
+
+    # Frames of the wrong colors are skipped by retyping untypeds over them, which this doesn't count
+    def estimate_syscalls(self) -> List[int]:
+        return [len(self.frames)]
+
+    def get_defs(self) -> List[ts_types.Cap]:
+        return self.frames
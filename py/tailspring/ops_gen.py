@@ -1,19 +1,26 @@
 from tailspring.context import Context
 import tailspring.op_types as op_types
 import tailspring.ts_types as ts_types
+import tailspring.ts_enums as ts_enums
+from typing import Dict, List
 
 
 def gen_cap_ops_list(ctx: Context):
     gen_cap_create_ops(ctx)
     gen_cnode_create_ops(ctx)
+    gen_sched_context_create_ops(ctx)
+    gen_asid_pool_ops(ctx)
     gen_mint_ops(ctx)
     gen_copy_move_ops(ctx)
     gen_paging_ops(ctx)
+    gen_shared_region_ops(ctx)
+    gen_device_map_ops(ctx)
     gen_binary_chunk_load_ops(ctx)
+    gen_colored_frames_ops(ctx)
     gen_tcb_setup_ops(ctx)
     gen_retype_leftover_gp_untypeds_ops(ctx)
     gen_move_device_untypeds_ops(ctx)
-    gen_tcb_start_ops(ctx)
+    gen_reclaim_loader_memory_ops(ctx)
 
     sort_ops_list(ctx)
 
@@ -37,6 +44,23 @@ def gen_cnode_create_ops(ctx: Context):
         ctx.ops_list.append(cnode_create_op)
 
 
+# On MCS kernels, every thread gets its own scheduling context
+def gen_sched_context_create_ops(ctx: Context):
+    for thread in ctx.threads.values():
+        if thread.sched_context is not None:
+            size_bits = ctx.sel4_info['object_sizes'][thread.sched_context.type.value]
+            sched_context_create_op = op_types.CapCreateOperation(dest=thread.sched_context, size_bits=size_bits)
+            ctx.ops_list.append(sched_context_create_op)
+
+
+# Each extra ASID pool is made from an untyped retyped to the size of a pool, before any vspace is assigned to it
+def gen_asid_pool_ops(ctx: Context):
+    pool_bits = ctx.sel4_info['literals']['seL4_ASIDPoolBits']
+    for asid_pool in ctx.asid_pools:
+        ctx.ops_list.append(op_types.CapCreateOperation(dest=asid_pool.untyped, size_bits=pool_bits))
+        ctx.ops_list.append(op_types.MakeASIDPoolOperation(untyped=asid_pool.untyped, dest=asid_pool.pool))
+
+
 # Corresponds to mint operations to copy/modify the caps listed under the config's 'cap_modifications' section
 def gen_mint_ops(ctx: Context):
     for cap_mod in ctx.cap_modifications.values():
@@ -65,19 +89,92 @@ def gen_paging_ops(ctx: Context):
         paging_structure.gen_ops(vspace, ctx)
 
 
+# Creates the frames backing each shared region, then mints a copy of every frame for each vspace the region is mapped into
+def gen_shared_region_ops(ctx: Context):
+    for shared_region in ctx.shared_regions.values():
+        for frame in shared_region.frames:
+            ctx.ops_list.append(op_types.CapCreateOperation(dest=frame, size_bits=shared_region.page_size_bits))
+
+        for mapping in shared_region.mappings:
+            for frame_index, (frame, frame_copy) in enumerate(zip(shared_region.frames, mapping.frames)):
+                ctx.ops_list.append(op_types.MintOperation(src=frame, dest=frame_copy, rights=mapping.rights, badge=0))
+                frame_vaddr = mapping.vaddr + (frame_index << shared_region.page_size_bits)
+                ctx.ops_list.append(op_types.MapFrameOperation(frame=frame_copy, vspace=mapping.vspace, vaddr=frame_vaddr))
+
+
+# The loader can only retype device frames going upwards through each device untyped, so the ops need to be sorted by paddr
+def gen_device_map_ops(ctx: Context):
+    device_mappings = [(mapping, vspace) for vspace in ctx.vspaces.values() for mapping in vspace.device_mappings]
+    device_mappings.sort(key=lambda e: e[0].paddr)
+
+    for (fst_mapping, fst_vspace), (snd_mapping, snd_vspace) in zip(device_mappings, device_mappings[1:]):
+        if fst_mapping.paddr + fst_mapping.size > snd_mapping.paddr:
+            raise ValueError(f"Device mapping @ {hex(fst_mapping.paddr)} in VSpace '{fst_vspace.name}' overlaps with device mapping @ {hex(snd_mapping.paddr)} in VSpace '{snd_vspace.name}'")
+
+    for mapping, vspace in device_mappings:
+        ctx.ops_list.append(op_types.DeviceMapOperation(device_mapping=mapping, vspace=vspace))
+
+
+# Read-only chunks with the same contents (e.g. the code of vspaces replicated from one binary) are only loaded once,
+# every other vspace maps read-only copies of the loaded frames
 def gen_binary_chunk_load_ops(ctx: Context):
+    loaded_read_only_chunks: Dict[bytes, ts_types.BinaryChunk] = {}
     for vspace_name, vspace in ctx.vspaces.items():
         for chunk in vspace.binary_chunks:
-            chunk_load_op = op_types.BinaryChunkLoadOperation(src_vaddr_sym=chunk.start_symbol, dest_vaddr=chunk.dest_vaddr_aligned,
-                                                              length=chunk.total_length_with_padding, dest_vspace=vspace)
-            ctx.ops_list.append(chunk_load_op)
+            # The loader's image frames could have any color, so the chunks of colored vspaces are copied into frames
+            # of the right colors instead of being remapped or shared
+            if vspace.color_mask:
+                frames = create_chunk_frames(chunk, ctx)
+                vspace.colored_frames += frames
+                chunk_copy_op = op_types.BinaryChunkCopyOperation(src_vaddr_sym=chunk.start_symbol, dest_vaddr=chunk.dest_vaddr_aligned,
+                                                                  length=chunk.total_length_with_padding, frames=frames, dest_vspace=vspace,
+                                                                  writable=chunk.writable, page_size_bits=ctx.page_size_bits)
+                ctx.ops_list.append(chunk_copy_op)
+                continue
+
+            if not chunk.writable:
+                first_chunk = loaded_read_only_chunks.setdefault(chunk.data_aligned, chunk)
+                if first_chunk is not chunk:
+                    chunk.shared_from = first_chunk
+
+            if chunk.shared_from is None:
+                chunk_load_op = op_types.BinaryChunkLoadOperation(src_vaddr_sym=chunk.start_symbol, dest_vaddr=chunk.dest_vaddr_aligned,
+                                                                  length=chunk.total_length_with_padding, dest_vspace=vspace,
+                                                                  writable=chunk.writable, page_size_bits=ctx.page_size_bits)
+                ctx.ops_list.append(chunk_load_op)
+                continue
+
+            frames = create_chunk_frames(chunk, ctx)
+            chunk_share_op = op_types.BinaryChunkShareOperation(src_vaddr_sym=chunk.shared_from.start_symbol, dest_vaddr=chunk.dest_vaddr_aligned,
+                                                                length=chunk.total_length_with_padding, frames=frames, dest_vspace=vspace,
+                                                                page_size_bits=ctx.page_size_bits)
+            ctx.ops_list.append(chunk_share_op)
+
+
+def create_chunk_frames(chunk: ts_types.BinaryChunk, ctx: Context) -> List[ts_types.Cap]:
+    frames = []
+    for frame_index in range(chunk.total_length_with_padding // ctx.page_size):
+        frame = ts_types.Cap(name=f'{chunk.name}_frame{frame_index}__', type=ctx.cap_types.frame, can_be_derived=True)
+        ctx.cap_addresses.append(frame)
+        frames.append(frame)
+    return frames
+
+
+# All the frames of a colored vspace are created by one op, which only carves them out of memory of the vspace's colors
+def gen_colored_frames_ops(ctx: Context):
+    for vspace in ctx.vspaces.values():
+        if vspace.colored_frames:
+            ctx.ops_list.append(op_types.ColoredFramesCreateOperation(frames=vspace.colored_frames, color_mask=vspace.color_mask,
+                                                                      num_colors=ctx.num_cache_colors))
 
 
 def gen_tcb_setup_ops(ctx: Context):
     for thread in ctx.threads.values():
         tcb_setup_op = op_types.TCBSetupOperation(tcb=thread.tcb, cspace=thread.cspace, vspace=thread.vspace, ipc_buffer=thread.ipc_buffer,
                                                   entry_addr=thread.entry_addr, ipc_buffer_addr=thread.ipc_buffer_addr,
-                                                  stack_pointer_addr=thread.stack_pointer_addr, arg0=thread.arg0, arg1=thread.arg1, arg2=thread.arg2)
+                                                  stack_pointer_addr=thread.stack_pointer_addr, arg0=thread.arg0, arg1=thread.arg1, arg2=thread.arg2,
+                                                  affinity=thread.affinity, priority=thread.priority, max_priority=thread.max_priority,
+                                                  sched_context=thread.sched_context, budget=thread.budget, period=thread.period)
         ctx.ops_list.append(tcb_setup_op)
 
 
@@ -95,23 +192,31 @@ def gen_move_device_untypeds_ops(ctx: Context):
         ctx.ops_list.append(op)
 
 
-def gen_tcb_start_ops(ctx: Context):
-    for thread in ctx.threads.values():
-        tcb_start_op = op_types.TCBStartOperation(tcb=thread.tcb)
-        ctx.ops_list.append(tcb_start_op)
+def gen_reclaim_loader_memory_ops(ctx: Context):
+    if ctx.reclaimed_frames_cnode:
+        cnode_dest = ctx.reclaimed_frames_cnode
+        start_slot, end_slot, cnode_depth = cnode_dest.reclaimed_frames_start, cnode_dest.reclaimed_frames_end, cnode_dest.guard + cnode_dest.size
+        # The frames are recorded in the memory info before it is passed on, and moved once the threads are started
+        ctx.ops_list.append(op_types.RecordReclaimedFramesOperation(cnode_dest=cnode_dest, start_slot=start_slot, end_slot=end_slot, cnode_depth=cnode_depth))
+        ctx.ops_list.append(op_types.ReclaimLoaderMemoryOperation(cnode_dest=cnode_dest, start_slot=start_slot, end_slot=end_slot, cnode_depth=cnode_depth))
 
 
 def sort_ops_list(ctx: Context):
-    op_order = [op_types.MintOperation, op_types.MapOperation, op_types.CopyOperation, op_types.MoveOperation, op_types.BinaryChunkLoadOperation, op_types.MapFrameOperation,
-                op_types.TCBSetupOperation, op_types.RetypeLeftoverGPUntypedsOperation, op_types.MoveDeviceUntypedsOperation, op_types.PassGPMemoryInfoOperation,
-                op_types.PassDeviceMemoryInfoOperation, op_types.PassSystemInfoOperation, op_types.TCBStartOperation]
+    op_order = [op_types.ColoredFramesCreateOperation, op_types.MakeASIDPoolOperation, op_types.MintOperation, op_types.MapOperation, op_types.CopyOperation,
+                op_types.MoveOperation, op_types.BinaryChunkLoadOperation, op_types.BinaryChunkShareOperation, op_types.BinaryChunkCopyOperation,
+                op_types.MapFrameOperation, op_types.DeviceMapOperation, op_types.RetypeLeftoverGPUntypedsOperation,
+                op_types.MoveDeviceUntypedsOperation, op_types.RecordReclaimedFramesOperation, op_types.PassGPMemoryInfoOperation, op_types.PassDeviceMemoryInfoOperation, op_types.PassSystemInfoOperation, op_types.TCBSetupOperation,
+                op_types.ReclaimLoaderMemoryOperation]
+    # Looked up once per op, so a dict rather than searching op_order
+    op_rank = {op_type: i for i, op_type in enumerate(op_order)}
 
     def sort_func(e):
         # Create ops always go first, sorted by greatest size first
-        if type(e) in (op_types.CapCreateOperation, op_types.CNodeCreateOperation):
+        op_type = type(e)
+        if op_type is op_types.CapCreateOperation or op_type is op_types.CNodeCreateOperation:
             # -1 puts this op before the non-create ops, and -bytes_required means the greatest size comes first
             return -1, -e.bytes_required
         # Otherwise, sort them by op_order
-        return op_order.index(type(e)), 0
+        return op_rank[op_type], 0
 
     ctx.ops_list.sort(key=sort_func)
@@ -2,7 +2,7 @@ import tailspring.context as context
 import tailspring.ts_enums as ts_enums
 import tailspring.ts_types as ts_types
 import tailspring.op_types as op_types
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Type
 
 
 class Range:
@@ -20,7 +20,8 @@ class Range:
 
 
 class PagingArchInfo:
-    def __init__(self, arch: ts_enums.Arch):
+    # cap_types is CapType with the arch's values added, from ts_enums.get_CapType_for_arch
+    def __init__(self, arch: ts_enums.Arch, cap_types: Type[ts_enums.CapType]):
         # Order of paging structures from highest to lowest
         self.order: List[ts_enums.CapType] = []
 
@@ -30,21 +31,34 @@ class PagingArchInfo:
         # C name of the mapping function needed to map in a given paging structure, without any wrapper_ or ENABLE_ prefixes
         self.mapping_funcs: Dict[ts_enums.CapType, str] = {}
 
+        # Like the mapping function of the topmost structure, but assigns the vspace to an ASID pool made by the loader
+        # instead of the root task's. Enabled along with the topmost structure's mapping function
+        self.created_asid_pool_assign_func: Optional[str] = None
+
+        # Maps each type of page to the paging structure it is mapped into. The smallest page is the last element in the order,
+        # but larger pages can be mapped directly into a higher structure, skipping the structures in between
+        self.page_parents: Dict[ts_enums.CapType, ts_enums.CapType] = {}
+
         if arch == ts_enums.Arch.x86_64:
-            self.order = [ts_enums.CapType.pml4, ts_enums.CapType.pdpt, ts_enums.CapType.page_directory, ts_enums.CapType.page_table, ts_enums.CapType.x86_4K]
+            self.order = [cap_types.pml4, cap_types.pdpt, cap_types.page_directory, cap_types.page_table, cap_types.x86_4K]
             self.bits = {
-                ts_enums.CapType.pml4: 9,
-                ts_enums.CapType.pdpt: 9,
-                ts_enums.CapType.page_directory: 9,
-                ts_enums.CapType.page_table: 9,
-                ts_enums.CapType.x86_4K: 12
+                cap_types.pml4: 9,
+                cap_types.pdpt: 9,
+                cap_types.page_directory: 9,
+                cap_types.page_table: 9,
+                cap_types.x86_4K: 12
             }
             self.mapping_funcs = {
-                ts_enums.CapType.pml4: 'X86_ASIDPool_Assign',
-                ts_enums.CapType.pdpt: 'X86_PDPT_Map',
-                ts_enums.CapType.page_directory: 'X86_PageDirectory_Map',
-                ts_enums.CapType.page_table: 'X86_PageTable_Map',
-                ts_enums.CapType.x86_4K: 'X86_PAGE_MAP'
+                cap_types.pml4: 'X86_ASIDPool_Assign',
+                cap_types.pdpt: 'X86_PDPT_Map',
+                cap_types.page_directory: 'X86_PageDirectory_Map',
+                cap_types.page_table: 'X86_PageTable_Map',
+                cap_types.x86_4K: 'X86_PAGE_MAP'
+            }
+            self.created_asid_pool_assign_func = 'X86_ASIDPool_AssignToCreatedPool'
+            self.page_parents = {
+                cap_types.x86_4K: cap_types.page_table,
+                cap_types.x86_large_page: cap_types.page_directory
             }
 
     # Returns the next (lower) paging structure after the one passed in
@@ -73,6 +87,16 @@ class PagingArchInfo:
     def get_bits_for_structure(self, structure: ts_enums.CapType) -> int:
         return self.bits[structure]
 
+    # Returns the paging structure that pages of the given type are mapped into. Defaults to the smallest page
+    def get_parent_structure(self, page_type: Optional[ts_enums.CapType] = None) -> ts_enums.CapType:
+        if page_type is None:
+            page_type = self.order[-1]
+        return self.page_parents[page_type]
+
+    # Log2 of the size of a page of the given type, i.e. how many bits of address its parent structure leaves untranslated
+    def get_page_bits(self, page_type: ts_enums.CapType) -> int:
+        return self.sum_bits_up_to_structure(self.get_parent_structure(page_type)) - self.bits[self.get_parent_structure(page_type)]
+
     def get_mapping_func_for_structure(self, structure: ts_enums.CapType) -> str:
         return self.mapping_funcs[structure]
 
@@ -105,35 +129,35 @@ class PagingStructure:
     def get_addressable_range(self):
         return self.vaddr, self.vaddr + 1 << self.total_addressable_bits
 
-    def create_children_to_cover_range(self, range_to_cover: Range):
-        # If this object is the penultimate element in the order, we don't need to create any children because the
-        # next element would be the lowest structure (a single page) and we don't need to keep track of individual pages
-        if self.paging_arch_info.next_structure(self.paging_arch_info.next_structure(self.structure_type)) is None:
+    # page_type is the type of page that will be mapped into the range, or None for the smallest page
+    def create_children_to_cover_range(self, range_to_cover: Range, page_type: Optional[ts_enums.CapType] = None):
+        # If pages are mapped directly into this structure we don't need to create any children, because
+        # we don't need to keep track of individual pages. For the smallest pages this is the penultimate element in the order
+        if self.structure_type == self.paging_arch_info.get_parent_structure(page_type):
             return
 
         possible_children_num = 1 << self.addressable_bits
         children_total_addressable_bits = self.total_addressable_bits - self.addressable_bits
 
-        # For each paging structure that is lower than this one,
-        # see if its range would overlap with the ranges we need to load and create the structure if it does
-        for i in range(possible_children_num):
+        # The paging structures lower than this one that overlap with the range we need to load are the ones from the
+        # entry containing its lower bound to the entry containing its last byte, clamped to the entries this structure has
+        first_index = max((range_to_cover.lower - self.vaddr) >> children_total_addressable_bits, 0)
+        last_index = min((range_to_cover.upper - 1 - self.vaddr) >> children_total_addressable_bits, possible_children_num - 1)
+        for i in range(first_index, last_index + 1):
             candidate_vaddr_lower = self.vaddr + (i << children_total_addressable_bits)
-            candidate_vaddr_upper = candidate_vaddr_lower + (1 << children_total_addressable_bits)
-            candidate_vaddr_range = Range(candidate_vaddr_lower, candidate_vaddr_upper)
-
-            # If the candidate paging structure can map the range, then add it as a child and have it create children too
-            if range_to_cover.overlaps_with(candidate_vaddr_range):
-                if i in self.children:
-                    # If the child already exists (possible if this func is called multiple times) then we don't want to recreate it
-                    self.children[i].create_children_to_cover_range(range_to_cover)
-                else:
-                    # If child doesn't exist then create a new one
-                    new_child = PagingStructure(
-                        self.paging_arch_info.next_structure(self.structure_type),
-                        self.paging_arch_info,
-                        candidate_vaddr_lower)
-                    new_child.create_children_to_cover_range(range_to_cover)
-                    self.children[i] = new_child
+
+            # The candidate paging structure can map the range, so add it as a child and have it create children too
+            if i in self.children:
+                # If the child already exists (possible if this func is called multiple times) then we don't want to recreate it
+                self.children[i].create_children_to_cover_range(range_to_cover, page_type)
+            else:
+                # If child doesn't exist then create a new one
+                new_child = PagingStructure(
+                    self.paging_arch_info.next_structure(self.structure_type),
+                    self.paging_arch_info,
+                    candidate_vaddr_lower)
+                new_child.create_children_to_cover_range(range_to_cover, page_type)
+                self.children[i] = new_child
 
     def gen_ops(self, vspace: ts_types.VSpace, ctx: 'context.Context'):
         # If this is the top level cap, use the vspace name as the cap name
@@ -149,9 +173,15 @@ class PagingStructure:
         size_bits = ctx.sel4_info['object_sizes'][cap.type.value]
         create_op = op_types.CapCreateOperation(dest=cap, size_bits=size_bits)
 
-        mapping_func_name = self.paging_arch_info.get_mapping_func_for_structure(self.structure_type)
-        map_op = op_types.MapOperation(service=cap, vspace=vspace, vaddr=self.vaddr,
-                                       map_func=f'wrapper_{mapping_func_name}')
+        if cap is vspace and vspace.asid_pool is not None:
+            # Unlike the root task's pool, pools the loader made are in slots of their own, so the service is the pool
+            mapping_func_name = self.paging_arch_info.created_asid_pool_assign_func
+            map_op = op_types.MapOperation(service=vspace.asid_pool.pool, vspace=vspace, vaddr=self.vaddr,
+                                           map_func=f'wrapper_{mapping_func_name}')
+        else:
+            mapping_func_name = self.paging_arch_info.get_mapping_func_for_structure(self.structure_type)
+            map_op = op_types.MapOperation(service=cap, vspace=vspace, vaddr=self.vaddr,
+                                           map_func=f'wrapper_{mapping_func_name}')
 
         ctx.ops_list.append(create_op)
         ctx.ops_list.append(map_op)
@@ -159,6 +189,14 @@ class PagingStructure:
         for child in self.children.values():
             child.gen_ops(vspace, ctx)
 
+    # Returns how many structures of each type are in this tree, including this one
+    def count_structures(self) -> Dict[ts_enums.CapType, int]:
+        counts = {self.structure_type: 1}
+        for child in self.children.values():
+            for structure_type, count in child.count_structures().items():
+                counts[structure_type] = counts.get(structure_type, 0) + count
+        return counts
+
     def __str__(self):
         lines = [f"{self.structure_type.name} @ [{hex(self.vaddr)}, {hex(self.vaddr + (1 << self.total_addressable_bits))})"]
         for child in self.children.values():
@@ -167,8 +205,9 @@ class PagingStructure:
         return '\n'.join(lines)
 
 
+# Runs after every vspace has been laid out, so the binary chunks include stacks as well as ELF segments
 def create_paging_structures(ctx: 'context.Context'):
-    arch_info = ctx.paging_arch_info = PagingArchInfo(ctx.arch)
+    arch_info = ctx.paging_arch_info
     for vspace_name, vspace in ctx.vspaces.items():
         paging_structure = PagingStructure(arch_info.get_topmost_structure(), arch_info, 0)
         for chunk in vspace.binary_chunks:
@@ -178,3 +217,23 @@ def create_paging_structures(ctx: 'context.Context'):
             chunk_range = Range(chunk_lower_vaddr, chunk_upper_vaddr)
             paging_structure.create_children_to_cover_range(chunk_range)
         ctx.paging_structures[vspace_name] = paging_structure
+
+    # Shared regions may be backed by large pages, which need fewer paging structures to map
+    for shared_region in ctx.shared_regions.values():
+        for mapping in shared_region.mappings:
+            mapping_range = Range(mapping.vaddr, mapping.vaddr + shared_region.size)
+            ctx.paging_structures[mapping.vspace.name].create_children_to_cover_range(mapping_range, shared_region.page_type)
+
+    # As may heaps
+    for thread in ctx.threads.values():
+        if thread.heap is not None and thread.heap.size:
+            heap_range = Range(thread.heap.vaddr, thread.heap.vaddr + thread.heap.size)
+            ctx.paging_structures[thread.vspace.name].create_children_to_cover_range(heap_range, thread.heap.page_type)
+
+    for vspace_name, vspace in ctx.vspaces.items():
+        for device_mapping in vspace.device_mappings:
+            mapping_range = Range(device_mapping.vaddr, device_mapping.vaddr + device_mapping.size)
+            ctx.paging_structures[vspace_name].create_children_to_cover_range(mapping_range)
+
+        for frame_vaddr in vspace.frame_vaddrs:
+            ctx.paging_structures[vspace_name].create_children_to_cover_range(Range(frame_vaddr, frame_vaddr + ctx.page_size))
@@ -0,0 +1,150 @@
+from tailspring.context import Context
+import tailspring.ts_types as ts_types
+import tailspring.op_types as op_types
+from typing import Dict, List
+import json
+
+# How many of the largest contributors to list in each category
+NUM_LARGEST = 5
+
+
+# Summarizes what a config costs - image size, memory, slots and boot time - without linking anything
+def gen_report(ctx: Context) -> dict:
+    threads_by_vspace: Dict[str, List[ts_types.Thread]] = {}
+    for thread in ctx.threads.values():
+        threads_by_vspace.setdefault(thread.vspace.name, []).append(thread)
+
+    return {
+        'vspaces': {vspace_name: gen_vspace_report(vspace, threads_by_vspace.get(vspace_name, []), ctx) for vspace_name, vspace in ctx.vspaces.items()},
+        'asid_pools': gen_asid_pools_report(ctx),
+        'object_bytes': gen_object_bytes_report(ctx),
+        'slots_required': ctx.cap_addresses.get_slots_required(),
+        'ops': gen_ops_report(ctx),
+        'largest': gen_largest_report(ctx),
+    }
+
+
+def gen_vspace_report(vspace: ts_types.VSpace, threads: List[ts_types.Thread], ctx: Context) -> dict:
+    # Threads sharing a vspace share its info pages, so the set of addresses gives the number of pages
+    info_frames = {addr for thread in threads for addr in (thread.system_info_addr, thread.gp_memory_info_addr,
+                                                           thread.device_memory_info_addr, thread.device_mappings_info_addr) if addr}
+    paging_structures = ctx.paging_structures[vspace.name].count_structures()
+
+    return {
+        # Chunks that map another vspace's frames take up no space in the image
+        'image_bytes': sum(chunk.total_length_with_padding for chunk in vspace.binary_chunks if chunk.shared_from is None),
+        'zero_bytes': sum(chunk.data_aligned.count(0) for chunk in vspace.binary_chunks if chunk.shared_from is None),
+        'paging_structures': {structure_type.name: count for structure_type, count in paging_structures.items()},
+        'stack_frames': sum(thread.stack_size // ctx.page_size for thread in threads),
+        'ipc_buffer_frames': len(threads),
+        'info_frames': len(info_frames),
+        'heap_bytes': sum(thread.heap.size for thread in threads if thread.heap is not None),
+        'asid_pool': vspace.asid_pool.pool.name if vspace.asid_pool is not None else 'root',
+        # Empty if the vspace may use any color
+        'cache_colors': [color for color in range(ctx.num_cache_colors) if vspace.color_mask & (1 << color)],
+        'colored_frames': len(vspace.colored_frames),
+    }
+
+
+# Number of vspaces assigned to each ASID pool
+def gen_asid_pools_report(ctx: Context) -> Dict[str, int]:
+    asid_pools = {'root': len(ctx.vspaces) - sum(len(asid_pool.vspaces) for asid_pool in ctx.asid_pools)}
+    for asid_pool in ctx.asid_pools:
+        asid_pools[asid_pool.pool.name] = len(asid_pool.vspaces)
+    return asid_pools
+
+
+# Memory retyped out of general purpose untypeds, by the type of object created
+def gen_object_bytes_report(ctx: Context) -> Dict[str, int]:
+    object_bytes = {}
+    for op in ctx.ops_list:
+        if isinstance(op, (op_types.CapCreateOperation, op_types.CNodeCreateOperation)):
+            type_name = op.dest.type.name
+            object_bytes[type_name] = object_bytes.get(type_name, 0) + op.bytes_required
+    return object_bytes
+
+
+# Counts the entries of each C op type, and how many syscalls they're estimated to make
+def gen_ops_report(ctx: Context) -> Dict[str, Dict[str, int]]:
+    ops = {}
+    for op in ctx.ops_list:
+        for entry, syscalls in zip(op.format_as_C_entry(), op.estimate_syscalls()):
+            # Entries look like `{OP_TYPE, .op_name = {...}}`
+            op_type = entry[1:entry.index(',')]
+            op_report = ops.setdefault(op_type, {'count': 0, 'syscalls': 0})
+            op_report['count'] += 1
+            op_report['syscalls'] += syscalls
+    return ops
+
+
+def gen_largest_report(ctx: Context) -> Dict[str, List[dict]]:
+    chunks = [{'vspace': vspace.name, 'name': chunk.name, 'bytes': chunk.total_length_with_padding}
+              for vspace in ctx.vspaces.values() for chunk in vspace.binary_chunks if chunk.shared_from is None]
+    objects = [{'name': op.dest.name, 'type': op.dest.type.name, 'bytes': op.bytes_required}
+               for op in ctx.ops_list if isinstance(op, (op_types.CapCreateOperation, op_types.CNodeCreateOperation))]
+    return {
+        'image_chunks': sorted(chunks, key=lambda e: e['bytes'], reverse=True)[:NUM_LARGEST],
+        'objects': sorted(objects, key=lambda e: e['bytes'], reverse=True)[:NUM_LARGEST],
+    }
+
+
+def print_report(report: dict):
+    print("VSpaces:")
+    for vspace_name, vspace_report in report['vspaces'].items():
+        paging_str = ', '.join(f"{count} {name}" for name, count in vspace_report['paging_structures'].items())
+        print(f"  {vspace_name}: {vspace_report['image_bytes']} image bytes ({vspace_report['zero_bytes']} zero)")
+        print(f"    paging structures: {paging_str}")
+        print(f"    frames: {vspace_report['stack_frames']} stack, {vspace_report['ipc_buffer_frames']} IPC buffer, {vspace_report['info_frames']} info")
+        if vspace_report['heap_bytes']:
+            print(f"    heap: {vspace_report['heap_bytes']} bytes")
+        print(f"    ASID pool: {vspace_report['asid_pool']}")
+        if vspace_report['cache_colors']:
+            colors_str = ', '.join(str(color) for color in vspace_report['cache_colors'])
+            print(f"    cache colors: {colors_str} ({vspace_report['colored_frames']} frames)")
+
+    print("ASID pools:")
+    for pool_name, num_vspaces in report['asid_pools'].items():
+        print(f"  {pool_name}: {num_vspaces} vspaces")
+
+    print("Object memory:")
+    for type_name, num_bytes in sorted(report['object_bytes'].items(), key=lambda e: e[1], reverse=True):
+        print(f"  {type_name}: {num_bytes} bytes")
+    print(f"  total: {sum(report['object_bytes'].values())} bytes")
+
+    print(f"SLOTS_REQUIRED: {report['slots_required']}")
+
+    print("Ops:")
+    for op_type, op_report in report['ops'].items():
+        print(f"  {op_type}: {op_report['count']} ({op_report['syscalls']} syscalls)")
+    print(f"  total: {sum(e['count'] for e in report['ops'].values())} ({sum(e['syscalls'] for e in report['ops'].values())} syscalls, estimated)")
+
+    print("Largest image chunks:")
+    for e in report['largest']['image_chunks']:
+        print(f"  {e['name']} ({e['vspace']}): {e['bytes']} bytes")
+    print("Largest objects:")
+    for e in report['largest']['objects']:
+        print(f"  {e['name']} ({e['type']}): {e['bytes']} bytes")
+
+
+# Prints the report if no path was given, otherwise writes it as JSON
+def write_report(ctx: Context):
+    report = gen_report(ctx)
+    if ctx.report_path == '-':
+        print_report(report)
+    else:
+        with open(ctx.report_path, 'w') as f:
+            json.dump(report, f, indent=4)
+
+
+# With --variant, each variant's report is printed under its name, or the JSON maps variant names to reports
+def write_variant_reports(report_path: str, variant_ctxs: Dict[str, Context]):
+    reports = {variant_name: gen_report(variant_ctx) for variant_name, variant_ctx in variant_ctxs.items()}
+    if report_path == '-':
+        for index, (variant_name, report) in enumerate(reports.items()):
+            if index > 0:
+                print()
+            print(f"Variant {variant_name}:")
+            print_report(report)
+    else:
+        with open(report_path, 'w') as f:
+            json.dump(reports, f, indent=4)
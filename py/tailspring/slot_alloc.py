@@ -0,0 +1,180 @@
+from tailspring.context import Context
+import tailspring.op_types as op_types
+from typing import Dict, List
+from array import array
+import heapq
+
+# Marks an entry of a per-cap array that hasn't been set
+UNSET = -1
+
+
+# Assigns the slots caps occupy in the loader's cnode, much like a register allocator. Each cap is live from the op that
+# places it in a slot to the op that empties that slot again (a move), so slots that are emptied can be handed to caps
+# that are placed later on. Runs on the final, sorted op list
+def allocate_slots(ctx: Context):
+    schedule_mints(ctx)
+    place_caps_directly(ctx)
+    convert_last_copies_to_moves(ctx)
+    assign_slots(ctx)
+
+
+# Returns an array with an entry for every cap, indexed by Cap.index
+def new_per_cap_array(ctx: Context, value: int) -> array:
+    return array('q', [value]) * len(ctx.cap_addresses.caps)
+
+
+# Mints are moved to just before the first op that uses the minted cap. For the copies of frames that are mapped
+# into vspaces this is after the copy/move ops, so they can reuse the slots that the moves emptied
+def schedule_mints(ctx: Context):
+    mints = [op for op in ctx.ops_list if isinstance(op, op_types.MintOperation)]
+    other_ops = [op for op in ctx.ops_list if not isinstance(op, op_types.MintOperation)]
+    if not mints:
+        return
+
+    first_use = new_per_cap_array(ctx, UNSET)
+    first_kill = new_per_cap_array(ctx, len(other_ops))
+    for i, op in enumerate(other_ops):
+        for cap in op.get_uses():
+            if first_use[cap.index] == UNSET:
+                first_use[cap.index] = i
+        for cap in op.get_kills():
+            first_kill[cap.index] = min(first_kill[cap.index], i)
+
+    # Mints of caps that are never used stay where the mints were sorted to, right after the create ops
+    num_creates = sum(1 for op in other_ops if isinstance(op, (op_types.CapCreateOperation, op_types.CNodeCreateOperation)))
+
+    # A mint has to come before anything that moves its source away, and a minted cap may itself be minted from,
+    # in which case the first mint has to come before the second. Going backwards handles chains of mints
+    insert_index: Dict[int, int] = {}
+    # Earliest index of the mints seen so far that mint from each cap
+    minted_from_index = new_per_cap_array(ctx, len(other_ops))
+    for mint in reversed(mints):
+        first_dest_use = first_use[mint.dest.index]
+        index = min(num_creates if first_dest_use == UNSET else first_dest_use, first_kill[mint.src.index],
+                    minted_from_index[mint.dest.index])
+        insert_index[id(mint)] = index
+        minted_from_index[mint.src.index] = min(index, minted_from_index[mint.src.index])
+
+    mints_by_index: Dict[int, List[op_types.MintOperation]] = {}
+    for mint in mints:
+        mints_by_index.setdefault(insert_index[id(mint)], []).append(mint)
+
+    ops_list = []
+    for i, op in enumerate(other_ops):
+        if i in mints_by_index:
+            ops_list += mints_by_index[i]
+        ops_list.append(op)
+    ops_list += mints_by_index.get(len(other_ops), [])
+    ctx.ops_list = ops_list
+
+
+# A cap that the loader does nothing with but put into a single cnode can be created or minted straight into that cnode,
+# which saves the copy or move and the cap's slot in the loader's cnode. The cnode has to exist by then: mints come after
+# every create op, but create ops are sorted by size, so a cap that is created before its cnode is left as it is
+def place_caps_directly(ctx: Context):
+    num_uses = new_per_cap_array(ctx, 0)
+    for op in ctx.ops_list:
+        for cap in op.get_uses():
+            num_uses[cap.index] += 1
+
+    # Index of the op that creates or mints each cap
+    def_index = new_per_cap_array(ctx, UNSET)
+    for i, op in enumerate(ctx.ops_list):
+        if isinstance(op, (op_types.CapCreateOperation, op_types.CNodeCreateOperation, op_types.MintOperation)):
+            def_index[op.dest.index] = i
+
+    placed = []
+    for i, op in enumerate(ctx.ops_list):
+        if type(op) not in (op_types.CopyOperation, op_types.MoveOperation):
+            continue
+        # The copy or move has to be the only thing that uses the cap
+        if num_uses[op.src.index] != 1 or def_index[op.src.index] == UNSET:
+            continue
+        def_op = ctx.ops_list[def_index[op.src.index]]
+        if isinstance(def_op, op_types.CNodeCreateOperation) or def_index[op.dest.index] > def_index[op.src.index]:
+            continue
+        def_op.dest_cnode = op.dest
+        def_op.dest_index = op.index
+        placed.append(i)
+
+    if placed:
+        placed_set = set(placed)
+        ctx.ops_list = [op for i, op in enumerate(ctx.ops_list) if i not in placed_set]
+
+
+# If a cap isn't used by the loader after being copied into its last cnode, that copy can be a move instead,
+# which frees up the slot. The object stays alive through the cap in the destination cnode
+def convert_last_copies_to_moves(ctx: Context):
+    last_use = new_per_cap_array(ctx, UNSET)
+    for i, op in enumerate(ctx.ops_list):
+        for cap in op.get_uses():
+            last_use[cap.index] = i
+
+    for i, op in enumerate(ctx.ops_list):
+        # A cnode that's placed inside itself can't be moved, since it's also the destination root of the move
+        if type(op) is op_types.CopyOperation and last_use[op.src.index] == i and op.src is not op.dest:
+            ctx.ops_list[i] = op_types.MoveOperation(src=op.src, dest=op.dest, index=op.index)
+
+
+def assign_slots(ctx: Context):
+    # Slot 0 is used as a temporary slot by the loader, so allocation starts at 1
+    next_fresh_slot = 1
+    free_slots: List[int] = []  # Min-heap, so the lowest slots get reused first
+    num_live = 0
+    peak_live = 0
+    assigned = bytearray(len(ctx.cap_addresses.caps))
+
+    def take_consecutive(num: int) -> int:
+        nonlocal next_fresh_slot, free_slots
+        if num == 1 and free_slots:
+            return heapq.heappop(free_slots)
+
+        # Look for a long enough run of free slots, otherwise take fresh ones
+        if num > 1:
+            sorted_free = sorted(free_slots)
+            run_start = 0
+            for i in range(len(sorted_free)):
+                if i > run_start and sorted_free[i] != sorted_free[i - 1] + 1:
+                    run_start = i
+                if i - run_start + 1 == num:
+                    start = sorted_free[run_start]
+                    free_slots = sorted_free[:run_start] + sorted_free[i + 1:]
+                    heapq.heapify(free_slots)
+                    return start
+
+        start = next_fresh_slot
+        next_fresh_slot += num
+        return start
+
+    for op in ctx.ops_list:
+        defs = [cap for cap in op.get_defs() if not assigned[cap.index]]
+        if defs:
+            start = take_consecutive(len(defs))
+            for offset, cap in enumerate(defs):
+                cap.address = start + offset
+                assigned[cap.index] = True
+            num_live += len(defs)
+            if num_live > peak_live:
+                peak_live = num_live
+
+        for cap in op.get_kills():
+            heapq.heappush(free_slots, cap.address)
+            num_live -= 1
+
+    # Caps that were created or minted straight into another cnode never take up a slot in the loader's. Their address
+    # is never looked up, so it's left at 0 rather than taking up a slot
+    num_placed_directly = 0
+    for op in ctx.ops_list:
+        if isinstance(op, (op_types.CapCreateOperation, op_types.MintOperation)) and op.dest_cnode is not None:
+            op.dest.address = 0
+            assigned[op.dest.index] = True
+            num_placed_directly += 1
+
+    # Any cap that no op places in a slot still gets a slot of its own, so that its address is unique
+    for cap in ctx.cap_addresses.caps:
+        if not assigned[cap.index]:
+            cap.address = next_fresh_slot
+            next_fresh_slot += 1
+
+    print(f"Loader cnode slots: {len(ctx.cap_addresses.caps)} caps in {ctx.cap_addresses.get_slots_required() - 1} slots, "
+          f"at most {peak_live} live at once, {num_placed_directly} placed straight into other cnodes")
@@ -2,8 +2,8 @@ from tailspring.context import Context
 import tailspring.ts_types as ts_types
 import tailspring.ts_enums as ts_enums
 import tailspring.op_types as op_types
-from tailspring.paging import Range
-from typing import List
+import tailspring.layout as layout
+from typing import Dict, List, Tuple
 from dataclasses import dataclass
 import enum
 
@@ -24,6 +24,7 @@ class Stack:
     class CustomDataType(enum.Enum):
         Arg = enum.auto()
         Envp = enum.auto()
+        Handoff = enum.auto()
 
     @dataclass
     class CustomData:
@@ -54,12 +55,18 @@ class Stack:
         self.custom_data_start = thread.stack_top_addr
         self.custom_data_arr: List[Stack.CustomData] = []
 
+        # The handoff struct goes at the very top of the stack so that it stays word aligned
+        handoff_addr = self.__add_custom_data(gen_handoff_data(thread, ctx), Stack.CustomDataType.Handoff)
+
         # Add the process name as the first argument
         self.add_arg(thread.tcb.name)
 
         # Create auxiliary vectors array
         self.aux_vectors = []
 
+        # The handoff struct comes first so that the lib finds it straight after the environment pointers
+        self.aux_vectors.append(Stack.AuxV(a_type=ctx.sel4_info['literals']['TAILSPRING_AT_HANDOFF'], a_val=handoff_addr))
+
         # Add IPC buffer address as auxiliary vector
         self.aux_vectors.append(Stack.AuxV(a_type=ctx.sel4_info['literals']['AT_SEL4_IPC_BUFFER_PTR'], a_val=thread.ipc_buffer_addr))
 
@@ -69,15 +76,16 @@ class Stack:
             self.aux_vectors.append(Stack.AuxV(a_type=ctx.sel4_info['literals']['AT_SYSINFO'], a_val=vsyscall_symbol['st_value']))
 
     def add_arg(self, s: str):
-        self.__add_custom_data(s, Stack.CustomDataType.Arg)
+        self.__add_custom_data(bytes(s, 'ascii') + b'\0', Stack.CustomDataType.Arg)  # Add null terminator
 
     def add_envp(self, s: str):
-        self.__add_custom_data(s, Stack.CustomDataType.Envp)
+        self.__add_custom_data(bytes(s, 'ascii') + b'\0', Stack.CustomDataType.Envp)
 
-    def __add_custom_data(self, s: str, type: CustomDataType):
-        data = bytes(s, 'ascii') + b'\0'  # Add null terminator
-        self.custom_data_start -= len(data)  # Create space for arg
+    # Returns the address the data will be placed at
+    def __add_custom_data(self, data: bytes, type: CustomDataType) -> int:
+        self.custom_data_start -= len(data)  # Create space for data
         self.custom_data_arr.append(Stack.CustomData(value=data, addr=self.custom_data_start, type=type))
+        return self.custom_data_start
 
     def gen_stack_data(self) -> bytes:
         # Represents the bytes of the stack as read from the lowest address to the highest
@@ -112,7 +120,7 @@ class Stack:
         # Zero auxiliary vector
         stack_data += Stack.AuxV(a_type=0, a_val=0).to_bytes(self.ctx)
 
-        # Generate region where custom data (args and envp) is to be stored
+        # Generate region where custom data (handoff struct, args and envp) is to be stored
         custom_data = bytes()
         # Since the first added custom data is placed at the highest address, but we're building the stack from the bottom up,
         # we need to reverse the order so that the first bit of custom data is appended last (at the highest address)
@@ -138,113 +146,290 @@ class Stack:
         return stack_data
 
 
+# Threads with an 'auto' affinity are spread across the available cores. Pinned threads are placed first, then the
+# automatically placed threads are assigned heaviest first to whichever core currently has the least total weight
+def place_threads_on_cores(ctx: Context):
+    auto_threads = [thread for thread in ctx.threads.values() if thread.affinity is None]
+    if not auto_threads:
+        return
+
+    core_loads = [0] * ctx.max_num_nodes
+    for thread in ctx.threads.values():
+        if thread.affinity is not None:
+            core_loads[thread.affinity] += thread.weight
+
+    for thread in sorted(auto_threads, key=lambda t: t.weight, reverse=True):
+        # min() returns the first minimum, so ties go to the lowest numbered core
+        thread.affinity = min(range(ctx.max_num_nodes), key=lambda core: core_loads[core])
+        core_loads[thread.affinity] += thread.weight
+
+    print(f"Thread placement across {ctx.max_num_nodes} core(s):")
+    for core in range(ctx.max_num_nodes):
+        thread_names = [thread.tcb.name for thread in ctx.threads.values() if thread.affinity == core]
+        print(f"  core {core} (weight {core_loads[core]}): {', '.join(thread_names)}")
+
+
 # Even if threads share the same vspace, they each need to have their own ipc buffer and stack
 # Note that this function does generate operations and append them to the op_list, despite it
 # not being in ops_gen - it's just much easier to do the op generation as we crawl over threads
 def set_per_thread_values(ctx: Context):
-    for vspace in ctx.vspaces.values():
-        set_shared_vspace_thread_values(vspace, ctx)
+    create_info_frames(ctx)
 
+    # Grouped up front, so that the cost doesn't grow with the number of vspaces times the number of threads
+    threads_by_vspace: Dict[str, List[ts_types.Thread]] = {}
+    for thread in ctx.threads.values():
+        threads_by_vspace.setdefault(thread.vspace.name, []).append(thread)
 
-# Given that we only need to worry about overlapping ipc buffers/stacks for threads that share
-# the same vspace, it makes sense to process all threads sharing a vspace together as a group
-def set_shared_vspace_thread_values(vspace: ts_types.VSpace, ctx: Context):
-    # Get all threads sharing this vspace
-    threads_sharing_vspace = list(filter(lambda thread: thread.vspace == vspace, ctx.threads.values()))
+    print("Paging structures needed by each vspace:")
+    for vspace in ctx.vspaces.values():
+        set_shared_vspace_thread_values(vspace, threads_by_vspace.get(vspace.name, []), ctx)
 
-    # Check if any threads in this vspace need to be passed gp_memory_info
-    reserve_gp_memory_info_frame = any(thread.cspace.gp_untypeds_start is not None for thread in threads_sharing_vspace)
-    gp_memory_info_addr = 0
 
-    # Check if any threads in this vspace need to be passed device_memory_info
-    reserve_device_memory_info_frame = any(thread.cspace.device_untypeds_start is not None for thread in threads_sharing_vspace)
-    device_memory_info_addr = 0
+# The system, gp memory and device memory info is the same for every thread, so each is filled into one frame
+# by the loader, and read-only copies of that frame are mapped into every vspace that needs it
+def create_info_frames(ctx: Context):
+    # Only threads that asked for the framebuffer info get it, so threads that didn't get a frame without it
+    for pass_framebuffer_info in sorted({thread.pass_framebuffer_info for thread in ctx.threads.values()}):
+        name = 'system_info_frame_framebuffer__' if pass_framebuffer_info else 'system_info_frame__'
+        frame = create_new_frame(name, ctx)
+        ctx.system_info_frames[pass_framebuffer_info] = frame
+        ctx.ops_list.append(op_types.PassSystemInfoOperation(frame=frame, pass_framebuffer_info=pass_framebuffer_info))
 
-    # Get the last address used in the vspace for mapping segments (everything after this should be free)
-    last_chunk_vaddr = max([chunk.dest_vaddr_aligned + chunk.total_length_with_padding for chunk in vspace.binary_chunks])
-    assert (last_chunk_vaddr % ctx.page_size == 0)
+    if ctx.gp_untypeds_cnode is not None:
+        ctx.gp_memory_info_frame = create_new_frame('gp_memory_info_frame__', ctx)
+        ctx.ops_list.append(op_types.PassGPMemoryInfoOperation(frame=ctx.gp_memory_info_frame))
 
-    curr_addr = last_chunk_vaddr
+    if ctx.device_untypeds_cnode is not None:
+        ctx.device_memory_info_frame = create_new_frame('device_memory_info_frame__', ctx)
+        ctx.ops_list.append(op_types.PassDeviceMemoryInfoOperation(frame=ctx.device_memory_info_frame))
 
-    # We place a thread's stack above the segment, then the IPC buffer, then the next thread's stack, and so on...
-    # We leave unmapped pages in between so that a fault with occur if a stack overrun occurs
-    curr_addr += ctx.page_size
 
+# Given that we only need to worry about overlapping ipc buffers/stacks for threads that share
+# the same vspace, it makes sense to process all threads sharing a vspace together as a group
+def set_shared_vspace_thread_values(vspace: ts_types.VSpace, threads_sharing_vspace: List[ts_types.Thread], ctx: Context):
+    if not threads_sharing_vspace:
+        return
+
+    # Check if any threads in this vspace need to be passed gp_memory_info or device_memory_info
+    map_gp_memory_info_frame = any(thread.cspace.gp_untypeds_start is not None for thread in threads_sharing_vspace)
+    map_device_memory_info_frame = any(thread.cspace.device_untypeds_start is not None for thread in threads_sharing_vspace)
+
+    # Everything that needs a vaddr is handed to the layout engine, which places it around the segments, shared regions
+    # and devices. Stacks get an unmapped page below them so that a fault will occur if a stack overrun occurs
+    system_info_regions = {}
+    for pass_framebuffer_info in sorted({thread.pass_framebuffer_info for thread in threads_sharing_vspace}):
+        name = 'system_info_framebuffer' if pass_framebuffer_info else 'system_info'
+        system_info_regions[pass_framebuffer_info] = layout.Region(name=name, size=ctx.page_size)
+    regions = list(system_info_regions.values())
+
+    # The table of device mappings is known at build time, so it is loaded like any other chunk
+    device_mappings_info_region = None
+    if vspace.device_mappings:
+        device_mappings_info_region = layout.Region(name='device_mappings_info', size=ctx.page_size)
+        regions.append(device_mappings_info_region)
+
+    gp_memory_info_region = None
+    if map_gp_memory_info_frame:
+        gp_memory_info_region = layout.Region(name='gp_memory_info', size=ctx.page_size)
+        regions.append(gp_memory_info_region)
+
+    device_memory_info_region = None
+    if map_device_memory_info_frame:
+        device_memory_info_region = layout.Region(name='device_memory_info', size=ctx.page_size)
+        regions.append(device_memory_info_region)
+
+    stack_regions = []
+    ipc_buffer_regions = []
     for thread in threads_sharing_vspace:
-        if reserve_gp_memory_info_frame:
-            # Use one page for gp memory info (should be plenty)
-            gp_memory_info_addr = curr_addr
-            create_gp_memory_info_frame(thread, gp_memory_info_addr, ctx)
-
-            curr_addr += ctx.page_size
-
-            # Only one gp memory info frame is needed per vspace
-            reserve_gp_memory_info_frame = False
+        # Round stack size up to the nearest multiple of the page size
+        thread.stack_size += -thread.stack_size % ctx.page_size
 
-        if reserve_device_memory_info_frame:
-            # Use one page for device memory info
-            device_memory_info_addr = curr_addr
-            create_device_memory_info_frame(thread, device_memory_info_addr, ctx)
+        stack_regions.append(layout.Region(name=f'{thread.tcb.name} stack', size=thread.stack_size,
+                                           vaddr=thread.stack_vaddr, guard_below=ctx.page_size))
+        ipc_buffer_regions.append(layout.Region(name=f'{thread.tcb.name} IPC buffer', size=ctx.page_size, vaddr=thread.ipc_buffer_vaddr))
+    regions += stack_regions + ipc_buffer_regions
 
-            curr_addr += ctx.page_size
+    heap_regions = {}
+    for thread in threads_sharing_vspace:
+        if thread.heap is not None:
+            # Only the first size bytes are mapped up front, the rest is left free for the heap to grow into
+            heap_regions[thread.tcb.name] = layout.Region(name=f'{thread.tcb.name} heap', size=thread.heap.size,
+                                                          vaddr=thread.heap.vaddr, page_type=thread.heap.page_type,
+                                                          reserve_above=thread.heap.max_size - thread.heap.size)
+    regions += heap_regions.values()
 
-            # Only one device memory info frame is needed per vspace
-            reserve_device_memory_info_frame = False
+    vspace_layout = layout.lay_out_vspace(vspace, regions, ctx)
+    vspace_layout.report()
 
-        # Create a frame to place system info in
-        system_info_addr = curr_addr
-        create_system_info_frame(thread, system_info_addr, ctx)
+    device_mappings_info_addr = 0
+    if device_mappings_info_region is not None:
+        device_mappings_info_addr = device_mappings_info_region.vaddr
+        create_device_mappings_info_chunk(vspace, device_mappings_info_addr, ctx)
 
-        # Move up one page for the system info frame itself, and another to create a gap in between it and the stack
-        curr_addr += ctx.page_size * 2
+    for pass_framebuffer_info, system_info_region in system_info_regions.items():
+        map_info_frame(ctx.system_info_frames[pass_framebuffer_info], vspace, system_info_region.vaddr, ctx)
 
-        # Round stack size up to the nearest multiple of the page size and move curr_addr to the top of the stack
-        thread.stack_size += -thread.stack_size % ctx.page_size
+    gp_memory_info_addr = 0
+    if gp_memory_info_region is not None:
+        gp_memory_info_addr = gp_memory_info_region.vaddr
+        map_info_frame(ctx.gp_memory_info_frame, vspace, gp_memory_info_addr, ctx)
 
-        curr_addr += thread.stack_size
+    device_memory_info_addr = 0
+    if device_memory_info_region is not None:
+        device_memory_info_addr = device_memory_info_region.vaddr
+        map_info_frame(ctx.device_memory_info_frame, vspace, device_memory_info_addr, ctx)
 
+    for thread, stack_region, ipc_buffer_region in zip(threads_sharing_vspace, stack_regions, ipc_buffer_regions):
         # Save stack address
-        thread.stack_top_addr = curr_addr
-
-        # Leave a frame in between stack and IPC buffer
-        curr_addr += ctx.page_size
+        thread.stack_top_addr = stack_region.vaddr + thread.stack_size
 
         # Map IPC buffer
-        thread.ipc_buffer_addr = curr_addr
+        thread.ipc_buffer_addr = ipc_buffer_region.vaddr
+        map_existing_frame(thread.ipc_buffer, vspace, thread.ipc_buffer_addr, ctx)
 
-        map_existing_frame(thread.ipc_buffer, vspace, curr_addr, ctx)
+        thread.system_info_addr = system_info_regions[thread.pass_framebuffer_info].vaddr
+        if thread.cspace.gp_untypeds_start is not None:
+            thread.gp_memory_info_addr = gp_memory_info_addr
+        if thread.cspace.device_untypeds_start is not None:
+            thread.device_memory_info_addr = device_memory_info_addr
+        thread.device_mappings_info_addr = device_mappings_info_addr
 
-        # Leave another frame in between IPC buffer and next thread's stack
-        curr_addr += ctx.page_size
+        if thread.heap is not None:
+            thread.heap.vaddr = heap_regions[thread.tcb.name].vaddr
+            create_heap_frames(thread.heap, vspace, ctx)
 
-        # Environment pointers
+        # Environment pointers. Everything here is also in the handoff struct, these are kept for compatibility
         thread.envps.append(f"ipc_buffer={thread.ipc_buffer_addr}")
-        thread.envps.append(f"system_info={system_info_addr}")
+        thread.envps.append(f"system_info={thread.system_info_addr}")
 
         if thread.cspace.gp_untypeds_start is not None:
             thread.envps.append(f"gp_memory_info={gp_memory_info_addr}")
+            thread.envps.append(f"gp_untypeds_slot={thread.cspace.gp_untypeds_start}")
 
         if thread.cspace.device_untypeds_start is not None:
             thread.envps.append(f"device_memory_info={device_memory_info_addr}")
 
+        if vspace.device_mappings:
+            thread.envps.append(f"device_mappings_info={device_mappings_info_addr}")
+
         # Now that we know where everything is placed in memory, we can initialize the values on the stack that the seL4 runtime expects
         init_stack_for_thread(thread, ctx)
 
 
-def create_gp_memory_info_frame(thread: ts_types.Thread, vaddr: int, ctx: Context):
-    frame = create_new_frame(f"{thread.tcb.name}_gp_memory_info_frame", thread.vspace, vaddr, ctx)
-    ctx.ops_list.append(op_types.PassGPMemoryInfoOperation(dest_vaddr=vaddr, frame=frame, dest_vspace=thread.vspace))
-
-
-def create_device_memory_info_frame(thread: ts_types.Thread, vaddr: int, ctx: Context):
-    frame = create_new_frame(f"{thread.tcb.name}_device_memory_info_frame", thread.vspace, vaddr, ctx)
-    ctx.ops_list.append(op_types.PassDeviceMemoryInfoOperation(dest_vaddr=vaddr, frame=frame, dest_vspace=thread.vspace))
-
-
-def create_system_info_frame(thread: ts_types.Thread, vaddr: int, ctx: Context):
-    frame = create_new_frame(f"{thread.tcb.name}_system_info_frame", thread.vspace, vaddr, ctx)
-    ctx.ops_list.append(op_types.PassSystemInfoOperation(dest_vaddr=vaddr, frame=frame,
-                                                         dest_vspace=thread.vspace, pass_framebuffer_info=thread.pass_framebuffer_info))
+# Heap frames are freshly retyped, so they're already zeroed when the thread starts. They're not added to the vspace's
+# frame_vaddrs since they may be large pages, the paging structures to map them are created from the heap itself
+def create_heap_frames(heap: ts_types.Heap, vspace: ts_types.VSpace, ctx: Context):
+    for frame_index, frame in enumerate(heap.frames):
+        if vspace.color_mask:
+            vspace.colored_frames.append(frame)
+        else:
+            ctx.ops_list.append(op_types.CapCreateOperation(dest=frame, size_bits=heap.page_size_bits))
+        frame_vaddr = heap.vaddr + (frame_index << heap.page_size_bits)
+        ctx.ops_list.append(op_types.MapFrameOperation(frame=frame, vspace=vspace, vaddr=frame_vaddr))
+
+
+# Mints a read-only copy of a system-wide info frame and maps it into the vspace
+def map_info_frame(frame: ts_types.Cap, vspace: ts_types.VSpace, vaddr: int, ctx: Context):
+    frame_copy = ts_types.Cap(name=f'{vspace.name}_{frame.name}', type=ctx.cap_types.frame, can_be_derived=True)
+    ctx.cap_addresses.append(frame_copy)
+    ctx.ops_list.append(op_types.MintOperation(src=frame, dest=frame_copy, rights=[ts_enums.CapRight.read], badge=0))
+    map_existing_frame(frame_copy, vspace, vaddr, ctx)
+
+
+# Lays out a TailspringDeviceMappingsInfo struct, one word per field
+def create_device_mappings_info_chunk(vspace: ts_types.VSpace, vaddr: int, ctx: Context):
+    word_size = ctx.sel4_info['literals']['seL4_WordBits'] // 8
+    max_entries = (ctx.page_size - word_size) // (3 * word_size)
+    if len(vspace.device_mappings) > max_entries:
+        raise ValueError(f"VSpace '{vspace.name}' has {len(vspace.device_mappings)} device mappings, but at most {max_entries} are supported")
+
+    data = word_to_bytes(len(vspace.device_mappings), ctx)
+    for mapping in vspace.device_mappings:
+        data += word_to_bytes(mapping.paddr, ctx) + word_to_bytes(mapping.vaddr, ctx) + word_to_bytes(mapping.size, ctx)
+
+    chunk = ts_types.BinaryChunk(name=f'{vspace.name}_device_mappings_info__', alignment=ctx.page_size, data=data, dest_vaddr=vaddr, min_length=ctx.page_size)
+    vspace.binary_chunks.append(chunk)
+
+
+# Lays out a TailspringHandoff struct. Fields are in the same order as the struct declaration
+def gen_handoff_data(thread: ts_types.Thread, ctx: Context) -> bytes:
+    literals = ctx.sel4_info['literals']
+    handoff_size = literals['sizeof(TailspringHandoff)']
+    name_len = literals['TAILSPRING_HANDOFF_NAME_LEN']
+
+    def slot_range(start, end):
+        return (start, end) if start is not None else (0, 0)
+
+    fields = [
+        literals['TAILSPRING_HANDOFF_MAGIC'],
+        literals['TAILSPRING_HANDOFF_VERSION'],
+        handoff_size,
+        thread.index,
+        len(ctx.threads),
+        thread.ipc_buffer_addr,
+        thread.system_info_addr,
+        thread.gp_memory_info_addr,
+        thread.device_memory_info_addr,
+        thread.device_mappings_info_addr,
+        thread.stack_top_addr,
+        thread.stack_size,
+        thread.cspace.size,
+        thread.cspace.guard,
+        *slot_range(thread.cspace.gp_untypeds_start, thread.cspace.gp_untypeds_end),
+        *slot_range(thread.cspace.device_untypeds_start, thread.cspace.device_untypeds_end),
+    ]
+
+    data = b''.join(word_to_bytes(value, ctx) for value in fields)
+    # Truncate the name if needed, always leaving room for the null terminator
+    data += bytes(thread.tcb.name, 'ascii')[:name_len - 1].ljust(name_len, b'\0')
+
+    # Added in version 2
+    heap_start, heap_size = (thread.heap.vaddr, thread.heap.size) if thread.heap is not None else (0, 0)
+    data += word_to_bytes(heap_start, ctx) + word_to_bytes(heap_size, ctx)
+
+    # Added in version 3
+    heap_max_size = thread.heap.max_size if thread.heap is not None else 0
+    fields = [
+        heap_max_size,
+        find_cap_slot(thread.cspace, thread.cspace, ctx),
+        find_cap_slot(thread.cspace, thread.vspace, ctx),
+        *find_free_slots(thread.cspace),
+    ]
+    data += b''.join(word_to_bytes(value, ctx) for value in fields)
+
+    # Trailing padding added by the compiler, if any
+    if len(data) > handoff_size:
+        raise RuntimeError(f"Handoff struct is {len(data)} bytes but sizeof(TailspringHandoff) is {handoff_size}, tailspring_shared.h is out of sync with the generator")
+    return data + bytes(handoff_size - len(data))
+
+
+# Returns the lowest slot of the cnode, other than 0, that holds cap or a cap derived from it, or 0 if there is none
+def find_cap_slot(cnode: ts_types.CNode, cap: ts_types.Cap, ctx: Context) -> int:
+    for slot in sorted(cnode.caps):
+        slot_cap = cnode.caps[slot]
+        # Follow cap modifications back to the cap they were derived from
+        while slot_cap.name in ctx.cap_modifications and ctx.cap_modifications[slot_cap.name].dest_cap is slot_cap:
+            slot_cap = ctx.cap_modifications[slot_cap.name].src_cap
+        if slot != 0 and slot_cap is cap:
+            return slot
+    return 0
+
+
+# Returns the longest run [start, end) of slots in the cnode that the config leaves empty, not counting slot 0
+def find_free_slots(cnode: ts_types.CNode) -> Tuple[int, int]:
+    used_ranges = [(0, 1)] + [(slot, slot + 1) for slot in cnode.caps]
+    reserved_ranges = [(cnode.gp_untypeds_start, cnode.gp_untypeds_end),
+                       (cnode.device_untypeds_start, cnode.device_untypeds_end),
+                       (cnode.reclaimed_frames_start, cnode.reclaimed_frames_end)]
+    used_ranges += [(start, end) for start, end in reserved_ranges if start is not None]
+
+    longest = (0, 0)
+    next_free = 0
+    for start, end in sorted(used_ranges) + [(1 << cnode.size, 1 << cnode.size)]:
+        if start - next_free > longest[1] - longest[0]:
+            longest = (next_free, start)
+        next_free = max(next_free, end)
+    return longest
 
 
 def map_existing_frame(frame_cap: ts_types.Cap, vspace: ts_types.VSpace, vaddr: int, ctx: Context):
@@ -252,21 +437,15 @@ def map_existing_frame(frame_cap: ts_types.Cap, vspace: ts_types.VSpace, vaddr:
     map_frame_op = op_types.MapFrameOperation(frame_cap, vspace, vaddr)
     ctx.ops_list.append(map_frame_op)
 
-    # Make sure paging structures are created to cover this frame
-    paging_structure_for_vspace = ctx.paging_structures[vspace.name]
-    paging_structure_for_vspace.create_children_to_cover_range(Range(vaddr, vaddr + ctx.page_size))
+    # Paging structures are created to cover this frame once every vspace is laid out
+    vspace.frame_vaddrs.append(vaddr)
 
 
 # Returns the cap to the frame that was created
-def create_new_frame(name: str, vspace: ts_types.VSpace, vaddr: int, ctx: Context) -> ts_types.Cap:
-    frame = ts_types.Cap(name=name, type=ts_enums.CapType.frame, can_be_derived=True)
+def create_new_frame(name: str, ctx: Context) -> ts_types.Cap:
+    frame = ts_types.Cap(name=name, type=ctx.cap_types.frame, can_be_derived=True)
     ctx.cap_addresses.append(frame)
     ctx.ops_list.append(op_types.CapCreateOperation(dest=frame, size_bits=ctx.page_size_bits))
-
-    # Make sure paging structures are created to cover this frame
-    paging_structure_for_vspace = ctx.paging_structures[vspace.name]
-    paging_structure_for_vspace.create_children_to_cover_range(Range(vaddr, vaddr + ctx.page_size))
-
     return frame
 
 
@@ -1,5 +1,6 @@
 import enum
-from typing import Type, List, Dict, Any
+import functools
+from typing import Type, List, Dict, Any, Tuple
 
 
 class Arch(enum.Enum):
@@ -11,14 +12,20 @@ class CapType(enum.Enum):
     tcb = 'seL4_TCBObject'
     endpoint = 'seL4_EndpointObject'
     cnode = 'seL4_CapTableObject'
+    sched_context = 'seL4_SchedContextObject'
     pml4 = 'seL4_X64_PML4Object'
     pdpt = 'seL4_X86_PDPTObject'
     page_directory = 'seL4_X86_PageDirectoryObject'
     page_table = 'seL4_X86_PageTableObject'
     x86_4K = 'seL4_X86_4K'
+    x86_large_page = 'seL4_X86_LargePageObject'
+    untyped = 'seL4_UntypedObject'
+    # Made out of an untyped with the ASID control cap rather than retyped, so there's no object type for it
+    asid_pool = 'asid_pool'
     # These depend on the specific arch and are reassigned later
     frame = 1
     vspace = 2
+    large_page = 3
 
 
 class CapRight(enum.Enum):
@@ -29,9 +36,15 @@ class CapRight(enum.Enum):
 
     @staticmethod
     def list_to_C_expr(rights: List['CapRight']):
-        if len(rights) == 0:
-            return '0'
-        return '(' + ' | '.join([right_enum.value for right_enum in rights]) + ')'
+        # Every mint of a shared region's frames has the same rights, so the expression is only built once for each set
+        return rights_tuple_to_C_expr(tuple(rights))
+
+
+@functools.lru_cache(maxsize=None)
+def rights_tuple_to_C_expr(rights: Tuple[CapRight, ...]) -> str:
+    if len(rights) == 0:
+        return '0'
+    return '(' + ' | '.join([right_enum.value for right_enum in rights]) + ')'
 
 
 def extend_enums(base_enums: Type[enum.Enum], extra_values: Dict[str, Any]) -> Type[enum.Enum]:
@@ -43,14 +56,19 @@ def extend_enums(base_enums: Type[enum.Enum], extra_values: Dict[str, Any]) -> T
     return enum.Enum(base_enums.__name__, combined_values)
 
 
-def extend_CapType_enums_with_arch(arch: Arch):
-    global CapType
+# CapType itself only has placeholders for the arch-specific types, so each build uses a copy with its arch's values
+# filled in, kept in ctx.cap_types. The copy for an arch is only made once, so that every build for the same arch in a
+# process (variants, or the daemon's builds) gets the same enum, and their caps compare equal
+@functools.lru_cache(maxsize=None)
+def get_CapType_for_arch(arch: Arch) -> Type[CapType]:
     if arch == Arch.x86_64:
-        CapType = extend_enums(CapType, {'frame': CapType.x86_4K.value, 'vspace': CapType.pml4.value})
+        return extend_enums(CapType, {'frame': CapType.x86_4K.value, 'vspace': CapType.pml4.value,
+                                      'large_page': CapType.x86_large_page.value})
+    return CapType
 
 
-def get_underivable_cap_types():
-    return [CapType.pdpt, CapType.page_directory, CapType.page_table]
+def get_underivable_cap_types(cap_types: Type[CapType]) -> List[CapType]:
+    return [cap_types.pdpt, cap_types.page_directory, cap_types.page_table]
 
 
-__all__ = ['Arch', 'CapType', 'CapRight', 'extend_CapType_enums_with_arch']
+__all__ = ['Arch', 'CapType', 'CapRight', 'get_CapType_for_arch']
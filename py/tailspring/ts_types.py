@@ -1,9 +1,16 @@
 import tailspring.ts_enums as ts_enums
 from dataclasses import dataclass, field
-from typing import TextIO, BinaryIO, List, Dict, Optional
+from typing import TextIO, List, Dict, Optional, TYPE_CHECKING
 from pathlib import Path
-import elftools.elf.elffile as elffile
-import elftools.elf.sections as elfsections
+import io
+
+# ELF segment flag for writable segments
+PF_W = 0x2
+
+# pyelftools is slow to import, so it's only imported once an ELF file is actually opened
+if TYPE_CHECKING:
+    import elftools.elf.elffile as elffile
+    import elftools.elf.sections as elfsections
 
 
 @dataclass
@@ -13,6 +20,8 @@ class Cap:
     can_be_derived: bool
     address: int = field(init=False)
     already_in_cnode: bool = field(init=False, default=False)
+    # Position in CapAddresses.caps. Unlike the address this never changes, so per-cap data can be kept in flat arrays
+    index: int = field(init=False)
 
 
 @dataclass
@@ -32,30 +41,37 @@ class CNode(Cap):
     gp_untypeds_end: Optional[int] = None
     device_untypeds_start: Optional[int] = None
     device_untypeds_end: Optional[int] = None
+    reclaimed_frames_start: Optional[int] = None
+    reclaimed_frames_end: Optional[int] = None
 
 
 class CapAddresses:
     def __init__(self):
         self.caps = []
+        # Caps are looked up by name for every reference in the config, so this keeps lookups constant time
+        self.caps_by_name: Dict[str, Cap] = {}
         # Start at 1 to use 0 as a temp slot
         self.next_free_cap = 1
 
     def append(self, cap: Cap):
+        cap.index = len(self.caps)
         cap.address = self.next_free_cap
         self.caps.append(cap)
+        # If two caps share a name, lookups return the first, same as searching the list would
+        self.caps_by_name.setdefault(cap.name, cap)
         self.next_free_cap += 1
 
     def get_cap_by_name(self, name: str) -> Cap:
-        for cap in self.caps:
-            if cap.name == name:
-                return cap
-        raise KeyError(f"No cap with name {name}")
+        if name not in self.caps_by_name:
+            raise KeyError(f"No cap with name {name}")
+        return self.caps_by_name[name]
 
     def has_cap_with_name(self, name: str) -> bool:
-        return any([cap.name == name for cap in self.caps])
+        return name in self.caps_by_name
 
+    # Slots can be reused once the caps in them have been moved elsewhere, so this is the highest slot handed out rather than the number of caps
     def get_slots_required(self) -> int:
-        return self.next_free_cap
+        return max((cap.address for cap in self.caps), default=0) + 1
 
     def __repr__(self):
         return str(self.caps)
@@ -68,6 +84,11 @@ class BinaryChunk:
     dest_vaddr: int
     min_length: int
     alignment: int
+    writable: bool = True
+
+    # If another chunk with the same contents is already loaded and this one is read-only, this chunk maps that chunk's
+    # frames instead of being linked into the image a second time
+    shared_from: Optional['BinaryChunk'] = field(init=False, default=None)
 
     # vaddr rounded down to be aligned with a page boundary
     dest_vaddr_aligned: int = field(init=False)
@@ -117,6 +138,98 @@ class BinaryChunk:
         return parent_dir / f'{self.name}.o'
 
 
+@dataclass
+class DeviceMapping:
+    paddr: int
+    vaddr: int
+    size: int  # Rounded up to a multiple of the page size
+    cached: bool
+    # Frames are retyped all at once by the loader, so these need to be in consecutive slots
+    frames: List[Cap] = field(default_factory=list)
+
+
+# One of several builds done in a single run of the generator with --variant
+@dataclass
+class Variant:
+    name: str
+    config_path: Path
+    output_header_path: Path
+    output_startup_threads_obj_path: Path
+
+
+@dataclass
+class ELFSegment:
+    data: bytes
+    vaddr: int
+    min_length: int  # p_memsz, which can be more than the data for .bss
+    writable: bool
+
+
+# A parsed thread binary. The whole file is read in up front, so that the image stays valid if the file is rebuilt.
+# The daemon keeps these between builds, so nothing here may refer to anything that belongs to a single build
+@dataclass
+class ELFImage:
+    path: Path
+    mtime_ns: int
+    size: int
+    elf: 'elffile.ELFFile' = field(init=False)
+    symtab: 'elfsections.SymbolTableSection' = field(init=False)
+    segments: List[ELFSegment] = field(init=False)  # Only the load segments
+    # Maps an alignment to the load segments merged at that alignment, see get_merged_segments
+    merged_segments: Dict[int, List[ELFSegment]] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        import elftools.elf.elffile as elffile
+        self.elf = elffile.ELFFile(io.BytesIO(self.path.read_bytes()))
+        self.symtab = self.elf.get_section_by_name('.symtab')
+        self.segments = [ELFSegment(data=segment.data(), vaddr=segment['p_vaddr'], min_length=segment['p_memsz'],
+                                    writable=(segment['p_flags'] & PF_W) != 0)
+                         for segment in self.elf.iter_segments('PT_LOAD')]
+
+    # Segments whose ranges, aligned out to the alignment, share a page (e.g. .data starting on the page .rodata ends on)
+    # are merged into one segment covering all of their pages, with later segments written over earlier ones. Segments
+    # that only touch are merged too, unless just one of them is writable, since read-only segments can be shared
+    # between vspaces loaded from the same binary
+    def get_merged_segments(self, alignment: int) -> List[ELFSegment]:
+        if alignment in self.merged_segments:
+            return self.merged_segments[alignment]
+
+        # Groups of segment indexes, each with the aligned range the group covers
+        groups: List[List[int]] = []
+        group_ranges = []
+        for index in sorted(range(len(self.segments)), key=lambda index: self.segments[index].vaddr):
+            segment = self.segments[index]
+            lower = segment.vaddr - segment.vaddr % alignment
+            upper = -(-(segment.vaddr + segment.min_length) // alignment) * alignment
+            if groups:
+                last_lower, last_upper = group_ranges[-1]
+                overlaps = lower < last_upper
+                touches = lower == last_upper and all(self.segments[other].writable == segment.writable for other in groups[-1])
+                if overlaps or touches:
+                    groups[-1].append(index)
+                    group_ranges[-1] = (last_lower, max(last_upper, upper))
+                    continue
+            groups.append([index])
+            group_ranges.append((lower, upper))
+
+        merged = []
+        for group, (lower, upper) in zip(groups, group_ranges):
+            if len(group) == 1:
+                merged.append(self.segments[group[0]])
+                continue
+            data = bytearray(upper - lower)
+            for index in sorted(group):
+                segment = self.segments[index]
+                offset = segment.vaddr - lower
+                # The part past the file data (e.g. .bss) is zeroed, even if an earlier segment put something there
+                data[offset:offset + segment.min_length] = segment.data.ljust(segment.min_length, b'\0')
+            merged.append(ELFSegment(data=bytes(data), vaddr=lower, min_length=len(data),
+                                     writable=any(self.segments[index].writable for index in group)))
+
+        self.merged_segments[alignment] = merged
+        return merged
+
+
 @dataclass
 class VSpace(Cap):
     # Not necessarily related to the path or filename of the binary image of the thread. The binary names
@@ -130,29 +243,74 @@ class VSpace(Cap):
     nonce: int
     binary_path: Path
     alignment: int  # Minimum alignment of each chunk in the vspace - usually just the page size
-    f: BinaryIO = field(init=False)
-    elf: elffile.ELFFile = field(init=False)
+    # Shared by every vspace loaded from the same binary, so the ELF file is only parsed once
+    image: ELFImage
     binary_chunks: List[BinaryChunk] = field(init=False)
-    symtab: elffile.SymbolTableSection = field(init=False)
+    device_mappings: List[DeviceMapping] = field(init=False)  # Sorted by paddr
+    frame_vaddrs: List[int] = field(init=False)  # Vaddrs of single frames mapped in by tailspring, e.g. IPC buffers
+    num_segments: int = field(init=False)  # Number of chunks that come from the ELF file's load segments, after merging
+    asid_pool: Optional['ASIDPool'] = field(init=False, default=None)  # None for the root task's ASID pool
+    color_mask: int = field(init=False, default=0)  # Bit i is set if the vspace's frames may have cache color i, 0 if any color will do
+    colored_frames: List[Cap] = field(init=False, default_factory=list)  # Frames that are created out of memory of the vspace's colors
 
     def __post_init__(self):
         self.binary_name_unique = f"{self.binary_name}_num{self.nonce}"
-        self.f = open(self.binary_path, 'rb')
-        self.elf = elffile.ELFFile(self.f)
-        self.symtab = self.elf.get_section_by_name('.symtab')
         self.binary_chunks = []
-        # We only care about load segments
-        for index, segment in enumerate(self.elf.iter_segments('PT_LOAD')):
-            chunk = BinaryChunk(name=f"thread_{self.binary_name_unique}_segment{index}", data=segment.data(), dest_vaddr=segment['p_vaddr'], min_length=segment['p_memsz'], alignment=self.alignment)
+        self.device_mappings = []
+        self.frame_vaddrs = []
+
+        # Only the ELF segments come first in binary_chunks at this point, stacks and info pages are added later
+        for index, segment in enumerate(self.image.get_merged_segments(self.alignment)):
+            chunk = BinaryChunk(name=f"thread_{self.binary_name_unique}_segment{index}", data=segment.data, dest_vaddr=segment.vaddr,
+                                min_length=segment.min_length, alignment=self.alignment, writable=segment.writable)
             self.binary_chunks.append(chunk)
+        self.num_segments = len(self.binary_chunks)
 
-    def get_symbol(self, symbol_name: str) -> Optional[elfsections.Symbol]:
-        if self.symtab is None:
+    def get_symbol(self, symbol_name: str) -> Optional['elfsections.Symbol']:
+        if self.image.symtab is None:
             raise RuntimeError(f"No symbol table for '{self.binary_name}' found")
-        matching_symbols = self.symtab.get_symbol_by_name(symbol_name)
+        matching_symbols = self.image.symtab.get_symbol_by_name(symbol_name)
         return None if matching_symbols is None else matching_symbols[0]
 
 
+@dataclass
+class SharedRegionMapping:
+    vspace: VSpace
+    vaddr: int
+    rights: List[ts_enums.CapRight]
+    # A frame cap can only be mapped once, so each mapping gets its own copy of every frame in the region
+    frames: List[Cap] = field(default_factory=list)
+
+
+@dataclass
+class SharedRegion:
+    name: str
+    size: int  # Rounded up to a multiple of the page size
+    page_type: ts_enums.CapType  # Either a regular frame or a large page
+    page_size_bits: int
+    frames: List[Cap] = field(default_factory=list)
+    mappings: List[SharedRegionMapping] = field(default_factory=list)
+
+
+# An ASID pool made by the loader, for vspaces that don't fit in the root task's pool
+@dataclass
+class ASIDPool:
+    pool: Cap
+    untyped: Cap  # Retyped to exactly the size of a pool, then turned into one
+    vspaces: List[VSpace] = field(default_factory=list)
+
+
+# Memory mapped into a thread's vspace before it starts, backed by fresh frames, so the thread doesn't have to map its own
+@dataclass
+class Heap:
+    size: int  # Rounded up to a multiple of the page size
+    max_size: int  # Vaddr space reserved for the heap to grow into, at least size. Only the first size bytes are mapped
+    page_type: ts_enums.CapType  # Either a regular frame or a large page
+    page_size_bits: int
+    vaddr: Optional[int] = None  # Pinned in the config, otherwise set by the layout engine
+    frames: List[Cap] = field(default_factory=list)
+
+
 @dataclass
 class Thread:
     tcb: Cap
@@ -163,6 +321,19 @@ class Thread:
     entry_addr: int
     args: List[str]  # List of strings that are passed in argv
     pass_framebuffer_info: bool
+    affinity: Optional[int]  # Core this thread runs on, or None if it should be placed automatically
+    weight: int  # Relative load of this thread, used when placing threads automatically
+    priority: int
+    max_priority: int  # Highest priority this thread may give itself or other threads (MCP)
+    # Only used on MCS kernels, in microseconds
+    budget: Optional[int]
+    period: Optional[int]
+    index: int  # Position of this thread in the config file
+    sched_context: Optional[Cap] = None  # Created for every thread on MCS kernels
+    # Pinned addresses, or None to let the layout engine place them
+    stack_vaddr: Optional[int] = None  # Lowest address of the stack
+    ipc_buffer_vaddr: Optional[int] = None
+    heap: Optional[Heap] = None
 
     # Set in thread_setup when stack is being initialized
     envps: List[str] = field(default_factory=list)  # List of strings that are passed as environment pointers
@@ -173,6 +344,11 @@ class Thread:
     arg2: int = field(init=False)
 
     ipc_buffer_addr: int = field(init=False)
+    # Addresses of the info pages mapped for this thread, 0 if not present
+    system_info_addr: int = 0
+    gp_memory_info_addr: int = 0
+    device_memory_info_addr: int = 0
+    device_mappings_info_addr: int = 0
     stack_top_addr: int = field(init=False)  # The address of the top of the stack chunk
     stack_pointer_addr: int = field(init=False)  # The address that should be loaded into the stack pointer on thread start
 
@@ -1,6 +1,9 @@
 from tailspring.context import Context
 import tailspring.ts_types as ts_types
 import tailspring.ts_enums as ts_enums
+from tailspring.paging import Range
+from typing import Dict, List
+from pathlib import Path
 
 
 # We're given a configuration file as input which is parsed as a dict,
@@ -8,22 +11,129 @@ import tailspring.ts_enums as ts_enums
 # caps, cap modifications, vspaces, etc.) and wrap them in a class and reference them
 # by the object wrapper. The wrappers are defined in ts_types
 def create_object_wrappers(ctx: Context):
+    expand_replicas(ctx)
     create_initial_cap_wrappers(ctx)
     create_cap_modification_wrappers(ctx)
     create_vspace_wrappers(ctx)
+    assign_asid_pools(ctx)
+    create_shared_region_wrappers(ctx)
     create_cnode_wrappers(ctx)
     create_thread_wrappers(ctx)
 
 
+# Entries in these sections may set 'replicas: N' to stand for N copies of themselves
+REPLICATED_SECTIONS = ('caps', 'cap_modifications', 'cnodes', 'vspaces', 'threads')
+
+# Keys of each section whose values name another entry, which is swapped for the matching replica
+REPLICA_REFERENCE_KEYS = {'cap_modifications': ('original',), 'threads': ('cspace', 'vspace', 'ipc_buffer')}
+
+
+def get_replica_name(name: str, replica: int) -> str:
+    return f'{name}_{replica}'
+
+
+# Replicated entries are expanded into plain entries named '<name>_<i>' before the config is processed any further.
+# Inside replica i, a name referring to another entry with the same number of replicas refers to that entry's replica i,
+# while names of entries that aren't replicated are kept, so e.g. every worker gets its own cspace but the same endpoint
+def expand_replicas(ctx: Context):
+    replica_counts = get_replica_counts(ctx)
+    if not replica_counts:
+        return
+
+    for section in REPLICATED_SECTIONS:
+        if not ctx.config.get(section):
+            continue
+        expanded_section = {}
+        for name, info in ctx.config[section].items():
+            if type(info) != dict or 'replicas' not in info:
+                expanded_section[name] = info
+                continue
+            for replica in range(info['replicas']):
+                replica_name = get_replica_name(name, replica)
+                if replica_name in ctx.config[section]:
+                    raise ValueError(f"Replica '{replica_name}' of '{name}' clashes with an entry of the same name in {section} section")
+                expanded_section[replica_name] = expand_replica(section, name, info, replica, replica_counts)
+        ctx.config[section] = expanded_section
+
+    # A shared region mapped into a replicated vspace is mapped into every replica
+    for region_info in (ctx.config.get('shared_regions') or {}).values():
+        expanded_mappings = []
+        for mapping_info in region_info['mappings']:
+            vspace_name = mapping_info['vspace']
+            if vspace_name in replica_counts:
+                expanded_mappings += [{**mapping_info, 'vspace': get_replica_name(vspace_name, replica)} for replica in range(replica_counts[vspace_name])]
+            else:
+                expanded_mappings.append(mapping_info)
+        region_info['mappings'] = expanded_mappings
+
+
+# Returns {name: number of replicas} for every replicated entry. A thread and its TCB share a name, so a name may
+# be replicated in several sections, but it has to have the same number of replicas in each
+def get_replica_counts(ctx: Context) -> Dict[str, int]:
+    replica_counts = {}
+    for section in REPLICATED_SECTIONS:
+        for name, info in (ctx.config.get(section) or {}).items():
+            if type(info) != dict or 'replicas' not in info:
+                continue
+            num_replicas = info['replicas']
+            if type(num_replicas) != int or num_replicas <= 0:
+                raise ValueError(f"Expected replicas '{num_replicas}' of '{name}' in {section} section to be a positive int")
+            if replica_counts.setdefault(name, num_replicas) != num_replicas:
+                raise ValueError(f"'{name}' has a different number of replicas in {section} section than in an earlier section")
+
+    # Every replica of a thread needs a TCB of its own
+    for name, info in (ctx.config.get('threads') or {}).items():
+        if type(info) == dict and 'replicas' in info and not (type(ctx.config['caps'].get(name)) == dict and 'replicas' in ctx.config['caps'][name]):
+            raise ValueError(f"Thread '{name}' is replicated, so its TCB must be replicated too, e.g. '{name}: {{type: tcb, replicas: {info['replicas']}}}' in caps section")
+    return replica_counts
+
+
+def expand_replica(section: str, name: str, info: dict, replica: int, replica_counts: Dict[str, int]):
+    num_replicas = info['replicas']
+
+    def resolve(ref):
+        if type(ref) != str or ref not in replica_counts:
+            return ref
+        if replica_counts[ref] != num_replicas:
+            raise ValueError(f"'{name}' in {section} section has {num_replicas} replicas, but refers to '{ref}' which has {replica_counts[ref]}")
+        return get_replica_name(ref, replica)
+
+    replica_info = {key: value for key, value in info.items() if key != 'replicas'}
+
+    # Caps are given as just their type, the dict form is only for replication
+    if section == 'caps':
+        return replica_info['type']
+
+    for key in REPLICA_REFERENCE_KEYS.get(section, ()):
+        if key in replica_info:
+            replica_info[key] = resolve(replica_info[key])
+
+    # The slots of a cnode are its int keys
+    if section == 'cnodes':
+        for key in replica_info:
+            if type(key) == int:
+                replica_info[key] = resolve(replica_info[key])
+
+    if section == 'threads':
+        # Each replica can tell which one it is from its arguments, and replicas are spread over the cores unless pinned
+        if 'args' in replica_info:
+            replica_info['args'] = [str(arg).replace('{replica}', str(replica)) for arg in replica_info['args']]
+        replica_info.setdefault('affinity', 'auto')
+
+    return replica_info
+
+
 # Process initial caps in config file (everything under the 'caps' section)
 def create_initial_cap_wrappers(ctx: Context):
     for cap_name, cap_type_str in ctx.config['caps'].items():
         if ctx.cap_addresses.has_cap_with_name(cap_name):
             raise ValueError(f"Found duplicate cap with name '{cap_name}' in caps section")
 
-        cap_type = ts_enums.CapType[cap_type_str]
-        if cap_type == ts_enums.CapType.cnode:
+        cap_type = ctx.cap_types[cap_type_str]
+        if cap_type == ctx.cap_types.cnode:
             raise ValueError(f"Nested CNode caps are not allowed (cap name: '{cap_name}')")
+        if cap_type in (ctx.cap_types.untyped, ctx.cap_types.asid_pool):
+            raise ValueError(f"Caps of type '{cap_type_str}' can't be created in the caps section (cap name: '{cap_name}')")
 
         can_be_derived = cap_type not in ctx.underivable_cap_types
         cap = ts_types.Cap(name=cap_name, type=cap_type, can_be_derived=can_be_derived)
@@ -67,7 +177,7 @@ def create_cnode_wrappers(ctx: Context):
         guard = cnode_info['guard']
 
         # Create cnode object
-        cnode = ts_types.CNode(name=cnode_name, type=ts_enums.CapType.cnode, size=size, guard=guard, can_be_derived=True)
+        cnode = ts_types.CNode(name=cnode_name, type=ctx.cap_types.cnode, size=size, guard=guard, can_be_derived=True)
         ctx.cap_addresses.append(cnode)
 
         # The cnode's child caps are defined in the config file as key value pairs, where the key is an int
@@ -104,6 +214,14 @@ def create_cnode_wrappers(ctx: Context):
                 raise ValueError(f"Duplicate device_untypeds_start found at cnode {cnode_name}")
             ctx.device_untypeds_cnode = cnode
             cap_indexes.append(cnode.device_untypeds_start)
+        if 'reclaimed_frames' in cnode_info:
+            cnode.reclaimed_frames_start = cnode_info['reclaimed_frames']
+            if cnode.reclaimed_frames_start in cap_indexes:
+                raise ValueError(f"reclaimed_frames conflicts with assigned slot {cnode.reclaimed_frames_start} in cnode {cnode_name}")
+            if ctx.reclaimed_frames_cnode is not None:
+                raise ValueError(f"Duplicate reclaimed_frames found at cnode {cnode_name}")
+            ctx.reclaimed_frames_cnode = cnode
+            cap_indexes.append(cnode.reclaimed_frames_start)
 
         # Now, find the upper bound of the untyped region
         # Lower bound is inclusive, upper bound is exclusive
@@ -125,18 +243,175 @@ def create_cnode_wrappers(ctx: Context):
                 # Else, the upper bound of the range is limited by the size of the cnode
                 cnode.device_untypeds_end = 1 << size
 
+        if cnode.reclaimed_frames_start is not None:
+            used_slots_above_start = [e for e in cap_indexes if e > cnode.reclaimed_frames_start]
+            cnode.reclaimed_frames_end = min(used_slots_above_start) if used_slots_above_start else 1 << size
+
+    # Where the reclaimed frames went is recorded in the general-purpose memory info page
+    if ctx.reclaimed_frames_cnode is not None and ctx.gp_untypeds_cnode is None:
+        raise ValueError(f"reclaimed_frames in cnode {ctx.reclaimed_frames_cnode.name} needs gp_untypeds to be given too")
+
 
 # Process vspaces
 def create_vspace_wrappers(ctx: Context):
-    for index, (vspace_name, binary_name) in enumerate(ctx.config['vspaces'].items()):
+    # Frames map to the same cache sets as every frame whose physical page number is the same modulo the number of colors
+    ctx.num_cache_colors = ctx.config['num_cache_colors'] if 'num_cache_colors' in ctx.config else 1
+    word_bits = ctx.sel4_info['literals']['seL4_WordBits']
+    if type(ctx.num_cache_colors) != int or not 1 <= ctx.num_cache_colors <= word_bits or ctx.num_cache_colors & (ctx.num_cache_colors - 1):
+        raise ValueError(f"Expected num_cache_colors '{ctx.num_cache_colors}' to be a power of two no greater than {word_bits}")
+
+    for index, (vspace_name, vspace_info) in enumerate(ctx.config['vspaces'].items()):
         if ctx.cap_addresses.has_cap_with_name(vspace_name):
             raise ValueError(f"Found duplicate cap with name '{vspace_name}' in vspace section")
 
+        # A vspace is either given as just the name of its thread binary, or as a dictionary with extra settings
+        if type(vspace_info) != dict:
+            vspace_info = {'binary': vspace_info}
+        binary_name = vspace_info['binary']
+
         binary_path = ctx.startup_threads_paths[binary_name]
-        vspace = ts_types.VSpace(name=vspace_name, type=ts_enums.CapType.vspace, binary_name=binary_name, nonce=index, binary_path=binary_path, alignment=ctx.page_size, can_be_derived=True)
+        vspace = ts_types.VSpace(name=vspace_name, type=ctx.cap_types.vspace, binary_name=binary_name, nonce=index, binary_path=binary_path, alignment=ctx.page_size, can_be_derived=True,
+                                 image=get_elf_image(binary_path, ctx))
         ctx.cap_addresses.append(vspace)
         ctx.vspaces[vspace_name] = vspace
 
+        if 'device_mappings' in vspace_info:
+            create_device_mapping_wrappers(vspace, vspace_info['device_mappings'], ctx)
+
+        if 'cache_colors' in vspace_info:
+            vspace.color_mask = get_color_mask(vspace_name, vspace_info['cache_colors'], ctx)
+
+
+# Images are kept in ctx.elf_images by resolved path, which the daemon carries over from earlier builds. One is only
+# reused while the binary's mtime and size are the same as when it was parsed
+def get_elf_image(binary_path: Path, ctx: Context) -> ts_types.ELFImage:
+    key = binary_path.resolve()
+    stat = key.stat()
+    image = ctx.elf_images.get(key)
+    if image is None or image.mtime_ns != stat.st_mtime_ns or image.size != stat.st_size:
+        image = ts_types.ELFImage(path=key, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        ctx.elf_images[key] = image
+    return image
+
+
+def get_color_mask(vspace_name: str, colors: List[int], ctx: Context) -> int:
+    if type(colors) != list or not colors or any(type(color) != int or not 0 <= color < ctx.num_cache_colors for color in colors):
+        raise ValueError(f"Expected cache_colors of VSpace '{vspace_name}' to be a non-empty list of colors less than num_cache_colors ({ctx.num_cache_colors})")
+
+    color_mask = 0
+    for color in colors:
+        color_mask |= 1 << color
+    # Every color is the same as no restriction, and saves copying the vspace's chunks
+    return color_mask if color_mask != (1 << ctx.num_cache_colors) - 1 else 0
+
+
+# Every vspace needs an ASID, and the root task's ASID pool only has room for so many, one of which is its own vspace.
+# The vspaces that don't fit are spread over extra pools that the loader makes, filling each pool before the next
+def assign_asid_pools(ctx: Context):
+    literals = ctx.sel4_info['literals']
+    pool_entries = 1 << literals['seL4_ASIDPoolIndexBits']
+    # The root task's pool counts towards the number of pools the kernel can hold
+    max_extra_pools = (1 << literals['seL4_NumASIDPoolsBits']) - 1
+
+    extra_vspaces = list(ctx.vspaces.values())[pool_entries - 1:]
+    num_extra_pools = -(-len(extra_vspaces) // pool_entries)
+    if num_extra_pools > max_extra_pools:
+        raise ValueError(f"{len(ctx.vspaces)} vspaces need {num_extra_pools} ASID pools besides the root task's, but the kernel only has room for {max_extra_pools}")
+
+    for pool_index in range(num_extra_pools):
+        untyped = ts_types.Cap(name=f'asid_pool{pool_index}_untyped__', type=ctx.cap_types.untyped, can_be_derived=False)
+        pool = ts_types.Cap(name=f'asid_pool{pool_index}__', type=ctx.cap_types.asid_pool, can_be_derived=False)
+        ctx.cap_addresses.append(untyped)
+        ctx.cap_addresses.append(pool)
+
+        asid_pool = ts_types.ASIDPool(pool=pool, untyped=untyped)
+        for vspace in extra_vspaces[pool_index * pool_entries:(pool_index + 1) * pool_entries]:
+            vspace.asid_pool = asid_pool
+            asid_pool.vspaces.append(vspace)
+        ctx.asid_pools.append(asid_pool)
+
+
+# Device mappings are ranges of physical device memory (e.g. MMIO registers) that are mapped into the vspace at boot
+def create_device_mapping_wrappers(vspace: ts_types.VSpace, device_mappings_info: List[dict], ctx: Context):
+    for mapping_index, mapping_info in enumerate(device_mappings_info):
+        paddr = mapping_info['paddr']
+        vaddr = mapping_info['vaddr']
+        size = mapping_info['size']
+        for key, value in (('paddr', paddr), ('vaddr', vaddr)):
+            if type(value) != int or value % ctx.page_size != 0:
+                raise ValueError(f"Expected {key} '{value}' of device mapping in VSpace '{vspace.name}' to be aligned to the page size")
+        if type(size) != int or size <= 0:
+            raise ValueError(f"Expected size '{size}' of device mapping in VSpace '{vspace.name}' to be a positive int")
+
+        # Device memory is mapped uncached unless asked otherwise
+        cached = mapping_info['cached'] if 'cached' in mapping_info else False
+
+        # Round size up to the nearest multiple of the page size
+        size += -size % ctx.page_size
+        check_range_free_of_chunks(vspace, Range(vaddr, vaddr + size), f"Device mapping @ {hex(paddr)}")
+
+        device_mapping = ts_types.DeviceMapping(paddr=paddr, vaddr=vaddr, size=size, cached=cached)
+        for frame_index in range(size // ctx.page_size):
+            frame = ts_types.Cap(name=f'{vspace.name}_device{mapping_index}_frame{frame_index}__', type=ctx.cap_types.frame, can_be_derived=True)
+            ctx.cap_addresses.append(frame)
+            device_mapping.frames.append(frame)
+        vspace.device_mappings.append(device_mapping)
+
+    vspace.device_mappings.sort(key=lambda mapping: mapping.paddr)
+
+
+def check_range_free_of_chunks(vspace: ts_types.VSpace, range_to_check: Range, description: str):
+    for chunk in vspace.binary_chunks:
+        if range_to_check.overlaps_with(Range(chunk.dest_vaddr_aligned, chunk.dest_vaddr_aligned + chunk.total_length_with_padding)):
+            raise ValueError(f"{description} overlaps with chunk '{chunk.name}' in VSpace '{vspace.name}'")
+
+
+# Process shared regions - each region is a set of frames mapped into one or more vspaces
+def create_shared_region_wrappers(ctx: Context):
+    for region_name, region_info in (ctx.config.get('shared_regions') or {}).items():
+        size = region_info['size']
+        if type(size) != int or size <= 0:
+            raise ValueError(f"Expected size '{size}' of shared region '{region_name}' to be a positive int")
+
+        large_pages = region_info['large_pages'] if 'large_pages' in region_info else False
+        page_type = ctx.cap_types.large_page if large_pages else ctx.cap_types.frame
+        page_size_bits = ctx.sel4_info['object_sizes'][page_type.value]
+        page_size = 1 << page_size_bits
+
+        # Round size up to the nearest multiple of the page size
+        size += -size % page_size
+        shared_region = ts_types.SharedRegion(name=region_name, size=size, page_type=page_type, page_size_bits=page_size_bits)
+
+        for frame_index in range(size // page_size):
+            frame = ts_types.Cap(name=f'{region_name}_frame{frame_index}__', type=page_type, can_be_derived=True)
+            ctx.cap_addresses.append(frame)
+            shared_region.frames.append(frame)
+
+        for mapping_info in region_info['mappings']:
+            vspace_name = mapping_info['vspace']
+            if vspace_name not in ctx.vspaces:
+                raise ValueError(f"Could not find VSpace '{vspace_name}' in shared region '{region_name}'")
+            vspace = ctx.vspaces[vspace_name]
+
+            vaddr = mapping_info['vaddr']
+            if type(vaddr) != int or vaddr % page_size != 0:
+                raise ValueError(f"Expected vaddr '{vaddr}' of shared region '{region_name}' in VSpace '{vspace_name}' to be aligned to {hex(page_size)}")
+
+            # Make sure the region doesn't land on top of the thread binary
+            check_range_free_of_chunks(vspace, Range(vaddr, vaddr + size), f"Shared region '{region_name}' @ {hex(vaddr)}")
+
+            rights_list = mapping_info['rights'] if 'rights' in mapping_info else ['read', 'write']
+            rights_enum = [ts_enums.CapRight[right] for right in rights_list]
+
+            mapping = ts_types.SharedRegionMapping(vspace=vspace, vaddr=vaddr, rights=rights_enum)
+            for frame_index in range(len(shared_region.frames)):
+                frame_copy = ts_types.Cap(name=f'{region_name}_{vspace_name}_frame{frame_index}__', type=page_type, can_be_derived=True)
+                ctx.cap_addresses.append(frame_copy)
+                mapping.frames.append(frame_copy)
+            shared_region.mappings.append(mapping)
+
+        ctx.shared_regions[region_name] = shared_region
+
 
 # Process threads
 def create_thread_wrappers(ctx: Context):
@@ -146,13 +421,13 @@ def create_thread_wrappers(ctx: Context):
 
         # The tcb must have been already created in the 'caps' section and have type 'tcb'
         tcb = ctx.cap_addresses.get_cap_by_name(tcb_name)
-        if tcb.type != ts_enums.CapType.tcb:
+        if tcb.type != ctx.cap_types.tcb:
             raise ValueError(f"Expected TCB '{tcb_name}' in threads section to be a tcb")
 
         # Same with cspace, it must be a cnode
         cspace_name = thread_info['cspace']
         cspace = ctx.cap_addresses.get_cap_by_name(cspace_name)
-        if cspace.type != ts_enums.CapType.cnode:
+        if cspace.type != ctx.cap_types.cnode:
             raise ValueError(f"Expected CSpace '{cspace_name}' in threads section to be a cnode")
         assert isinstance(cspace, ts_types.CNode)  # Suppress pycharm warning that ts_types.Thread constructor expects a CNode but a Cap is being passed
 
@@ -165,13 +440,20 @@ def create_thread_wrappers(ctx: Context):
         # IPC buffer should be a frame
         ipc_buffer_name = thread_info['ipc_buffer']
         ipc_buffer = ctx.cap_addresses.get_cap_by_name(ipc_buffer_name)
-        if ipc_buffer.type != ts_enums.CapType.frame:
+        if ipc_buffer.type != ctx.cap_types.frame:
             raise ValueError(f"Expected IPC buffer '{ipc_buffer_name}' in threads section to be a frame")
 
         stack_size = thread_info['stack_size']
         if type(stack_size) != int or stack_size < 0:
             raise ValueError(f"Expected stack size '{stack_size}' in threads section to be a positive int")
 
+        # The stack and IPC buffer may be pinned to fixed addresses, otherwise the layout engine places them
+        stack_vaddr = thread_info['stack_vaddr'] if 'stack_vaddr' in thread_info else None
+        ipc_buffer_vaddr = thread_info['ipc_buffer_vaddr'] if 'ipc_buffer_vaddr' in thread_info else None
+        for key, value in (('stack_vaddr', stack_vaddr), ('ipc_buffer_vaddr', ipc_buffer_vaddr)):
+            if value is not None and (type(value) != int or value % ctx.page_size != 0):
+                raise ValueError(f"Expected {key} '{value}' for thread '{tcb_name}' to be an int aligned to the page size")
+
         # A custom entry functon may be passed. If so, we need to look up the symbol address. Otherwise, use the entry in the elf file
         if 'entry' in thread_info:
             entry_symbol_name = thread_info['entry']
@@ -180,7 +462,7 @@ def create_thread_wrappers(ctx: Context):
                 raise RuntimeError(f"Entry symbol '{entry_symbol_name}' for thread '{tcb_name}' not found in vspace '{vspace_name}'")
             entry_addr = entry_symbol['st_value']
         else:
-            entry_addr = vspace.elf.header.e_entry
+            entry_addr = vspace.image.elf.header.e_entry
 
         # Custom arguments may be passed
         args = [str(arg) for arg in thread_info['args']] if 'args' in thread_info else []
@@ -188,6 +470,82 @@ def create_thread_wrappers(ctx: Context):
         # System information (e.g. framebuffer info) may be requested to be passed to the thread
         pass_framebuffer_info = thread_info['pass_framebuffer_info'] if 'pass_framebuffer_info' in thread_info else False
 
+        # Threads may be pinned to a core, or given the value 'auto' to be spread across cores according to their weight
+        affinity = thread_info['affinity'] if 'affinity' in thread_info else 0
+        if affinity == 'auto':
+            affinity = None
+        elif type(affinity) != int or not 0 <= affinity < ctx.max_num_nodes:
+            raise ValueError(f"Expected affinity '{affinity}' for thread '{tcb_name}' to be 'auto' or a core number less than {ctx.max_num_nodes}")
+
+        weight = thread_info['weight'] if 'weight' in thread_info else 1
+        if type(weight) != int or weight <= 0:
+            raise ValueError(f"Expected weight '{weight}' for thread '{tcb_name}' to be a positive int")
+
+        # Scheduling parameters default to those of a freshly created TCB, i.e. priority and MCP of 0
+        max_prio = ctx.sel4_info['literals']['seL4_MaxPrio']
+        priority = thread_info['priority'] if 'priority' in thread_info else 0
+        max_priority = thread_info['max_priority'] if 'max_priority' in thread_info else 0
+        for key, value in (('priority', priority), ('max_priority', max_priority)):
+            if type(value) != int or not 0 <= value <= max_prio:
+                raise ValueError(f"Expected {key} '{value}' for thread '{tcb_name}' to be an int between 0 and {max_prio}")
+
+        # On MCS kernels a thread only runs while it has budget left in its scheduling context. If only one
+        # of budget/period is given the other takes the same value, and if neither is given the thread gets a full
+        # time slice every period, like the root task does
+        budget = thread_info['budget'] if 'budget' in thread_info else None
+        period = thread_info['period'] if 'period' in thread_info else None
+        sched_context = None
+        if ctx.mcs:
+            if budget is None and period is None:
+                budget = period = ctx.sel4_info['literals']['CONFIG_BOOT_THREAD_TIME_SLICE'] * 1000
+            budget = period if budget is None else budget
+            period = budget if period is None else period
+            if type(budget) != int or type(period) != int or not 0 < budget <= period:
+                raise ValueError(f"Expected budget '{budget}' and period '{period}' for thread '{tcb_name}' to be positive ints with budget <= period")
+
+            sched_context = ts_types.Cap(name=f'{tcb_name}_sched_context__', type=ctx.cap_types.sched_context, can_be_derived=True)
+            ctx.cap_addresses.append(sched_context)
+        elif budget is not None or period is not None:
+            raise ValueError(f"Thread '{tcb_name}' sets a budget or period, but the kernel was not built with the MCS scheduler")
+
+        heap = create_heap(tcb_name, thread_info['heap'], ctx) if 'heap' in thread_info else None
+        # A large page covers every color, unless there are more colors than regular frames fit in a large page
+        if heap is not None and vspace.color_mask and heap.page_type != ctx.cap_types.frame:
+            raise ValueError(f"Thread '{tcb_name}' has a heap backed by large pages, but its VSpace '{vspace_name}' has cache colors")
+
         thread = ts_types.Thread(tcb=tcb, cspace=cspace, vspace=vspace, ipc_buffer=ipc_buffer, stack_size=stack_size,
-                                 entry_addr=entry_addr, args=args, pass_framebuffer_info=pass_framebuffer_info)
+                                 entry_addr=entry_addr, args=args, pass_framebuffer_info=pass_framebuffer_info,
+                                 affinity=affinity, weight=weight, priority=priority, max_priority=max_priority,
+                                 budget=budget, period=period, index=len(ctx.threads), sched_context=sched_context,
+                                 stack_vaddr=stack_vaddr, ipc_buffer_vaddr=ipc_buffer_vaddr, heap=heap)
         ctx.threads[tcb_name] = thread
+
+
+# A heap is a set of frames private to one thread, created by the loader and mapped before the thread starts
+def create_heap(tcb_name: str, heap_info: dict, ctx: Context) -> ts_types.Heap:
+    size = heap_info['size']
+    max_size = heap_info['max_size'] if 'max_size' in heap_info else None
+    if type(size) != int or size < 0 or (size == 0 and max_size is None):
+        raise ValueError(f"Expected heap size '{size}' for thread '{tcb_name}' to be a positive int")
+    if max_size is not None and (type(max_size) != int or max_size < max(size, 1)):
+        raise ValueError(f"Expected heap max_size '{max_size}' for thread '{tcb_name}' to be an int no smaller than its size")
+
+    large_pages = heap_info['large_pages'] if 'large_pages' in heap_info else False
+    page_type = ctx.cap_types.large_page if large_pages else ctx.cap_types.frame
+    page_size_bits = ctx.sel4_info['object_sizes'][page_type.value]
+    page_size = 1 << page_size_bits
+
+    vaddr = heap_info['vaddr'] if 'vaddr' in heap_info else None
+    if vaddr is not None and (type(vaddr) != int or vaddr % page_size != 0):
+        raise ValueError(f"Expected heap vaddr '{vaddr}' for thread '{tcb_name}' to be an int aligned to {hex(page_size)}")
+
+    # Round sizes up to the nearest multiple of the page size
+    size += -size % page_size
+    max_size = size if max_size is None else max_size + -max_size % page_size
+    heap = ts_types.Heap(size=size, max_size=max_size, page_type=page_type, page_size_bits=page_size_bits, vaddr=vaddr)
+
+    for frame_index in range(size // page_size):
+        frame = ts_types.Cap(name=f'{tcb_name}_heap_frame{frame_index}__', type=page_type, can_be_derived=True)
+        ctx.cap_addresses.append(frame)
+        heap.frames.append(frame)
+    return heap
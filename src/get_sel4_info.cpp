@@ -17,6 +17,8 @@ namespace Wrapper {
 
 using namespace Wrapper::SeL4;
 
+#include <tailspring_shared.h>
+
 // Take advantage of how C++ searches namespaces for symbol names
 // If a symbol was already #included in sel4.h, then 'name' will refer to that symbol
 // Otherwise, the next higher namespace will be searched, which will find the 'NotFound name' declaration
@@ -99,6 +101,26 @@ int main() {
         outputExpr(AT_SEL4_IPC_BUFFER_PTR);
         outputExpr(AT_NULL);
         outputExpr(AT_SYSINFO);
+#ifdef CONFIG_MAX_NUM_NODES
+        outputExpr(CONFIG_MAX_NUM_NODES);
+#else
+        outputNum("CONFIG_MAX_NUM_NODES", 1);
+#endif
+        outputExpr(seL4_MaxPrio);
+        outputExpr(seL4_ASIDPoolBits);
+        outputExpr(seL4_ASIDPoolIndexBits);
+        outputExpr(seL4_NumASIDPoolsBits);
+        outputExpr(TAILSPRING_AT_HANDOFF);
+        outputExpr(TAILSPRING_HANDOFF_MAGIC);
+        outputExpr(TAILSPRING_HANDOFF_VERSION);
+        outputExpr(TAILSPRING_HANDOFF_NAME_LEN);
+        outputExpr(sizeof(TailspringHandoff));
+#ifdef CONFIG_KERNEL_MCS
+        outputNum("CONFIG_KERNEL_MCS", 1);
+        outputExpr(CONFIG_BOOT_THREAD_TIME_SLICE);
+#else
+        outputNum("CONFIG_KERNEL_MCS", 0);
+#endif
 
         endDict();
     }
@@ -108,8 +130,12 @@ int main() {
 
         outputNum("seL4_TCBObject", seL4_TCBBits);
         outputNum("seL4_EndpointObject", seL4_EndpointBits);
+#ifdef CONFIG_KERNEL_MCS
+        outputNum("seL4_SchedContextObject", seL4_MinSchedContextBits);
+#endif
 
         outputNum("seL4_X86_4K", seL4_PageBits);
+        outputNum("seL4_X86_LargePageObject", seL4_LargePageBits);
         outputNum("seL4_X64_PML4Object", seL4_PML4Bits);
         outputNum("seL4_X86_PDPTObject", seL4_PDPTBits);
         outputNum("seL4_X86_PageDirectoryObject", seL4_PageDirBits);
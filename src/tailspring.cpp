@@ -7,6 +7,9 @@ seL4_BootInfo* boot_info = NULL;
 seL4_Word num_empty_slots = 0;
 seL4_Word first_empty_slot = 0;
 
+// Slots past SLOTS_REQUIRED are never used by the generated operations, so the loader can use them for its own bookkeeping
+seL4_Word scratch_slots_used = 0;
+
 seL4_CPtr first_untyped = 0;
 seL4_Word num_gp_untypeds = 0;
 seL4_Word num_device_untypeds = 0;
@@ -23,6 +26,16 @@ unsigned char FREE_PAGE[1 << seL4_PageBits] __attribute__((aligned(1 << seL4_Pag
 TailspringMemoryInfo gp_memory_info = {};
 TailspringMemoryInfo device_memory_info = {};
 
+const seL4_Word num_operations = NUM_OPERATIONS;
+
+// Untypeds retyped over memory of the wrong color only need to live until the next frame is retyped after them, since
+// the kernel resets an untyped's watermark once it has no children. A skipped run is shorter than one round of colors,
+// which is at most seL4_WordBits pages, and splits into at most two blocks of each size
+#define MAX_COLOR_SKIP_BLOCKS (2 * 6)
+seL4_CPtr color_skip_slots[MAX_COLOR_SKIP_BLOCKS];
+seL4_Word num_color_skip_slots = 0;
+seL4_Word color_skipped_bytes = 0;
+
 void halt() __attribute__((noreturn));
 void halt() {
     while (1) seL4_TCB_Suspend(seL4_CapInitThreadTCB);
@@ -46,11 +59,17 @@ void loadUntypedInfo(seL4_Word untyped_index) {
     }
     
     dest_info->paddr = untyped->paddr;
-    dest_info->bytes_left = 1 << untyped->sizeBits;
+    dest_info->bytes_left = BIT(untyped->sizeBits);
     dest_info->cptr = untyped_index + first_untyped;
     dest_info->original_size_bits = untyped->sizeBits;
 }
 
+bool allocScratchSlot(seL4_CPtr* slot_out) {
+    if (SLOTS_REQUIRED + scratch_slots_used >= num_empty_slots) return false;
+    *slot_out = first_empty_slot + SLOTS_REQUIRED + scratch_slots_used++;
+    return true;
+}
+
 void loadExtraBootInfo() {
     char* curr = (char*)boot_info + seL4_BootInfoFrameSize;
     char* end = curr + boot_info->extraLen;
@@ -92,12 +111,12 @@ void loadBootInfo() {
 void debugPrintOp(const CapOperation* c) {
     switch (c->op_type) {
         case CREATE_OP:
-            printf("Create (size=%u) (dest=%u)\n",
-                c->create_op.size_bits, c->create_op.dest);
+            printf("Create (size=%u) (dest=%u) (dest_root=%u) (dest_depth=%u)\n",
+                c->create_op.size_bits, c->create_op.dest, c->create_op.dest_root, c->create_op.dest_depth);
             break;
         case MINT_OP:
-            printf("Mint (src=%u) (dest=%u) (badge=%lu) (rights=%u)\n",
-                c->mint_op.src, c->mint_op.dest, c->mint_op.badge, c->mint_op.rights);
+            printf("Mint (src=%u) (dest=%u) (dest_root=%u) (dest_depth=%u) (badge=%lu) (rights=%u)\n",
+                c->mint_op.src, c->mint_op.dest, c->mint_op.dest_root, c->mint_op.dest_depth, c->mint_op.badge, c->mint_op.rights);
             break;
         case COPY_OP:
             printf("Copy (src=%u) (dest_root=%u) (dest_index=%u) (dest_depth=%u)\n",
@@ -119,14 +138,25 @@ void debugPrintOp(const CapOperation* c) {
             printf("Binary chunk load (vspace=%u) (vaddr=%lx) (length=%lx)\n",
                 c->binary_chunk_load_op.dest_vspace, c->binary_chunk_load_op.dest_vaddr, c->binary_chunk_load_op.length);
             break;
+        case BINARY_CHUNK_SHARE_OP:
+            printf("Binary chunk share (vspace=%u) (vaddr=%lx) (length=%lx) (first frame=%u)\n",
+                c->binary_chunk_share_op.dest_vspace, c->binary_chunk_share_op.dest_vaddr, c->binary_chunk_share_op.length,
+                c->binary_chunk_share_op.first_frame);
+            break;
         case TCB_SETUP_OP:
-            printf("TCB Setup (tcb=%u) (cspace=%u) (vspace=%u) (entry addr=%lx)\n",
-                c->tcb_setup_op.tcb, c->tcb_setup_op.cspace, c->tcb_setup_op.vspace, c->tcb_setup_op.entry_addr);
+            printf("TCB Setup (tcb=%u) (cspace=%u) (vspace=%u) (entry addr=%lx) (affinity=%u) (priority=%u) (max priority=%u)\n",
+                c->tcb_setup_op.tcb, c->tcb_setup_op.cspace, c->tcb_setup_op.vspace, c->tcb_setup_op.entry_addr, c->tcb_setup_op.affinity,
+                c->tcb_setup_op.priority, c->tcb_setup_op.max_priority);
             break;
         case MAP_FRAME_OP:
             printf("Map frame (frame=%u) (vspace=%u) (vaddr=%lx)\n",
                 c->map_frame_op.frame, c->map_frame_op.vspace, c->map_frame_op.vaddr);
             break;
+        case DEVICE_MAP_OP:
+            printf("Device map (paddr=%lx) (vaddr=%lx) (num frames=%lu) (first frame=%u) (vspace=%u) (cached=%u)\n",
+                c->device_map_op.paddr, c->device_map_op.vaddr, c->device_map_op.num_frames, c->device_map_op.first_frame,
+                c->device_map_op.vspace, c->device_map_op.cached);
+            break;
         case RETYPE_LEFTOVER_GP_UNTYPEDS_OP:
             printf("Retype leftover general-purpose untypeds (cnode dest=%u) (start slot=%u) (end slot=%u)\n",
                 c->retype_leftover_gp_untypeds_op.cnode_dest, c->retype_leftover_gp_untypeds_op.start_slot, c->retype_leftover_gp_untypeds_op.end_slot);
@@ -136,34 +166,62 @@ void debugPrintOp(const CapOperation* c) {
                 c->move_device_untypeds_op.cnode_dest, c->move_device_untypeds_op.start_slot, c->move_device_untypeds_op.end_slot);
             break;
         case PASS_GP_MEMORY_INFO_OP:
-            printf("Pass general-purpose memory info (dest vaddr=%lu) (dest_vspace=%u) (frame=%u)\n",
-                c->pass_gp_memory_info_op.dest_vaddr, c->pass_gp_memory_info_op.dest_vspace, c->pass_gp_memory_info_op.frame);
+            printf("Pass general-purpose memory info (frame=%u)\n", c->pass_gp_memory_info_op.frame);
             break;
         case PASS_DEVICE_MEMORY_INFO_OP:
-            printf("Pass device memory info (dest vaddr=%lu) (dest_vspace=%u) (frame=%u)\n",
-                c->pass_device_memory_info_op.dest_vaddr, c->pass_device_memory_info_op.dest_vspace, c->pass_device_memory_info_op.frame);
+            printf("Pass device memory info (frame=%u)\n", c->pass_device_memory_info_op.frame);
             break;
         case PASS_SYSTEM_INFO_OP:
-            printf("Pass system info (dest vaddr=%lu) (dest_vspace=%u) (frame=%u) (pass_framebuffer_info=%u)\n",
-                c->pass_system_info_op.dest_vaddr, c->pass_system_info_op.dest_vspace, c->pass_system_info_op.frame, c->pass_system_info_op.pass_framebuffer_info);
+            printf("Pass system info (frame=%u) (pass_framebuffer_info=%u)\n",
+                c->pass_system_info_op.frame, c->pass_system_info_op.pass_framebuffer_info);
+            break;
+        case BINARY_CHUNK_COPY_OP:
+            printf("Binary chunk copy (vspace=%u) (vaddr=%lx) (length=%lx) (first frame=%u)\n",
+                c->binary_chunk_copy_op.dest_vspace, c->binary_chunk_copy_op.dest_vaddr, c->binary_chunk_copy_op.length,
+                c->binary_chunk_copy_op.first_frame);
+            break;
+        case COLORED_FRAMES_CREATE_OP:
+            printf("Colored frames create (first frame=%u) (num frames=%u) (color mask=%lx) (num colors=%u)\n",
+                c->colored_frames_create_op.first_frame, c->colored_frames_create_op.num_frames,
+                c->colored_frames_create_op.color_mask, c->colored_frames_create_op.num_colors);
             break;
-        case TCB_START_OP:
-            printf("TCB start (tcb=%u)\n",
-                c->tcb_start_op.tcb);
+        case MAKE_ASID_POOL_OP:
+            printf("Make ASID pool (untyped=%u) (dest=%u)\n", c->make_asid_pool_op.untyped, c->make_asid_pool_op.dest);
+            break;
+        case RECORD_RECLAIMED_FRAMES_OP:
+            printf("Record reclaimed frames (start slot=%u) (end slot=%u)\n",
+                c->record_reclaimed_frames_op.start_slot, c->record_reclaimed_frames_op.end_slot);
+            break;
+        case RECLAIM_LOADER_MEMORY_OP:
+            printf("Reclaim loader memory (cnode dest=%u) (start slot=%u) (end slot=%u)\n",
+                c->reclaim_loader_memory_op.cnode_dest, c->reclaim_loader_memory_op.start_slot, c->reclaim_loader_memory_op.end_slot);
             break;
     }
 }
 
+// Offset into the untyped that the kernel will place the next object at
+seL4_Word getUntypedWatermark(const UntypedInfo* untyped) {
+    return BIT(untyped->original_size_bits) - untyped->bytes_left;
+}
+
+// The kernel places objects at the watermark rounded up to the object's size, which is always a power of two.
+// Returns the offset an object of this size would be placed at, or ~0llu if it doesn't fit
+seL4_Word getAlignedOffset(const UntypedInfo* untyped, seL4_Word object_size) {
+    seL4_Word offset = (getUntypedWatermark(untyped) + object_size - 1) & ~(object_size - 1);
+    if (offset + object_size > BIT(untyped->original_size_bits)) return ~0llu;
+    return offset;
+}
+
 seL4_Word getUntypedBestFitIndex(seL4_Word bytes_required) {
     // Keep track of smallest untyped that fits this object
     seL4_Word best_fit_index = ~0llu;
     seL4_Word best_fit_size = ~0llu;
     for (seL4_Word untyped_index = 0; untyped_index < num_gp_untypeds; untyped_index++) {
         seL4_Word untyped_size = gp_untyped_array[untyped_index].bytes_left;
-        // If the untyped is big enough for this object
-        if (untyped_size >= bytes_required) {
-            // If the untyped is a better fit than our current best fit
-            if (untyped_size < best_fit_size) {
+        // If the untyped is big enough for this object, and a better fit than our current best fit
+        if (untyped_size >= bytes_required && untyped_size < best_fit_size) {
+            // Only check the alignment once the cheap checks pass
+            if (getAlignedOffset(&gp_untyped_array[untyped_index], bytes_required) != ~0llu) {
                 best_fit_index = untyped_index;
                 best_fit_size = untyped_size;
             }
@@ -177,16 +235,26 @@ bool doCreateOp(CapOperation* cap_op) {
     seL4_Word bytes_required = cap_op->create_op.bytes_required;
     seL4_Word untyped_index = getUntypedBestFitIndex(bytes_required);
     if (untyped_index == ~0llu) return false;
-    gp_untyped_array[untyped_index].bytes_left -= bytes_required;
-
-    seL4_CPtr untyped = gp_untyped_array[untyped_index].cptr;
-
+    UntypedInfo* untyped_info = &gp_untyped_array[untyped_index];
+    untyped_info->bytes_left = BIT(untyped_info->original_size_bits) - (getAlignedOffset(untyped_info, bytes_required) + bytes_required);
+
+    seL4_CPtr untyped = untyped_info->cptr;
+
+    // The dest cnode is looked up in the loader's cnode, which is resolved with all of the word's bits
+    seL4_Word node_index = 0;
+    seL4_Word node_depth = 0;
+    seL4_Word node_offset = first_empty_slot + cap_op->create_op.dest;
+    if (cap_op->create_op.dest_depth != 0) {
+        node_index = first_empty_slot + cap_op->create_op.dest_root;
+        node_depth = seL4_WordBits;
+        node_offset = cap_op->create_op.dest;
+    }
 
     seL4_Error error = seL4_Untyped_Retype(untyped,
                                     cap_op->create_op.cap_type,
                                     cap_op->create_op.size_bits,
-                                    seL4_CapInitThreadCNode, 0, 0,
-                                    first_empty_slot + cap_op->create_op.dest,
+                                    seL4_CapInitThreadCNode, node_index, node_depth,
+                                    node_offset,
                                     1);
     return (error == seL4_NoError);
 }
@@ -217,9 +285,18 @@ bool doMintOp(CapOperation* cap_op) {
                                                             (cap_op->mint_op.rights & CAP_ALLOW_READ) != 0,
                                                             (cap_op->mint_op.rights & CAP_ALLOW_WRITE) != 0);
 
-    seL4_Error error = seL4_CNode_Mint( seL4_CapInitThreadCNode,
-                                        first_empty_slot + cap_op->mint_op.dest,
-                                        seL4_WordBits,
+    seL4_CPtr dest_root = seL4_CapInitThreadCNode;
+    seL4_Word dest_index = first_empty_slot + cap_op->mint_op.dest;
+    uint8_t dest_depth = seL4_WordBits;
+    if (cap_op->mint_op.dest_depth != 0) {
+        dest_root = first_empty_slot + cap_op->mint_op.dest_root;
+        dest_index = cap_op->mint_op.dest;
+        dest_depth = cap_op->mint_op.dest_depth;
+    }
+
+    seL4_Error error = seL4_CNode_Mint( dest_root,
+                                        dest_index,
+                                        dest_depth,
                                         seL4_CapInitThreadCNode,
                                         first_empty_slot + cap_op->mint_op.src,
                                         seL4_WordBits, decoded_rights,
@@ -255,16 +332,43 @@ bool doBinaryChunkLoadOp(CapOperation* cap_op) {
         // Map page into destination vspace
         error = wrapperPageMap( current_frame,
                                 first_empty_slot + cap_op->binary_chunk_load_op.dest_vspace,
-                                frame_dest_vaddr);
+                                frame_dest_vaddr,
+                                cap_op->binary_chunk_load_op.writable ? seL4_ReadWrite : seL4_CanRead);
+        if (error != seL4_NoError) return false;
+    }
+    return true;
+}
+
+bool doBinaryChunkShareOp(CapOperation* cap_op) {
+    seL4_Error error;
+    seL4_CPtr chunk_start_frame = getFrameForAddr(cap_op->binary_chunk_share_op.src_vaddr);
+
+    for (seL4_Word i = 0; i < (cap_op->binary_chunk_share_op.length >> seL4_PageBits); i++) {
+        seL4_CPtr frame_copy = first_empty_slot + cap_op->binary_chunk_share_op.first_frame + i;
+        seL4_Word frame_dest_vaddr = cap_op->binary_chunk_share_op.dest_vaddr + (i << seL4_PageBits);
+
+        // The frame may already be mapped into the vspace the chunk was loaded into, so a read-only copy of its cap is mapped instead
+        error = seL4_CNode_Mint(seL4_CapInitThreadCNode, frame_copy, seL4_WordBits,
+                                seL4_CapInitThreadCNode, chunk_start_frame + i, seL4_WordBits,
+                                seL4_CanRead, 0);
+        if (error != seL4_NoError) return false;
+
+        error = wrapperPageMap( frame_copy,
+                                first_empty_slot + cap_op->binary_chunk_share_op.dest_vspace,
+                                frame_dest_vaddr,
+                                seL4_CanRead);
         if (error != seL4_NoError) return false;
     }
     return true;
 }
 
 bool doTCBSetupOp(CapOperation* cap_op) {
-    seL4_Error error = seL4_TCB_Configure(
-        first_empty_slot + cap_op->tcb_setup_op.tcb,
-        0,
+    seL4_CPtr tcb = first_empty_slot + cap_op->tcb_setup_op.tcb;
+    seL4_Error error;
+
+#ifdef CONFIG_KERNEL_MCS
+    error = seL4_TCB_Configure(
+        tcb,
         first_empty_slot + cap_op->tcb_setup_op.cspace,
         0,
         first_empty_slot + cap_op->tcb_setup_op.vspace,
@@ -273,10 +377,52 @@ bool doTCBSetupOp(CapOperation* cap_op) {
         first_empty_slot + cap_op->tcb_setup_op.ipc_buffer);
     if (error != seL4_NoError) return false;
 
-    seL4_UserContext regs = {0};
-    error = seL4_TCB_ReadRegisters(first_empty_slot + cap_op->tcb_setup_op.tcb, 0, 0, sizeof(regs)/sizeof(seL4_Word), &regs);
+    // With MCS, the core a thread runs on is decided by which core's sched control cap configures its scheduling context
+    seL4_CPtr sched_context = first_empty_slot + cap_op->tcb_setup_op.sched_context;
+    error = seL4_SchedControl_ConfigureFlags(
+        boot_info->schedcontrol.start + cap_op->tcb_setup_op.affinity,
+        sched_context,
+        cap_op->tcb_setup_op.budget,
+        cap_op->tcb_setup_op.period,
+        0, 0, seL4_SchedContext_NoFlag);
+    if (error != seL4_NoError) return false;
+
+    error = seL4_TCB_SetSchedParams(tcb, seL4_CapInitThreadTCB,
+                                    cap_op->tcb_setup_op.max_priority,
+                                    cap_op->tcb_setup_op.priority,
+                                    sched_context, seL4_CapNull);
+    if (error != seL4_NoError) return false;
+#else
+    error = seL4_TCB_Configure(
+        tcb,
+        0,
+        first_empty_slot + cap_op->tcb_setup_op.cspace,
+        0,
+        first_empty_slot + cap_op->tcb_setup_op.vspace,
+        0,
+        cap_op->tcb_setup_op.ipc_buffer_addr,
+        first_empty_slot + cap_op->tcb_setup_op.ipc_buffer);
     if (error != seL4_NoError) return false;
 
+#if CONFIG_MAX_NUM_NODES > 1
+    // New threads start on the boot core, so only threads placed on another core need to be moved
+    if (cap_op->tcb_setup_op.affinity != 0) {
+        error = seL4_TCB_SetAffinity(tcb, cap_op->tcb_setup_op.affinity);
+        if (error != seL4_NoError) return false;
+    }
+#endif
+
+    // A new TCB already has a priority and MCP of 0, so only set them if the config asked for something else
+    if (cap_op->tcb_setup_op.priority != 0 || cap_op->tcb_setup_op.max_priority != 0) {
+        error = seL4_TCB_SetSchedParams(tcb, seL4_CapInitThreadTCB,
+                                        cap_op->tcb_setup_op.max_priority,
+                                        cap_op->tcb_setup_op.priority);
+        if (error != seL4_NoError) return false;
+    }
+#endif
+
+    // Every register the thread cares about is set below, so there is no need to read the current ones first
+    seL4_UserContext regs = {0};
     sel4utils_arch_init_local_context(  (sel4utils_thread_entry_fn)cap_op->tcb_setup_op.entry_addr,
                                         (void*)cap_op->tcb_setup_op.arg0,
                                         (void*)cap_op->tcb_setup_op.arg1,
@@ -288,7 +434,8 @@ bool doTCBSetupOp(CapOperation* cap_op) {
     // so we need to manually set it again
     sel4utils_set_stack_pointer(&regs, cap_op->tcb_setup_op.stack_pointer_addr);
 
-    error = seL4_TCB_WriteRegisters(first_empty_slot + cap_op->tcb_setup_op.tcb, 0, 0, sizeof(regs)/sizeof(seL4_Word), &regs);
+    // Resume the thread as part of writing its registers
+    error = seL4_TCB_WriteRegisters(tcb, 1, 0, sizeof(regs)/sizeof(seL4_Word), &regs);
     if (error != seL4_NoError) return false;
 
     return true;
@@ -297,84 +444,158 @@ bool doTCBSetupOp(CapOperation* cap_op) {
 bool doMapFrameOp(CapOperation* cap_op) {
     seL4_Error error = wrapperPageMap(  first_empty_slot + cap_op->map_frame_op.frame,
                                         first_empty_slot + cap_op->map_frame_op.vspace,
-                                        cap_op->map_frame_op.vaddr);
+                                        cap_op->map_frame_op.vaddr,
+                                        seL4_ReadWrite);
     return (error == seL4_NoError);
 }
 
+// Returns the device untyped that contains the whole physical range, or nullptr if there is none
+UntypedInfo* getDeviceUntypedForRange(seL4_Word paddr, seL4_Word length) {
+    for (seL4_Word untyped_index = 0; untyped_index < num_device_untypeds; untyped_index++) {
+        UntypedInfo* untyped = &device_untyped_array[untyped_index];
+        if (paddr >= untyped->paddr && paddr + length <= untyped->paddr + BIT(untyped->original_size_bits)) {
+            return untyped;
+        }
+    }
+    return nullptr;
+}
+
+bool doDeviceMapOp(CapOperation* cap_op) {
+    seL4_Error error;
+    seL4_Word num_frames = cap_op->device_map_op.num_frames;
+    seL4_Word length = num_frames << seL4_PageBits;
+
+    UntypedInfo* untyped = getDeviceUntypedForRange(cap_op->device_map_op.paddr, length);
+    if (untyped == nullptr) return false;
+
+    // Objects are always retyped at the untyped's watermark, so the watermark first has to be moved up to the offset of the
+    // requested paddr. This is done by retyping filler untypeds, each as big as the alignment of the watermark allows.
+    // The generator sorts device mappings by paddr, so the watermark never needs to go backwards
+    seL4_Word untyped_size = BIT(untyped->original_size_bits);
+    seL4_Word watermark = untyped_size - untyped->bytes_left;
+    seL4_Word target = cap_op->device_map_op.paddr - untyped->paddr;
+    if (target < watermark) return false;
+
+    while (watermark < target) {
+        seL4_Word filler_bits = (watermark == 0) ? untyped->original_size_bits : __builtin_ctzl(watermark);
+        while (watermark + BIT(filler_bits) > target) filler_bits--;
+
+        seL4_CPtr filler_slot;
+        if (!allocScratchSlot(&filler_slot)) return false;
+        error = seL4_Untyped_Retype(untyped->cptr, seL4_UntypedObject, filler_bits, seL4_CapInitThreadCNode, 0, 0, filler_slot, 1);
+        if (error != seL4_NoError) return false;
+        watermark += BIT(filler_bits);
+    }
+
+    // The frames are now at the watermark, and their slots were assigned consecutively by the generator
+    for (seL4_Word frames_done = 0; frames_done < num_frames; frames_done += RETYPE_FAN_OUT_LIMIT) {
+        seL4_Word batch = num_frames - frames_done;
+        if (batch > RETYPE_FAN_OUT_LIMIT) batch = RETYPE_FAN_OUT_LIMIT;
+        error = seL4_Untyped_Retype(untyped->cptr, cap_op->device_map_op.cap_type, 0, seL4_CapInitThreadCNode, 0, 0,
+                                    first_empty_slot + cap_op->device_map_op.first_frame + frames_done, batch);
+        if (error != seL4_NoError) return false;
+    }
+    untyped->bytes_left = untyped_size - (watermark + length);
+
+    for (seL4_Word i = 0; i < num_frames; i++) {
+        error = wrapperDevicePageMap(   first_empty_slot + cap_op->device_map_op.first_frame + i,
+                                        first_empty_slot + cap_op->device_map_op.vspace,
+                                        cap_op->device_map_op.vaddr + (i << seL4_PageBits),
+                                        cap_op->device_map_op.cached);
+        if (error != seL4_NoError) return false;
+    }
+
+    return true;
+}
+
+// Size of the leftover block at offset in the untyped: the biggest block that is aligned to its own size, which is as big
+// as the alignment of offset allows, since the untyped itself ends on a boundary of its size
+seL4_Word getLeftoverBlockBits(const UntypedInfo* untyped, seL4_Word offset) {
+    if (offset == 0) return untyped->original_size_bits;
+    return __builtin_ctzl(offset);
+}
+
 bool doRetypeLeftoverGPUntypedsOp(CapOperation* cap_op) {
-    // In every untyped, there will be some amount of memory left over, say 13 bytes to make it simple.
+    // In every untyped, there will be some amount of memory left over between the watermark and the end of the untyped.
     // We need to break the leftover memory into smaller untypeds (if we passed every untypeds as-is to the user process, it could
     // just revoke all the memory and destroy every object tailspring created).
-    // How many/what sizes of untypeds do we need to create for each untyped? Well 13=0b1101, so an 1, 4, and 8 byte untyped.
-    // To generalize it, we scan each bit from least-to-most significant for every untyped, and if the bit at position n is set,
-    // we retype it into a new untyped of size 2^n.
-
-    // How many blocks (new untypeds) could be created from leftover memory?
-    size_t total_blocks = 0;
-    for (int i = 0; i < num_gp_untypeds; i++) {
-        total_blocks += __builtin_popcountll(gp_untyped_array[i].bytes_left);
-    }
+    // The kernel always retypes at the watermark, rounded up to the size of the new object, so the leftover memory is cut into
+    // blocks that are aligned to their own size, going up from the watermark. Each block is as big as its alignment allows, so
+    // the blocks get bigger towards the end of the untyped, e.g. leftover memory from offset 0x30 to 0x100 is cut into blocks of
+    // 0x10, 0x40 and 0x80 bytes. These can't be merged any further.
 
     seL4_Word start_slot = cap_op->retype_leftover_gp_untypeds_op.start_slot;
     seL4_Word end_slot = cap_op->retype_leftover_gp_untypeds_op.end_slot;
-    size_t num_slots = end_slot - start_slot;
+    seL4_Word num_slots = end_slot - start_slot;
 
     // Limit the number of slots to how many untypeds we can keep track of
     if (num_slots > TAILSPRING_MEM_NUM_ENTRIES) {
         num_slots = TAILSPRING_MEM_NUM_ENTRIES;
     }
 
-    // We iterate from smallest to biggest, but we want to sort the memory so we pass the biggest untyped first. Also, there might not be
-    // enough space in the dest cnode to store all the untypeds, so we need to skip a bit before starting to retype
-    seL4_Word skip, dest_slot;
+    // How many blocks of each size could be created from leftover memory? Each untyped has at most one of each size
+    seL4_Word num_blocks[seL4_WordBits] = {};
+    for (seL4_Word i = 0; i < num_gp_untypeds; i++) {
+        UntypedInfo* untyped = &gp_untyped_array[i];
+        for (seL4_Word offset = getUntypedWatermark(untyped); offset < BIT(untyped->original_size_bits);
+             offset += BIT(getLeftoverBlockBits(untyped, offset))) {
+            num_blocks[getLeftoverBlockBits(untyped, offset)]++;
+        }
+    }
 
-    if (total_blocks > num_slots) {
-        // More potential blocks than we have space for
-        skip = total_blocks - num_slots;
-        dest_slot = start_slot + num_slots - 1; // Start at end
-    } else {
-        // Enough space for all the blocks
-        skip = 0;
-        dest_slot = start_slot + total_blocks - 1;
-    }
-
-    // Iterate over every bit position
-    for (int bit_pos = 0; bit_pos < seL4_WordBits; bit_pos++) {
-        seL4_Word bit_mask = 1llu << bit_pos;
-        // Iterate over every general purpose untyped
-        for (int i = 0; i < num_gp_untypeds; i++) {
-            seL4_Word bytes_left = gp_untyped_array[i].bytes_left;
-            // Check if a block of size (1 << bit_pos) should be retyped from this block
-            if (bytes_left & bit_mask) {
-                // At this point, we should attempt a retype
-                // If there are more potential blocks than we have space for, we need to skip a few
-                if (skip > 0) {
-                    skip--;
-                    continue;
-                }
-
-                // Keep track of each untyped, making sure to go in reverse order
-                // dest_slot - start_slot tells us the "index" of the untyped being processed
-                TailspringMemoryEntry* entry = &gp_memory_info.entries[dest_slot - start_slot];
-                entry->size_bits = bit_pos;
-                entry->paddr = 0; // Don't care about paddr for GP memory
-                gp_memory_info.num_entries++;
-
-                // Now we can start retyping
-                seL4_Error error = seL4_Untyped_Retype( gp_untyped_array[i].cptr,
-                                                        seL4_UntypedObject,
-                                                        bit_pos, // Size bits
-                                                        seL4_CapInitThreadCNode,
-                                                        first_empty_slot + cap_op->retype_leftover_gp_untypeds_op.cnode_dest,
-                                                        cap_op->retype_leftover_gp_untypeds_op.cnode_depth,
-                                                        dest_slot,
-                                                        1);
-                if (error != seL4_NoError) return false;
-                dest_slot--;
+    // The biggest blocks are passed first. If there are more blocks than slots, the smallest blocks are left out, so as little
+    // memory as possible is discarded. next_index[n] is the entry (and slot) that the next block of size 2^n goes in, and
+    // num_passed[n] is how many blocks of size 2^n there is space for
+    seL4_Word next_index[seL4_WordBits];
+    seL4_Word num_passed[seL4_WordBits];
+    seL4_Word num_entries = 0;
+    for (int bit_pos = seL4_WordBits - 1; bit_pos >= 0; bit_pos--) {
+        next_index[bit_pos] = num_entries;
+        // Blocks smaller than the smallest untyped can't be retyped
+        num_passed[bit_pos] = (bit_pos < seL4_MinUntypedBits) ? 0 : num_blocks[bit_pos];
+        if (num_passed[bit_pos] > num_slots - num_entries) num_passed[bit_pos] = num_slots - num_entries;
+        num_entries += num_passed[bit_pos];
+    }
+    gp_memory_info.num_entries = num_entries;
+
+    // The blocks of each untyped are retyped in address order, since the watermark only goes up. Blocks that are left out are
+    // simply skipped: they are all smaller than the next block that is retyped, so rounding the watermark up to that block's
+    // size skips exactly them
+    seL4_Word bytes_passed = 0;
+    seL4_Word bytes_discarded = 0;
+    for (seL4_Word i = 0; i < num_gp_untypeds; i++) {
+        UntypedInfo* untyped = &gp_untyped_array[i];
+        for (seL4_Word offset = getUntypedWatermark(untyped); offset < BIT(untyped->original_size_bits);
+             offset += BIT(getLeftoverBlockBits(untyped, offset))) {
+            seL4_Word bit_pos = getLeftoverBlockBits(untyped, offset);
+            if (num_passed[bit_pos] == 0) {
+                bytes_discarded += BIT(bit_pos);
+                continue;
             }
+            num_passed[bit_pos]--;
+
+            seL4_Word index = next_index[bit_pos]++;
+            TailspringMemoryEntry* entry = &gp_memory_info.entries[index];
+            entry->size_bits = bit_pos;
+            entry->paddr = untyped->paddr + offset;
+
+            seL4_Error error = seL4_Untyped_Retype( untyped->cptr,
+                                                    seL4_UntypedObject,
+                                                    bit_pos, // Size bits
+                                                    seL4_CapInitThreadCNode,
+                                                    first_empty_slot + cap_op->retype_leftover_gp_untypeds_op.cnode_dest,
+                                                    cap_op->retype_leftover_gp_untypeds_op.cnode_depth,
+                                                    start_slot + index,
+                                                    1);
+            if (error != seL4_NoError) return false;
+            bytes_passed += BIT(bit_pos);
         }
+        untyped->bytes_left = 0;
     }
 
+    gp_memory_info.bytes_discarded = bytes_discarded;
+    printf("Passed %lu bytes of general-purpose memory in %lu untypeds, discarded %lu bytes\n", bytes_passed, num_entries, bytes_discarded);
+
     return true;
 }
 
@@ -407,94 +628,210 @@ bool doMoveDeviceUntypedsOp(CapOperation* cap_op) {
     return true;
 }
 
-bool doPassGPMemoryInfoOp(CapOperation* cap_op) {
+// Maps the frame into our vspace, copies the data into it, then unmaps it again
+bool fillFrame(seL4_CPtr frame, const void* data, size_t size) {
     seL4_Error error;
-    seL4_CPtr dest_frame = first_empty_slot + cap_op->pass_gp_memory_info_op.frame;
 
-    // Take the frame that will hold the GP memory info and map it into our vspace so we can write to it
-    error = wrapperPageMap( dest_frame,
+    error = wrapperPageMap( frame,
                             seL4_CapInitThreadVSpace,
-                            (seL4_Word)FREE_PAGE);
+                            (seL4_Word)FREE_PAGE,
+                            seL4_ReadWrite);
     if (error != seL4_NoError) return false;
 
-    // Then copy the GP memory info into the frame
-    memcpy(FREE_PAGE, &gp_memory_info, sizeof(gp_memory_info));
-
-
-    // Unmap the frame and map it in the destination vspace
-    error = wrapperPageUnmap(dest_frame);
-    if (error != seL4_NoError) return false;
+    memcpy(FREE_PAGE, data, size);
 
-    error = wrapperPageMap( dest_frame,
-                            first_empty_slot + cap_op->pass_gp_memory_info_op.dest_vspace,
-                            cap_op->pass_gp_memory_info_op.dest_vaddr);
+    error = wrapperPageUnmap(frame);
     if (error != seL4_NoError) return false;
 
     return true;
 }
 
+bool doPassGPMemoryInfoOp(CapOperation* cap_op) {
+    return fillFrame(first_empty_slot + cap_op->pass_gp_memory_info_op.frame, &gp_memory_info, sizeof(gp_memory_info));
+}
+
 bool doPassDeviceMemoryInfoOp(CapOperation* cap_op) {
+    return fillFrame(first_empty_slot + cap_op->pass_device_memory_info_op.frame, &device_memory_info, sizeof(device_memory_info));
+}
+
+bool doPassSystemInfoOp(CapOperation* cap_op) {
+    // The kernel only passes framebuffer info if the bootloader set up a framebuffer
+    bool pass_framebuffer_info = cap_op->pass_system_info_op.pass_framebuffer_info && framebuffer_info != nullptr;
+
+    TailspringSystemInfo system_info = {};
+    system_info.framebuffer_info_present = pass_framebuffer_info;
+
+    if (pass_framebuffer_info) {
+        system_info.framebuffer_info = *framebuffer_info;
+    }
+
+    return fillFrame(first_empty_slot + cap_op->pass_system_info_op.frame, &system_info, sizeof(system_info));
+}
+
+bool doMakeASIDPoolOp(CapOperation* cap_op) {
+    seL4_Error error = wrapperMakeASIDPool(first_empty_slot + cap_op->make_asid_pool_op.untyped,
+                                           first_empty_slot + cap_op->make_asid_pool_op.dest);
+    return (error == seL4_NoError);
+}
+
+bool doBinaryChunkCopyOp(CapOperation* cap_op) {
     seL4_Error error;
-    seL4_CPtr dest_frame = first_empty_slot + cap_op->pass_device_memory_info_op.frame;
+    const char* chunk_start = (const char*)cap_op->binary_chunk_copy_op.src_vaddr;
 
-    // Take the frame that will hold the device memory info and map it into our vspace so we can write to it
-    error = wrapperPageMap( dest_frame,
-                            seL4_CapInitThreadVSpace,
-                            (seL4_Word)FREE_PAGE);
-    if (error != seL4_NoError) return false;
+    for (seL4_Word i = 0; i < (cap_op->binary_chunk_copy_op.length >> seL4_PageBits); i++) {
+        seL4_CPtr frame = first_empty_slot + cap_op->binary_chunk_copy_op.first_frame + i;
+        seL4_Word frame_dest_vaddr = cap_op->binary_chunk_copy_op.dest_vaddr + (i << seL4_PageBits);
 
-    // Then copy the device memory info into the frame
-    memcpy(FREE_PAGE, &device_memory_info, sizeof(device_memory_info));
+        if (!fillFrame(frame, chunk_start + (i << seL4_PageBits), BIT(seL4_PageBits))) return false;
 
+        error = wrapperPageMap( frame,
+                                first_empty_slot + cap_op->binary_chunk_copy_op.dest_vspace,
+                                frame_dest_vaddr,
+                                cap_op->binary_chunk_copy_op.writable ? seL4_ReadWrite : seL4_CanRead);
+        if (error != seL4_NoError) return false;
+    }
+    return true;
+}
 
-    // Unmap the frame and map it in the destination vspace
-    error = wrapperPageUnmap(dest_frame);
-    if (error != seL4_NoError) return false;
+seL4_Word getPageColor(seL4_Word paddr, seL4_Word num_colors) {
+    return (paddr >> seL4_PageBits) & (num_colors - 1);
+}
 
-    error = wrapperPageMap( dest_frame,
-                            first_empty_slot + cap_op->pass_device_memory_info_op.dest_vspace,
-                            cap_op->pass_device_memory_info_op.dest_vaddr);
-    if (error != seL4_NoError) return false;
+// Retypes untypeds over [offset, offset + length) of the untyped, so that the next object goes after them.
+// offset must be page aligned, and the watermark no further than a page below it
+bool skipUntypedRange(UntypedInfo* untyped, seL4_Word offset, seL4_Word length, seL4_Word* num_blocks_out) {
+    seL4_Word num_blocks = 0;
+    while (length > 0) {
+        // The biggest block that is aligned to its own size and fits
+        seL4_Word size_bits = 63 - __builtin_clzl(length);
+        if (offset != 0 && (seL4_Word)__builtin_ctzl(offset) < size_bits) size_bits = __builtin_ctzl(offset);
+
+        if (num_blocks == MAX_COLOR_SKIP_BLOCKS) return false;
+        if (num_blocks == num_color_skip_slots) {
+            if (!allocScratchSlot(&color_skip_slots[num_color_skip_slots])) return false;
+            num_color_skip_slots++;
+        }
 
+        seL4_Error error = seL4_Untyped_Retype(untyped->cptr, seL4_UntypedObject, size_bits, seL4_CapInitThreadCNode, 0, 0,
+                                               color_skip_slots[num_blocks], 1);
+        if (error != seL4_NoError) return false;
+        num_blocks++;
+        offset += BIT(size_bits);
+        length -= BIT(size_bits);
+    }
+    *num_blocks_out = num_blocks;
     return true;
 }
 
-bool doPassSystemInfoOp(CapOperation* cap_op) {
-    seL4_Error error;
-    seL4_CPtr dest_frame = first_empty_slot + cap_op->pass_system_info_op.frame;
-    
-    bool pass_framebuffer_info = cap_op->pass_system_info_op.pass_framebuffer_info;
+// Walks through the general-purpose untypeds in order, skipping over pages of the wrong colors. Skipped memory isn't
+// reused, so vspaces with fewer colors waste more of it
+bool doColoredFramesCreateOp(CapOperation* cap_op) {
+    ColoredFramesCreateOperation* op = &cap_op->colored_frames_create_op;
+    seL4_Word untyped_index = 0;
+
+    for (seL4_Word i = 0; i < op->num_frames; i++) {
+        while (true) {
+            if (untyped_index == num_gp_untypeds) return false;
+            UntypedInfo* untyped = &gp_untyped_array[untyped_index];
+
+            seL4_Word offset = getAlignedOffset(untyped, BIT(seL4_PageBits));
+            if (offset == ~0llu) {
+                untyped_index++;
+                continue;
+            }
 
-    // Take the frame that will hold the system info and map it into our vspace so we can write to it
-    error = wrapperPageMap( dest_frame,
-                            seL4_CapInitThreadVSpace,
-                            (seL4_Word)FREE_PAGE);
-    if (error != seL4_NoError) return false;
+            // Every color comes around within num_colors pages
+            seL4_Word skip = 0;
+            while (!(op->color_mask & BIT(getPageColor(untyped->paddr + offset + skip, op->num_colors)))) {
+                skip += BIT(seL4_PageBits);
+            }
+            if (offset + skip + BIT(seL4_PageBits) > BIT(untyped->original_size_bits)) {
+                untyped_index++;
+                continue;
+            }
 
-    // Then copy any requested system info into the page
-    TailspringSystemInfo* system_info_dest = (TailspringSystemInfo*)FREE_PAGE;
-    
-    system_info_dest->framebuffer_info_present = pass_framebuffer_info;
-    
-    if (pass_framebuffer_info) {
-        system_info_dest->framebuffer_info = *framebuffer_info;
+            seL4_Word num_blocks = 0;
+            if (!skipUntypedRange(untyped, offset, skip, &num_blocks)) return false;
+
+            seL4_Error error = seL4_Untyped_Retype(untyped->cptr, op->frame_type, seL4_PageBits, seL4_CapInitThreadCNode, 0, 0,
+                                                   first_empty_slot + op->first_frame + i, 1);
+            if (error != seL4_NoError) return false;
+            untyped->bytes_left = BIT(untyped->original_size_bits) - (offset + skip + BIT(seL4_PageBits));
+            color_skipped_bytes += skip;
+
+            // The frame keeps the untyped from being reset, so the blocks can go now and their slots be reused
+            for (seL4_Word block = 0; block < num_blocks; block++) {
+                error = seL4_CNode_Delete(seL4_CapInitThreadCNode, color_skip_slots[block], seL4_WordBits);
+                if (error != seL4_NoError) return false;
+            }
+            break;
+        }
     }
 
-    // Unmap the frame and map it in the destination vspace
-    error = wrapperPageUnmap(dest_frame);
-    if (error != seL4_NoError) return false;
+    printf("Created %u frames of color mask %lx, skipped %lu bytes of other colors so far\n",
+           op->num_frames, op->color_mask, color_skipped_bytes);
+    return true;
+}
 
-    error = wrapperPageMap( dest_frame,
-                            first_empty_slot + cap_op->pass_system_info_op.dest_vspace,
-                            cap_op->pass_system_info_op.dest_vaddr);
-    if (error != seL4_NoError) return false;
+// Moves the frames in [first_frame, first_frame + num_frames) of the root cnode into the op's slots, after the num_reclaimed
+// that are there already, or only counts them if move is false. Frames that don't fit are counted as left behind
+bool reclaimFrames(const ReclaimLoaderMemoryOperation* op, seL4_CPtr first_frame, seL4_Word num_frames, bool move,
+                   seL4_Word* num_reclaimed, seL4_Word* num_left_behind) {
+    for (seL4_Word i = 0; i < num_frames; i++) {
+        seL4_Word dest_slot = op->start_slot + *num_reclaimed;
+        if (dest_slot == op->end_slot) {
+            *num_left_behind += num_frames - i;
+            return true;
+        }
 
+        if (move) {
+            seL4_Error error = seL4_CNode_Move(first_empty_slot + op->cnode_dest, dest_slot, op->cnode_depth,
+                                               seL4_CapInitThreadCNode, first_frame + i, seL4_WordBits);
+            if (error != seL4_NoError) return false;
+        }
+        (*num_reclaimed)++;
+    }
     return true;
 }
 
-bool doTCBStartOp(CapOperation* cap_op) {
-    seL4_Error error = seL4_TCB_Resume(first_empty_slot + cap_op->tcb_start_op.tcb);
-    return (error == seL4_NoError);
+// Goes over every frame the loader no longer needs once the threads are started, always in the same order, so that the
+// number recorded before the threads start matches the frames moved at the end
+bool reclaimLoaderFrames(const ReclaimLoaderMemoryOperation* op, bool move, seL4_Word* num_reclaimed, seL4_Word* num_left_behind) {
+    // Chunks of colored vspaces were copied out of their image frames. Every other chunk's frames now belong to a vspace
+    for (seL4_Word op_index = 0; op_index < NUM_OPERATIONS; op_index++) {
+        if (cap_operations[op_index].op_type != BINARY_CHUNK_COPY_OP) continue;
+        const BinaryChunkCopyOperation* copy_op = &cap_operations[op_index].binary_chunk_copy_op;
+        seL4_CPtr first_frame = getFrameForAddr(copy_op->src_vaddr);
+        if (!reclaimFrames(op, first_frame, copy_op->length >> seL4_PageBits, move, num_reclaimed, num_left_behind)) return false;
+    }
+
+    // The loader's code, data, stack and operations
+    seL4_CPtr first_loader_frame = getFrameForAddr(SYM_VAL(_startup_threads_data_end));
+    seL4_Word num_loader_frames = boot_info->userImageFrames.end - first_loader_frame;
+    if (!reclaimFrames(op, first_loader_frame, num_loader_frames, move, num_reclaimed, num_left_behind)) return false;
+
+    if (!reclaimFrames(op, seL4_CapBootInfoFrame, 1, move, num_reclaimed, num_left_behind)) return false;
+    seL4_Word num_extra_frames = boot_info->extraBIPages.end - boot_info->extraBIPages.start;
+    return reclaimFrames(op, boot_info->extraBIPages.start, num_extra_frames, move, num_reclaimed, num_left_behind);
+}
+
+// Runs before the info ops, so that the general-purpose memory info already says where the frames will end up
+bool doRecordReclaimedFramesOp(CapOperation* cap_op) {
+    seL4_Word num_left_behind = 0;
+    gp_memory_info.reclaimed_frames_start = cap_op->record_reclaimed_frames_op.start_slot;
+    gp_memory_info.num_reclaimed_frames = 0;
+    return reclaimLoaderFrames(&cap_op->record_reclaimed_frames_op, false, &gp_memory_info.num_reclaimed_frames, &num_left_behind);
+}
+
+// Runs after the last thread is started, right before the loader suspends itself. Moving a frame cap doesn't unmap the
+// frame, so the loader keeps running on its own pages until then
+bool doReclaimLoaderMemoryOp(CapOperation* cap_op) {
+    seL4_Word num_reclaimed = 0;
+    seL4_Word num_left_behind = 0;
+    if (!reclaimLoaderFrames(&cap_op->reclaim_loader_memory_op, true, &num_reclaimed, &num_left_behind)) return false;
+
+    printf("Reclaimed %lu frames of loader memory, left %lu behind for lack of slots\n", num_reclaimed, num_left_behind);
+    return true;
 }
 
 bool dispatchOperation(CapOperation* cap_op) {
@@ -513,10 +850,14 @@ bool dispatchOperation(CapOperation* cap_op) {
             return doMapOp(cap_op);
         case BINARY_CHUNK_LOAD_OP:
             return doBinaryChunkLoadOp(cap_op);
+        case BINARY_CHUNK_SHARE_OP:
+            return doBinaryChunkShareOp(cap_op);
         case TCB_SETUP_OP:
             return doTCBSetupOp(cap_op);
         case MAP_FRAME_OP:
             return doMapFrameOp(cap_op);
+        case DEVICE_MAP_OP:
+            return doDeviceMapOp(cap_op);
         case RETYPE_LEFTOVER_GP_UNTYPEDS_OP:
             return doRetypeLeftoverGPUntypedsOp(cap_op);
         case MOVE_DEVICE_UNTYPEDS_OP:
@@ -527,8 +868,16 @@ bool dispatchOperation(CapOperation* cap_op) {
             return doPassDeviceMemoryInfoOp(cap_op);
         case PASS_SYSTEM_INFO_OP:
             return doPassSystemInfoOp(cap_op);
-        case TCB_START_OP:
-            return doTCBStartOp(cap_op);
+        case MAKE_ASID_POOL_OP:
+            return doMakeASIDPoolOp(cap_op);
+        case BINARY_CHUNK_COPY_OP:
+            return doBinaryChunkCopyOp(cap_op);
+        case COLORED_FRAMES_CREATE_OP:
+            return doColoredFramesCreateOp(cap_op);
+        case RECORD_RECLAIMED_FRAMES_OP:
+            return doRecordReclaimedFramesOp(cap_op);
+        case RECLAIM_LOADER_MEMORY_OP:
+            return doReclaimLoaderMemoryOp(cap_op);
         default:
             halt();
     }
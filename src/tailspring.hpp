@@ -18,6 +18,13 @@ extern "C" {
 #define SYM_VAL(sym) ((seL4_Word)(&sym))
 #define NUM_OPERATIONS (sizeof(cap_operations) / sizeof(cap_operations[0]))
 
+// Maximum number of objects a single seL4_Untyped_Retype call can create
+#ifdef CONFIG_RETYPE_FAN_OUT_LIMIT
+#define RETYPE_FAN_OUT_LIMIT CONFIG_RETYPE_FAN_OUT_LIMIT
+#else
+#define RETYPE_FAN_OUT_LIMIT 256
+#endif
+
 // Each platform has its own platform-specific functions to map in pages and page structures.
 // The specific mapping functions are chosen in the python script and wrappers are generated for the
 // mapping functions, then placed in an array of function pointers, that way the correct function can
@@ -25,22 +32,30 @@ extern "C" {
 struct CapOperation;
 typedef seL4_Error (*MapFuncType)(CapOperation* cap_op, seL4_Word first_empty_slot);
 
-enum CapOperationType { CREATE_OP, MINT_OP, COPY_OP, MOVE_OP, MUTATE_OP, MAP_OP, BINARY_CHUNK_LOAD_OP, TCB_SETUP_OP,
-                        MAP_FRAME_OP, RETYPE_LEFTOVER_GP_UNTYPEDS_OP, MOVE_DEVICE_UNTYPEDS_OP,
-                        PASS_GP_MEMORY_INFO_OP, PASS_DEVICE_MEMORY_INFO_OP, PASS_SYSTEM_INFO_OP, TCB_START_OP};
+enum CapOperationType { CREATE_OP, MINT_OP, COPY_OP, MOVE_OP, MUTATE_OP, MAP_OP, BINARY_CHUNK_LOAD_OP, BINARY_CHUNK_SHARE_OP,
+                        TCB_SETUP_OP, MAP_FRAME_OP, DEVICE_MAP_OP, RETYPE_LEFTOVER_GP_UNTYPEDS_OP, MOVE_DEVICE_UNTYPEDS_OP,
+                        PASS_GP_MEMORY_INFO_OP, PASS_DEVICE_MEMORY_INFO_OP, PASS_SYSTEM_INFO_OP, MAKE_ASID_POOL_OP,
+                        BINARY_CHUNK_COPY_OP, COLORED_FRAMES_CREATE_OP, RECORD_RECLAIMED_FRAMES_OP,
+                        RECLAIM_LOADER_MEMORY_OP};
 
+// Caps that only ever live in one of the created cnodes are created or minted straight into it. If dest_depth is 0, dest is
+// a slot in the loader's cnode, otherwise it is an index into the cnode in slot dest_root, which has that depth
 struct CapCreateOperation {
     seL4_Word cap_type;
     seL4_Word bytes_required;
     uint32_t dest;
+    uint32_t dest_root;
     uint8_t size_bits;
+    uint8_t dest_depth;
 };
 
 struct CapMintOperation {
     seL4_Word badge;
     uint32_t src;
     uint32_t dest;
+    uint32_t dest_root;
     uint8_t rights;
+    uint8_t dest_depth;
 };
 
 struct CapCopyOperation {
@@ -70,13 +85,37 @@ struct MapOperation {
     uint32_t vspace;
 };
 
+// Moves the loader's image frames holding a chunk into a vspace. Chunks that aren't writable are mapped read-only
 struct BinaryChunkLoadOperation {
     seL4_Word src_vaddr;
     seL4_Word dest_vaddr;
     seL4_Word length;
     uint32_t dest_vspace;
+    bool writable;
+};
+
+// Maps read-only copies of the frames of a chunk that was already loaded into another vspace, for read-only
+// segments that are the same in several vspaces. The copies go in consecutive slots starting at first_frame
+struct BinaryChunkShareOperation {
+    seL4_Word src_vaddr;
+    seL4_Word dest_vaddr;
+    seL4_Word length;
+    uint32_t first_frame;
+    uint32_t dest_vspace;
 };
 
+// Copies a chunk into frames that were created beforehand, in consecutive slots starting at first_frame, and maps them.
+// Used when the frames need to come from particular memory, which the loader's own image frames might not
+struct BinaryChunkCopyOperation {
+    seL4_Word src_vaddr;
+    seL4_Word dest_vaddr;
+    seL4_Word length;
+    uint32_t first_frame;
+    uint32_t dest_vspace;
+    bool writable;
+};
+
+// Configures a TCB and starts it. Starting is done in the same WriteRegisters call that sets up the entry point and stack
 struct TCBSetupOperation {
     seL4_Word entry_addr;
     seL4_Word stack_pointer_addr;
@@ -84,10 +123,16 @@ struct TCBSetupOperation {
     seL4_Word arg0;
     seL4_Word arg1;
     seL4_Word arg2;
+    seL4_Word budget; // Only used on MCS kernels, in microseconds
+    seL4_Word period; // Only used on MCS kernels, in microseconds
     uint32_t cspace;
     uint32_t vspace;
     uint32_t ipc_buffer;
     uint32_t tcb;
+    uint32_t affinity;
+    uint32_t sched_context; // Only used on MCS kernels
+    uint8_t priority;
+    uint8_t max_priority;
 };
 
 struct MapFrameOperation {
@@ -96,6 +141,18 @@ struct MapFrameOperation {
     uint32_t vspace;
 };
 
+// Retypes frames covering a range of physical addresses out of the device untyped that contains them,
+// then maps them into the target vspace
+struct DeviceMapOperation {
+    seL4_Word cap_type;
+    seL4_Word paddr;
+    seL4_Word vaddr;
+    seL4_Word num_frames;
+    uint32_t first_frame;
+    uint32_t vspace;
+    bool cached;
+};
+
 // This operation takes all the system-provided untypeds, breaks the leftover memory in each untyped (memory not reserved by tailspring)
 // into separate, smaller untypeds, and puts these in the designated cnode
 struct RetypeLeftoverGPUntypedsOperation {
@@ -113,29 +170,48 @@ struct MoveDeviceUntypedsOperation {
     uint8_t cnode_depth;
 };
 
-// Fills a frame with info about how the general-purpose memory was broken into smaller untypeds and placed in the designated cnode,
-// then maps the frame into the target vspace at a given address
+// Moves the frames the loader no longer needs (its own code and data, image frames of chunks that were copied, and the boot
+// info frames) into the designated cnode. They are still mapped into the loader's vspace, so whoever gets them has to unmap
+// them first. The same struct is used by the record op, which only writes where they will go into the general-purpose
+// memory info, since that has to be passed on before the threads start and the moves can only happen after
+struct ReclaimLoaderMemoryOperation {
+    uint32_t cnode_dest;
+    uint32_t start_slot;
+    uint32_t end_slot;
+    uint8_t cnode_depth;
+};
+
+// The info frames are created once for the whole system. These ops only fill them in, read-only copies are
+// minted and mapped into each vspace that needs them by the regular mint/map frame ops
+
+// Fills a frame with info about how the general-purpose memory was broken into smaller untypeds and placed in the designated cnode
 struct PassGPMemoryInfoOperation {
-    seL4_Word dest_vaddr;
     uint32_t frame;
-    uint32_t dest_vspace;
 };
 
 struct PassDeviceMemoryInfoOperation {
-    seL4_Word dest_vaddr;
     uint32_t frame;
-    uint32_t dest_vspace;
 };
 
 struct PassSystemInfoOperation {
-    seL4_Word dest_vaddr;
     uint32_t frame;
-    uint32_t dest_vspace;
     bool pass_framebuffer_info;
 };
 
-struct TCBStartOperation {
-    uint32_t tcb;
+// Turns an untyped that is exactly the size of an ASID pool into one, for vspaces that don't fit in the root task's pool
+struct MakeASIDPoolOperation {
+    uint32_t untyped;
+    uint32_t dest;
+};
+
+// Creates frames in consecutive slots out of memory of the given cache colors only. The color of a frame is its physical
+// page number modulo num_colors, and bit i of color_mask is set if color i may be used
+struct ColoredFramesCreateOperation {
+    seL4_Word frame_type;
+    seL4_Word color_mask;
+    uint32_t first_frame;
+    uint32_t num_frames;
+    uint32_t num_colors;
 };
 
 struct CapOperation {
@@ -148,17 +224,27 @@ struct CapOperation {
         CapMutateOperation mutate_op;
         MapOperation map_op;
         BinaryChunkLoadOperation binary_chunk_load_op;
+        BinaryChunkShareOperation binary_chunk_share_op;
         TCBSetupOperation tcb_setup_op;
         MapFrameOperation map_frame_op;
+        DeviceMapOperation device_map_op;
         RetypeLeftoverGPUntypedsOperation retype_leftover_gp_untypeds_op;
         MoveDeviceUntypedsOperation move_device_untypeds_op;
         PassGPMemoryInfoOperation pass_gp_memory_info_op;
         PassDeviceMemoryInfoOperation pass_device_memory_info_op;
         PassSystemInfoOperation pass_system_info_op;
-        TCBStartOperation tcb_start_op;
+        MakeASIDPoolOperation make_asid_pool_op;
+        BinaryChunkCopyOperation binary_chunk_copy_op;
+        ColoredFramesCreateOperation colored_frames_create_op;
+        ReclaimLoaderMemoryOperation record_reclaimed_frames_op;
+        ReclaimLoaderMemoryOperation reclaim_loader_memory_op;
     };
 };
 
+// Defined in the generated config. The host build's mock kernel reads the operations back to check what they created
+extern CapOperation cap_operations[];
+extern const seL4_Word num_operations;
+
 struct UntypedInfo {
     seL4_Word paddr;
     seL4_Word bytes_left;
@@ -170,11 +256,27 @@ struct UntypedInfo {
 // of this thread's memory, so the first frame in userImageFrames should be mapped here
 extern void* _lowest_vaddr;
 
+// End of the startup thread data, rounded up to a page. Every page from here to the end of the image is the loader's own
+extern void* _startup_threads_data_end;
+
 #define ENABLE_X86_ASIDPOOL_ASSIGN \
 seL4_Error wrapper_X86_ASIDPool_Assign(CapOperation* cap_op, seL4_Word first_empty_slot) { \
     return seL4_X86_ASIDPool_Assign( \
         seL4_CapInitThreadASIDPool, \
         first_empty_slot + cap_op->map_op.service); \
+} \
+seL4_Error wrapper_X86_ASIDPool_AssignToCreatedPool(CapOperation* cap_op, seL4_Word first_empty_slot) { \
+    return seL4_X86_ASIDPool_Assign( \
+        first_empty_slot + cap_op->map_op.service, \
+        first_empty_slot + cap_op->map_op.vspace); \
+} \
+seL4_Error wrapperMakeASIDPool(seL4_CPtr untyped, seL4_Word dest) { \
+    return seL4_X86_ASIDControl_MakePool( \
+        seL4_CapASIDControl, \
+        untyped, \
+        seL4_CapInitThreadCNode, \
+        dest, \
+        seL4_WordBits); \
 }
 
 #define ENABLE_X86_PDPT_MAP \
@@ -205,14 +307,22 @@ seL4_Error wrapper_X86_PageTable_Map(CapOperation* cap_op, seL4_Word first_empty
 }
 
 #define ENABLE_X86_PAGE_MAP \
-seL4_Error wrapperPageMap(seL4_CPtr frame, seL4_CPtr vspace, seL4_Word vaddr) { \
+seL4_Error wrapperPageMap(seL4_CPtr frame, seL4_CPtr vspace, seL4_Word vaddr, seL4_CapRights_t rights) { \
     return seL4_X86_Page_Map( \
         frame, \
         vspace, \
         vaddr, \
-        seL4_ReadWrite, \
+        rights, \
         seL4_X86_Default_VMAttributes); \
 } \
 seL4_Error wrapperPageUnmap(seL4_CPtr frame) { \
     return seL4_X86_Page_Unmap(frame); \
+} \
+seL4_Error wrapperDevicePageMap(seL4_CPtr frame, seL4_CPtr vspace, seL4_Word vaddr, bool cached) { \
+    return seL4_X86_Page_Map( \
+        frame, \
+        vspace, \
+        vaddr, \
+        seL4_ReadWrite, \
+        cached ? seL4_X86_Default_VMAttributes : seL4_X86_CacheDisabled); \
 }